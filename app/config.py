@@ -7,15 +7,94 @@ class Settings(BaseSettings):
     database_password: str
     database_name: str
     database_username: str
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800     #seconds, recycle before server/proxy idle timeouts
+    db_pool_pre_ping: bool = True
+    warmup_enabled: bool = True
+    warmup_connections: int = 4             #opened in each pool before a worker serves
+    warmup_floor_plans: int = 8             #most recently edited floor plans whose caches are built at startup
+    warmup_timeout_seconds: float = 10      #start serving after this even if warmup has not finished
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
     email: str
     smtp_password: str
+    smtp_host: str = "smtp.gmail.com"
+    smtp_port: int = 587
+    smtp_starttls: bool = True
+    smtp_username: Optional[str] = None     #defaults to EMAIL
+    smtp_idle_seconds: float = 60
+    email_sender_enabled: bool = True       #drain the outbox from a thread in each API worker
+    email_batch_size: int = 50
+    email_poll_seconds: float = 5
+    email_max_attempts: int = 5
+    email_retry_base_seconds: int = 30
+    email_retry_max_seconds: int = 3600
+
+    otp_backend: str = "database"          #database / memory (a single worker process: codes live in its memory only)
+    otp_ttl_seconds: int = 600
+    otp_max_attempts: int = 5              #guesses per email until its code expires, resends included
+    otp_digits: int = 8
+    otp_sweep_interval_seconds: float = 300
+    otp_sweep_batch_size: int = 1000
 
     initial_admin_email: Optional[str] = None
     initial_admin_password: Optional[str] = None
 
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536     #KiB
+    argon2_parallelism: int = 4
+    hash_pool_size: int = 4
+    hash_queue_limit: int = 64          #waiting hash/verify calls beyond the busy threads before answering 503
+
+    principal_cache_ttl_seconds: float = 60
+    principal_cache_max_entries: int = 10000
+    trust_token_role: bool = False      #read-only endpoints resolve the caller from token claims alone
+
+    booking_index_enabled: bool = False     #in-process interval index for conflict checks and availability
+    booking_index_max_overlays: int = 5000
+    booking_index_horizon_hours: int = 24
+
+    max_upload_bytes: int = 100 * 1024 * 1024
+    storage_backend: str = "local"      #local / s3
+    local_storage_root: Optional[str] = None
+    s3_bucket: Optional[str] = None
+    s3_endpoint_url: Optional[str] = None     #e.g. http://localhost:9000 for MinIO
+    s3_region: Optional[str] = None
+    s3_access_key_id: Optional[str] = None
+    s3_secret_access_key: Optional[str] = None
+    s3_part_size: int = 8 * 1024 * 1024
+    s3_presign_expiry_seconds: int = 900
+
+    tiles_max_image_pixels: int = 500_000_000
+    tiles_png_compress_level: int = 1     #encoding dominates pyramid time, level 1 is ~2.5x faster than 6
+
+    job_pool_size: int = 2
+    job_timeout_seconds: int = 600
+    pdf_raster_dpi: int = 150
+    drawing_scale: int = 100     #assumed 1:N drawing scale when suggesting pixels_per_meter from scan DPI
+
+    version_checkpoint_interval: int = 20
+    version_cache_size: int = 64
+
+    spatial_index_max_floors: int = 64     #per-worker grid indexes kept for hit-testing / viewport queries
+
+    overlay_snapshot_cache_bytes: int = 256 * 1024 * 1024     #serialized full-floor overlay lists kept per worker
+    overlay_snapshot_dir: Optional[str] = None                 #also keep them as files, shared by a host's workers
+
+    collab_listen: bool = True        #LISTEN for edits committed by other workers
+    collab_queue_size: int = 256      #pending messages per WebSocket before the client is told to resync
+
+    analytics_timezone: str = "UTC"     #site time zone for business hours and peak-hour buckets
+    heatmap_max_size: int = 2048        #longer side of a rendered heatmap, bigger plans render at 1/2, 1/4, ...; also the cap on ?max_size
+    heatmap_cache_bytes: int = 64 * 1024 * 1024     #rendered heatmap PNGs kept per worker
+
+    metrics_enabled: bool = True     #request / SQL instrumentation and the Prometheus /metrics endpoint
+    slow_query_ms: float = 250       #statements at least this slow are logged with their SQL
+    server_timing_enabled: bool = False     #Server-Timing header (handler and database time, statements) on every response
+
     class Config:
         env_file = ".env"
 
@@ -1,19 +1,104 @@
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from .config import settings
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+POOL_OPTIONS = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
+class PoolStats:
+    #wait for a pooled connection at checkout, plus the pool's own gauges
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.wait_total += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+
+    def snapshot(self):
+        pool = self.pool
+        return {
+            "pool_size": pool.size() if pool is not None else 0,
+            "checked_out": pool.checkedout() if pool is not None else 0,
+            "overflow": pool.overflow() if pool is not None else 0,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+def timed_pool(pool_class, stats: PoolStats):
+    #times every checkout's wait for a pooled connection (where pool_timeout applies), lazy session
+    #checkouts included; the pool's own events only fire once a connection has been handed out
+    class TimedPool(pool_class):
+        def __init__(self, *args, **kwargs):
+            #also on engine.dispose(), which replaces the pool
+            super().__init__(*args, **kwargs)
+            stats.pool = self
+
+        def _do_get(self):
+            t0 = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except exc.TimeoutError:
+                stats.timeouts += 1
+                raise
+            stats.record(time.perf_counter() - t0)
+            return conn
+    return TimedPool
+
+sync_pool_stats = PoolStats("sync")
+async_pool_stats = PoolStats("async")
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=timed_pool(QueuePool, sync_pool_stats), **POOL_OPTIONS)
+
+#a forked worker starts with an empty pool, never sharing its parent's sockets (close=False leaves them to the parent)
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
 
 sessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 def get_db():
+    #the connection is checked out on the first query, routes answered from caches never take one
     db = sessionLocal()
     try:
         yield db
     finally:
-        db.close    
\ No newline at end of file
+        db.close()
+
+#the async engine is created on first use, so processes that never need it (job workers, the mail sender) do not import asyncpg
+async_engine = None
+async_sessionLocal = None
+
+def get_async_engine():
+    global async_engine, async_sessionLocal
+    if async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=timed_pool(AsyncAdaptedQueuePool, async_pool_stats), **POOL_OPTIONS)
+        async_sessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return async_engine
+
+async def get_async_db():
+    get_async_engine()
+    async with async_sessionLocal() as db:
+        yield db
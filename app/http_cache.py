@@ -0,0 +1,24 @@
+from fastapi import Request, Response, status
+
+#content-addressed resources (uploads, tiles) never change under the same URL + ETag
+IMMUTABLE = "public, max-age=31536000, immutable"
+#versioned resources (a floor plan, its overlays, a room's bookings): a proxy may store them but must
+#revalidate every time, which costs the origin one version lookup and a 304
+REVALIDATE = "public, no-cache"
+
+def version_etag(*parts) -> str:
+    #weak: equal tags mean the same data, not byte-identical JSON
+    return 'W/"' + "-".join(str(p) for p in parts) + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    #compare opaque tags, weak or strong, as RFC 9110 asks for If-None-Match
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": cache_control})
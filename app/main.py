@@ -1,11 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .database import get_db, engine
-from . import tablesmodel, utils
+from . import metrics, warmup
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
-from .routers import auth, admin, floorplans, bookings, overlays
-
-app = FastAPI()
+from .routers import auth, admin, analytics, floorplans, bookings, overlays, realtime
+from .services import collab, jobs, mailer, otp_store
+
+#importing the app has no side effects: the schema and the initial admin are set up once per deploy by
+#python -m app.manage (migrate, create-admin), so workers boot without the database and a forking
+#server can import it once for all of them (gunicorn --preload)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mailer.start()
+    otp_store.start()
+    #like the warmup, a step that fails (the database is unreachable) is logged and the worker starts anyway;
+    #queued jobs are then resumed by the next worker to start
+    results = await asyncio.gather(asyncio.to_thread(jobs.start), collab.start(), warmup.run(), return_exceptions=True)
+    for name, result in zip(("resuming jobs", "collaboration", "warmup"), results):
+        if isinstance(result, Exception):
+            print(f"[startup] {name} failed: {type(result).__name__}: {result}")
+    yield
+    otp_store.shutdown()
+    mailer.shutdown()
+    jobs.shutdown()
+    await collab.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 #origins = ["www.youtube.com", "www.google.com"]
 origins=["*"]
@@ -18,31 +39,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-tablesmodel.Base.metadata.create_all(bind = engine)
-
-def create_initial_admin():
-    admin_email = settings.initial_admin_email
-    admin_password = settings.initial_admin_password
-    if admin_email and admin_password:
-        db = next(get_db())
-        try:
-            existing = db.query(tablesmodel.User).filter(tablesmodel.User.email == admin_email).first()
-            if not existing:
-                hashed = utils.hash(admin_password)
-                admin_user = tablesmodel.User(email=admin_email, password=hashed, role="admin", is_verified=True)
-                db.add(admin_user)
-                db.commit()
-                print(f"[startup] Created initial admin: {admin_email}")
-        finally:
-            db.close()
-
-create_initial_admin()
+if settings.metrics_enabled:
+    metrics.install(app)
 
 app.include_router(auth.router)
 app.include_router(admin.router)
 app.include_router(floorplans.router)
 app.include_router(bookings.router)
 app.include_router(overlays.router)
+app.include_router(realtime.router)
+app.include_router(analytics.router)
 
 @app.get("/")
 def root():
@@ -0,0 +1,88 @@
+import argparse
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from . import tablesmodel, utils
+from .config import settings
+from .database import engine, sessionLocal
+
+#One-off management commands for deploys and development, so API workers start without touching the
+#schema (see app/main.py):
+#  python -m app.manage migrate [revision] [--sql]     apply the migrations in app/migrations (default: head)
+#  python -m app.manage create-admin [--email --password]     the INITIAL_ADMIN_* admin, if missing
+#  python -m app.manage revision -m "add x" [--empty]  new migration, autogenerated against tablesmodel
+#Migrations of concurrent deploys queue up on a Postgres advisory lock.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+BASELINE = "5f1c2a9d0e3b"     #the original schema, as create_all built it in the releases before migrations
+MIGRATION_LOCK = 716_300_001   #pg_advisory_lock key
+
+def alembic_config(connection=None) -> Config:
+    cfg = Config()
+    cfg.set_main_option("script_location", MIGRATIONS_DIR)
+    cfg.set_main_option("file_template", "%%(year)d%%(month).2d%%(day).2d_%%(rev)s_%%(slug)s")
+    cfg.attributes["connection"] = connection
+    return cfg
+
+def migrate(revision: str = "head", sql: bool = False):
+    if sql:
+        command.upgrade(alembic_config(), revision, sql=True)
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK})
+        conn.commit()
+        try:
+            cfg = alembic_config(conn)
+            tables = inspect(conn).get_table_names()
+            conn.commit()
+            if "alembic_version" not in tables and "users" in tables:
+                #created by create_all at import in earlier releases: that is the baseline schema, everything
+                #after it (new columns and tables, the rollup backfill) is applied by the upgrade below
+                command.stamp(cfg, BASELINE)
+                conn.commit()
+                print(f"[migrate] existing schema stamped as baseline {BASELINE}")
+            #no transaction open here: alembic runs each migration in its own (or none, see autocommit_block)
+            command.upgrade(cfg, revision)
+            conn.commit()
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK})
+            conn.commit()
+    print(f"[migrate] database at {revision}")
+
+def create_admin(email: str, password: str):
+    with sessionLocal() as db:
+        existing = db.query(tablesmodel.User).filter(tablesmodel.User.email == email).first()
+        if existing:
+            print(f"[create-admin] {email} already exists (role {existing.role})")
+            return
+        db.add(tablesmodel.User(email=email, password=utils.hash(password), role="admin", is_verified=True))
+        db.commit()
+        print(f"[create-admin] created admin {email}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("migrate", help="apply schema migrations")
+    p.add_argument("revision", nargs="?", default="head")
+    p.add_argument("--sql", action="store_true", help="print the SQL instead of running it")
+    p = sub.add_parser("create-admin", help="create the initial admin user if missing")
+    p.add_argument("--email", default=settings.initial_admin_email)
+    p.add_argument("--password", default=settings.initial_admin_password)
+    p = sub.add_parser("revision", help="create a new migration")
+    p.add_argument("-m", "--message", required=True)
+    p.add_argument("--empty", action="store_true", help="do not autogenerate from the models")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "migrate":
+        migrate(args.revision, args.sql)
+    elif args.cmd == "create-admin":
+        if not args.email or not args.password:
+            parser.error("--email and --password (or INITIAL_ADMIN_EMAIL / INITIAL_ADMIN_PASSWORD) are required")
+        create_admin(args.email, args.password)
+    elif args.cmd == "revision":
+        command.revision(alembic_config(), message=args.message, autogenerate=not args.empty)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from . import database
+
+#Request and database instrumentation of this worker, served in the Prometheus text format on
+#/metrics. A pure ASGI middleware times every HTTP request into a histogram per (method, route
+#template, status); SQLAlchemy cursor events count the statements and database time of the request
+#that issued them (found through a context variable, which Starlette's threadpool and run_sync carry
+#over) and log statements slower than SLOW_QUERY_MS (logger "app.sql"). SERVER_TIMING_ENABLED adds a
+#Server-Timing header with the request's time and statements. Everything lives in plain dicts updated on
+#the event loop, or under one lock for statements, so the cost per request is a few microseconds.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED = "<unmatched>"     #404s are not split by path, that would be one series per probed URL
+WORKER = str(os.getpid())
+log = logging.getLogger("app.sql")
+
+def _forked():
+    #workers forked from a preloading parent (gunicorn --preload) get their own series
+    global WORKER
+    WORKER = str(os.getpid())
+
+os.register_at_fork(after_in_child=_forked)
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope=None):
+        self.scope = scope     #None outside a request (benchmarks set one around the code they measure)
+        self.queries = 0
+        self.db_seconds = 0.0
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+class Registry:
+    def __init__(self):
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_seconds: Dict[Tuple[str, str], float] = {}
+        self.in_progress = 0
+        self._lock = threading.Lock()
+        self.statements = {"request": 0, "background": 0}
+        self.statement_seconds = {"request": 0.0, "background": 0.0}
+        self.slow_statements = 0
+        self.slow_log = deque(maxlen=50)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        #called on the event loop only
+        key = (method, route, str(status))
+        h = self.latency.get(key)
+        if h is None:
+            h = self.latency[key] = Histogram(LATENCY_BUCKETS)
+        h.observe(seconds)
+        q = self.queries.get(key[:2])
+        if q is None:
+            q = self.queries[key[:2]] = Histogram(QUERY_BUCKETS)
+        q.observe(stats.queries)
+        self.db_seconds[key[:2]] = self.db_seconds.get(key[:2], 0.0) + stats.db_seconds
+
+    def observe_statement(self, seconds: float, stats: Optional[RequestStats], statement: str):
+        #called from whichever thread ran the statement
+        scope = "request" if stats is not None else "background"
+        with self._lock:
+            self.statements[scope] += 1
+            self.statement_seconds[scope] += seconds
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        if seconds * 1000 >= settings.slow_query_ms:
+            self.slow_statement(seconds, stats, statement)
+
+    def slow_statement(self, seconds: float, stats: Optional[RequestStats], statement: str):
+        where = "background"
+        if stats is not None and stats.scope is not None:
+            where = f"{stats.scope['method']} {route_template(stats.scope)}"
+        statement = re.sub(r"\s+", " ", statement).strip()[:2000]
+        with self._lock:
+            self.slow_statements += 1
+            self.slow_log.append({"at": time.time(), "ms": round(seconds * 1000, 1), "where": where, "statement": statement})
+        #parameters are left out on purpose, they carry user data
+        log.warning("slow query %.1fms in %s: %s", seconds * 1000, where, statement)
+
+registry = Registry()
+
+def route_template(scope) -> str:
+    #set by FastAPI once the request is routed
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status_code = 500     #what the client gets if the app raises before starting the response
+        started = time.perf_counter()
+        registry.in_progress += 1
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.server_timing_enabled:
+                    #off by default, it tells any client how long the database took; the handler is done by now:
+                    #its own time and its statements, for browser dev tools and load tests
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", b'app;dur=%.2f, db;dur=%.2f;desc="%d queries"' % (
+                        (time.perf_counter() - started) * 1000, stats.db_seconds * 1000, stats.queries)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            registry.in_progress -= 1
+            current_request.reset(token)
+            registry.observe_request(scope["method"], route_template(scope), status_code, time.perf_counter() - started, stats)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        registry.observe_statement(time.perf_counter() - started, current_request.get(), statement)
+
+def listen():
+    #class-level listeners: they cover database.engine and the async engine, which is created lazily
+    if not event.contains(Engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+def install(app):
+    listen()
+    app.add_middleware(MetricsMiddleware)
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _histogram(lines, name: str, series: dict, label_names):
+    for key, h in sorted(series.items()):
+        labels = dict(zip(label_names, key), worker=WORKER)
+        cumulative = 0
+        for bound, count in zip(h.bounds + ("+Inf",), h.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {h.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+
+def render(caches: Dict[str, dict]) -> str:
+    r = registry
+    lines = [
+        "# HELP http_request_duration_seconds Time from receiving a request to finishing its response.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    _histogram(lines, "http_request_duration_seconds", dict(r.latency), ("method", "route", "status"))
+    lines += ["# HELP http_request_db_queries SQL statements issued while serving a request.", "# TYPE http_request_db_queries histogram"]
+    _histogram(lines, "http_request_db_queries", dict(r.queries), ("method", "route"))
+    lines += ["# HELP http_request_db_seconds_total Database time spent serving requests.", "# TYPE http_request_db_seconds_total counter"]
+    for (method, route), seconds in sorted(r.db_seconds.items()):
+        lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route, worker=WORKER)} {seconds}")
+    lines += ["# HELP http_requests_in_progress Requests being served.", "# TYPE http_requests_in_progress gauge",
+              f"http_requests_in_progress{_labels(worker=WORKER)} {r.in_progress}"]
+
+    with r._lock:
+        statements, statement_seconds, slow = dict(r.statements), dict(r.statement_seconds), r.slow_statements
+    lines += ["# HELP db_statements_total SQL statements executed, by requests or background workers.", "# TYPE db_statements_total counter"]
+    lines += [f"db_statements_total{_labels(source=k, worker=WORKER)} {v}" for k, v in statements.items()]
+    lines += ["# HELP db_statement_seconds_total Time spent executing SQL statements.", "# TYPE db_statement_seconds_total counter"]
+    lines += [f"db_statement_seconds_total{_labels(source=k, worker=WORKER)} {v}" for k, v in statement_seconds.items()]
+    lines += ["# HELP db_slow_statements_total Statements slower than SLOW_QUERY_MS.", "# TYPE db_slow_statements_total counter",
+              f"db_slow_statements_total{_labels(worker=WORKER)} {slow}"]
+
+    pools = {"sync": database.sync_pool_stats.snapshot(), "async": database.async_pool_stats.snapshot()}
+    gauges = {"pool_size": "db_pool_size", "checked_out": "db_pool_checked_out", "overflow": "db_pool_overflow"}
+    for field, name in gauges.items():
+        lines += [f"# TYPE {name} gauge"] + [f"{name}{_labels(pool=p, worker=WORKER)} {s[field]}" for p, s in pools.items()]
+    lines += ["# TYPE db_pool_checkouts_total counter"] + [f"db_pool_checkouts_total{_labels(pool=p, worker=WORKER)} {s['checkouts']}" for p, s in pools.items()]
+    lines += ["# TYPE db_pool_timeouts_total counter"] + [f"db_pool_timeouts_total{_labels(pool=p, worker=WORKER)} {s['timeouts']}" for p, s in pools.items()]
+    lines += ["# TYPE db_pool_checkout_wait_max_seconds gauge"] + [
+        f"db_pool_checkout_wait_max_seconds{_labels(pool=p, worker=WORKER)} {s['wait_max_ms'] / 1000}" for p, s in pools.items()]
+
+    #numeric fields of the per-worker caches (hits, misses, entries, ...) as app_cache_<field>{cache=...}
+    fields: Dict[str, list] = {}
+    for cache, stats in caches.items():
+        for field, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                fields.setdefault(field, []).append(f"app_cache_{field}{_labels(cache=cache, worker=WORKER)} {value}")
+    for field, samples in sorted(fields.items()):
+        lines += [f"# TYPE app_cache_{field} gauge"] + samples
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,38 @@
+from alembic import context
+from sqlalchemy import pool, create_engine
+
+from app import tablesmodel
+from app.database import SQLALCHEMY_DATABASE_URL
+
+#Run by the alembic commands in app/manage.py (python -m app.manage migrate / revision), which pass
+#the connection holding the migration lock in config.attributes["connection"]; the plain alembic CLI
+#gets its own connection from the DATABASE_* settings.
+
+config = context.config
+target_metadata = tablesmodel.Base.metadata
+
+def run_migrations_offline():
+    #--sql: print the DDL instead of running it
+    context.configure(url=SQLALCHEMY_DATABASE_URL, target_metadata=target_metadata, literal_binds=True, compare_type=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations(connection):
+    context.configure(connection=connection, target_metadata=target_metadata, compare_type=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+        return
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        run_migrations(connection)
+        connection.commit()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,34 @@
+"""occupancy hour_no and covering index
+
+Revision ID: 19064a9febd7
+Revises: 43d2c67b8291
+Create Date: 2026-10-18 11:33:59.065041
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '19064a9febd7'
+down_revision: Union[str, Sequence[str], None] = '43d2c67b8291'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    #a stored column rewrites the table once, booking writes wait for it
+    op.add_column('occupancy_hourly', sa.Column('hour_no', sa.Integer(), sa.Computed("(date_part('epoch', hour) / 3600)::int", persisted=True), nullable=True))
+    #concurrently: booking writes keep updating the rollups while the index is built
+    with op.get_context().autocommit_block():
+        op.create_index('ix_occupancy_hourly_covering', 'occupancy_hourly', ['overlay_id', 'hour'], unique=False, postgresql_concurrently=True,
+                        postgresql_include=['hour_no', 'booked_seconds', 'participant_seconds', 'bookings', 'over_capacity', 'under_half'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_occupancy_hourly_covering', table_name='occupancy_hourly')
+    op.drop_column('occupancy_hourly', 'hour_no')
@@ -0,0 +1,49 @@
+"""otp expiry and attempts
+
+Revision ID: 43d2c67b8291
+Revises: a7e3c91f4b26
+Create Date: 2026-10-18 11:11:31.234595
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '43d2c67b8291'
+down_revision: Union[str, Sequence[str], None] = 'a7e3c91f4b26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    #existing codes never expire, are stored in clear and may repeat per email: drop them, users request a new one
+    op.execute("DELETE FROM otps")
+    op.add_column('otps', sa.Column('otp_hash', sa.String(length=64), nullable=False))
+    op.add_column('otps', sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('otps', sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False))
+    op.add_column('otps', sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.alter_column('otps', 'email',
+               existing_type=sa.VARCHAR(),
+               nullable=False)
+    op.create_index('ix_otps_expires_at', 'otps', ['expires_at'], unique=False)
+    op.create_unique_constraint('otps_email_key', 'otps', ['email'])
+    op.drop_column('otps', 'otp')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM otps")
+    op.add_column('otps', sa.Column('otp', sa.VARCHAR(), autoincrement=False, nullable=False))
+    op.drop_constraint('otps_email_key', 'otps', type_='unique')
+    op.drop_index('ix_otps_expires_at', table_name='otps')
+    op.alter_column('otps', 'email',
+               existing_type=sa.VARCHAR(),
+               nullable=True)
+    op.drop_column('otps', 'created_at')
+    op.drop_column('otps', 'expires_at')
+    op.drop_column('otps', 'attempts')
+    op.drop_column('otps', 'otp_hash')
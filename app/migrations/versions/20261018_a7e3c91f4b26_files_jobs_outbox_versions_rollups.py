@@ -0,0 +1,152 @@
+"""files, jobs, outbox, version patches, booking indexes and rollups
+
+Revision ID: a7e3c91f4b26
+Revises: 5f1c2a9d0e3b
+Create Date: 2026-10-18 10:58:42.517903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e3c91f4b26'
+down_revision: Union[str, Sequence[str], None] = '5f1c2a9d0e3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+#app.services.analytics.REBUILD_SQL as of this revision (migrations must not follow later changes to it)
+BACKFILL_ROLLUPS = """
+INSERT INTO occupancy_hourly (overlay_id, hour, booked_seconds, participant_seconds, bookings, over_capacity, under_half)
+SELECT b.overlay_id, h.hour,
+       SUM(s.seconds),
+       SUM(s.seconds * COALESCE(b.participants, 0)),
+       COUNT(*) FILTER (WHERE h.hour = date_trunc('hour', b.start_ts)),
+       COUNT(*) FILTER (WHERE h.hour = date_trunc('hour', b.start_ts) AND b.participants > o.capacity),
+       COUNT(*) FILTER (WHERE h.hour = date_trunc('hour', b.start_ts) AND b.participants > 0 AND b.participants * 2 <= o.capacity)
+FROM bookings b
+JOIN overlays o ON o.id = b.overlay_id
+CROSS JOIN LATERAL generate_series(date_trunc('hour', b.start_ts), b.end_ts - interval '1 microsecond', interval '1 hour') AS h(hour)
+CROSS JOIN LATERAL (SELECT FLOOR(EXTRACT(EPOCH FROM LEAST(b.end_ts, h.hour + interval '1 hour') - GREATEST(b.start_ts, h.hour)))::int AS seconds) s
+WHERE b.status IS DISTINCT FROM 'cancelled' AND b.end_ts > b.start_ts
+GROUP BY b.overlay_id, h.hour
+"""
+
+FLAG_BOOKINGS = """
+UPDATE bookings b
+SET over_capacity = COALESCE(b.participants > o.capacity, false),
+    under_half = COALESCE(b.participants > 0 AND b.participants * 2 <= o.capacity, false)
+FROM overlays o
+WHERE o.id = b.overlay_id AND (b.participants > o.capacity OR (b.participants > 0 AND b.participants * 2 <= o.capacity))
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    #existing floor plans were uploaded before processing existed: they stay 'ready', without tiles or a content hash
+    op.add_column('floor_plans', sa.Column('file_sha256', sa.String(length=64), nullable=True))
+    op.add_column('floor_plans', sa.Column('file_size', sa.BigInteger(), nullable=True))
+    op.add_column('floor_plans', sa.Column('image_width', sa.Integer(), nullable=True))
+    op.add_column('floor_plans', sa.Column('image_height', sa.Integer(), nullable=True))
+    op.add_column('floor_plans', sa.Column('tile_max_zoom', sa.Integer(), nullable=True))
+    op.add_column('floor_plans', sa.Column('processing_status', sa.String(), server_default=sa.text("'ready'"), nullable=False))
+    op.add_column('floor_plans', sa.Column('suggested_pixels_per_meter', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_floor_plans_file_sha256'), 'floor_plans', ['file_sha256'], unique=False)
+    op.create_index('ix_floor_plans_created', 'floor_plans', ['created_at', 'id'], unique=False)
+    op.create_index('ix_floor_plans_building_floor', 'floor_plans', ['building', 'floor_number', 'created_at', 'id'], unique=False)
+
+    #every stored version so far is a full snapshot
+    op.add_column('floorplan_versions', sa.Column('is_checkpoint', sa.Boolean(), server_default=sa.text('true'), nullable=False))
+
+    #epoch 0 for every room, the booking index loads them on first use
+    op.add_column('overlays', sa.Column('booking_epoch', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.create_index('ix_overlays_floor_plan_id', 'overlays', ['floor_plan_id', 'id'], unique=False)
+    op.create_index('ix_overlays_floor_plan_type', 'overlays', ['floor_plan_id', 'type', 'id'], unique=False)
+
+    op.create_index('ix_bookings_overlay_time', 'bookings', ['overlay_id', 'start_ts', 'end_ts'], unique=False)
+    #over/under capacity as the backfill below counts them (current capacities), cancels subtract these
+    op.add_column('bookings', sa.Column('over_capacity', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.add_column('bookings', sa.Column('under_half', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.execute(FLAG_BOOKINGS)
+
+    op.create_table('processing_jobs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('floor_plan_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('step', sa.String(), nullable=True),
+    sa.Column('progress', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('started_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['floor_plan_id'], ['floor_plans.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_processing_jobs_floor_plan_id'), 'processing_jobs', ['floor_plan_id'], unique=False)
+    op.create_index(op.f('ix_processing_jobs_id'), 'processing_jobs', ['id'], unique=False)
+    op.create_index('ix_processing_jobs_status', 'processing_jobs', ['status'], unique=False)
+
+    op.create_table('email_outbox',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('recipient', sa.String(), nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('html', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('next_attempt_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('sent_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_outbox_due', 'email_outbox', ['status', 'next_attempt_at'], unique=False)
+    op.create_index(op.f('ix_email_outbox_id'), 'email_outbox', ['id'], unique=False)
+
+    op.create_table('occupancy_hourly',
+    sa.Column('overlay_id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.DateTime(), nullable=False),
+    sa.Column('booked_seconds', sa.Integer(), nullable=False),
+    sa.Column('participant_seconds', sa.BigInteger(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('over_capacity', sa.Integer(), nullable=False),
+    sa.Column('under_half', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['overlay_id'], ['overlays.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('overlay_id', 'hour')
+    )
+    #the bookings made so far; from here on every booking write keeps the rollups current
+    op.execute(BACKFILL_ROLLUPS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('occupancy_hourly')
+    op.drop_index(op.f('ix_email_outbox_id'), table_name='email_outbox')
+    op.drop_index('ix_email_outbox_due', table_name='email_outbox')
+    op.drop_table('email_outbox')
+    op.drop_index('ix_processing_jobs_status', table_name='processing_jobs')
+    op.drop_index(op.f('ix_processing_jobs_id'), table_name='processing_jobs')
+    op.drop_index(op.f('ix_processing_jobs_floor_plan_id'), table_name='processing_jobs')
+    op.drop_table('processing_jobs')
+    op.drop_index('ix_bookings_overlay_time', table_name='bookings')
+    op.drop_column('bookings', 'under_half')
+    op.drop_column('bookings', 'over_capacity')
+    op.drop_index('ix_overlays_floor_plan_type', table_name='overlays')
+    op.drop_index('ix_overlays_floor_plan_id', table_name='overlays')
+    op.drop_column('overlays', 'booking_epoch')
+    op.drop_column('floorplan_versions', 'is_checkpoint')
+    op.drop_index('ix_floor_plans_building_floor', table_name='floor_plans')
+    op.drop_index('ix_floor_plans_created', table_name='floor_plans')
+    op.drop_index(op.f('ix_floor_plans_file_sha256'), table_name='floor_plans')
+    op.drop_column('floor_plans', 'suggested_pixels_per_meter')
+    op.drop_column('floor_plans', 'processing_status')
+    op.drop_column('floor_plans', 'tile_max_zoom')
+    op.drop_column('floor_plans', 'image_height')
+    op.drop_column('floor_plans', 'image_width')
+    op.drop_column('floor_plans', 'file_size')
+    op.drop_column('floor_plans', 'file_sha256')
@@ -0,0 +1,35 @@
+"""email outbox expiry
+
+Revision ID: aebe25a15d17
+Revises: 19064a9febd7
+Create Date: 2026-10-18 16:02:47.381520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'aebe25a15d17'
+down_revision: Union[str, Sequence[str], None] = '19064a9febd7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('email_outbox', sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.create_index('ix_email_outbox_expiring', 'email_outbox', ['expires_at'], unique=False, postgresql_where=sa.text('html IS NOT NULL'))
+    #bodies of messages given up on were kept so far, reset codes among them
+    op.execute("UPDATE email_outbox SET html = NULL WHERE status = 'failed'")
+    #reset mails still queued expire with their code (the default OTP_TTL_SECONDS), the sweeper purges them
+    op.execute("UPDATE email_outbox SET expires_at = created_at + interval '600 seconds' "
+               "WHERE status = 'pending' AND subject = 'ReflectionSync - Your OTP for Password Reset'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_email_outbox_expiring', table_name='email_outbox', postgresql_where=sa.text('html IS NOT NULL'))
+    op.drop_column('email_outbox', 'expires_at')
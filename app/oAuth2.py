@@ -1,11 +1,13 @@
 # app/oAuth2.py
 from jose import JWTError, jwt
 from datetime import datetime,timedelta
+from typing import Optional
 from . import schemas,database, tablesmodel
 from fastapi import Depends,HTTPException,status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from .config import settings
+from .services import principal_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
 
@@ -43,7 +45,7 @@ def verify_access_token(token: str, credentials_exception):
     
     return token_data
 
-def get_current_user(token: str = Depends(oauth2_scheme),db: Session = Depends(database.get_db)):
+def resolve_user(token: str, db: Optional[Session] = None):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",headers={"WWW-Authenticate": "Bearer"})
     
@@ -53,11 +55,44 @@ def get_current_user(token: str = Depends(oauth2_scheme),db: Session = Depends(d
     except Exception:
         raise credentials_exception
 
-    user = db.query(tablesmodel.User).filter(tablesmodel.User.id == user_id).first()
-    if not user:
-        raise credentials_exception
+    #resolved users are cached per worker (TTL bound), see services/principal_cache; only a miss
+    #reads the database, through db or else a session of its own that is closed right after
+    user = principal_cache.cache.get(user_id)
+    if user is None:
+        if db is None:
+            with database.sessionLocal() as own:
+                db_user = own.query(tablesmodel.User).filter(tablesmodel.User.id == user_id).first()
+        else:
+            db_user = db.query(tablesmodel.User).filter(tablesmodel.User.id == user_id).first()
+        if not db_user:
+            raise credentials_exception
+        user = principal_cache.Principal.from_user(db_user)
+        principal_cache.cache.put(user)
+
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account deactivated")
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    #no session dependency: async routes would otherwise hold a sync connection next to their async one
+    return resolve_user(token)
+
+def get_token_principal(token: str = Depends(oauth2_scheme)):
+    #for read-only endpoints: with trust_token_role the caller is built from the signed claims without
+    #touching the database (deactivation/role changes then apply when the token expires)
+    if not settings.trust_token_role:
+        return resolve_user(token)
+
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",headers={"WWW-Authenticate": "Bearer"})
+    token_data = verify_access_token(token, credentials_exception)
+    try:
+        user_id = int(token_data.id)
+    except Exception:
+        raise credentials_exception
+    principal_cache.cache.token_hits += 1
+    return principal_cache.Principal(user_id, None, token_data.role or "user")
+
 def require_admin(current_user: tablesmodel.User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
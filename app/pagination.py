@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+#Keyset (cursor) pagination: a page is "the next `limit` rows after the last sort key the client saw",
+#so the database seeks to it through an index instead of walking and discarding `offset` rows.
+#Cursors are opaque to clients: urlsafe base64 of the last row's sort key.
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for t, v in zip(types, values))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def after(columns, values, descending: bool = False):
+    #row comparison, e.g. (created_at, id) < (:c, :i), matches a composite index in one range scan
+    key = tuple_(*columns)
+    return key < tuple_(*values) if descending else key > tuple_(*values)
+
+def page(rows, limit, key) -> dict:
+    #queries fetch limit + 1 rows, the extra one only tells whether there is a next page
+    rows = list(rows)
+    if limit is None or len(rows) <= limit:
+        return {"items": rows, "next_cursor": None}
+    rows = rows[:limit]
+    return {"items": rows, "next_cursor": encode_cursor(*key(rows[-1]))}
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, status, HTTPException, Depends
+from fastapi import APIRouter, status, HTTPException, Depends, Response
 from ..database import get_db
 from sqlalchemy.orm import Session
 
-from .. import schemas, tablesmodel, oAuth2
+from .. import schemas, tablesmodel, oAuth2, database, metrics
+from ..config import settings
+from ..services import booking_index, collab, heatmap, overlay_snapshots, principal_cache, spatial
 
 router = APIRouter(tags=['Admin'])
 
@@ -22,4 +24,59 @@ def promote_user_to_admin(email: str, db: Session = Depends(get_db), admin_user:
     
     user.role = "admin"
     db.commit()
-    return {"message": f"{email} promoted to admin"}
\ No newline at end of file
+    principal_cache.cache.invalidate(user.id)
+    return {"message": f"{email} promoted to admin"}
+
+#Used by Admin to deactivate a user, their tokens stop working right away on this worker
+#http://127.0.0.1:8000/admin/deactivate?email=user@gmail.com
+@router.post("/admin/deactivate")
+def deactivate_user(email: str, db: Session = Depends(get_db), admin_user: tablesmodel.User = Depends(oAuth2.require_admin)):
+    user = db.query(tablesmodel.User).filter(tablesmodel.User.email == email).first()
+
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    
+    user.is_active = False
+    db.commit()
+    principal_cache.cache.invalidate(user.id)
+    return {"message": f"{email} deactivated"}
+
+def cache_stats():
+    return {
+        "principal_cache": principal_cache.cache.stats(),
+        "booking_index": booking_index.index.stats(),
+        "spatial_index": spatial.indexes.stats(),
+        "overlay_snapshots": overlay_snapshots.store.stats(),
+        "heatmaps": heatmap.cache.stats(),
+    }
+
+#Cache hit rates of this worker
+@router.get("/admin/metrics/caches")
+def cache_metrics(admin_user: tablesmodel.User = Depends(oAuth2.require_admin)):
+    return cache_stats()
+
+#Connection pool gauges and checkout waits of this worker
+@router.get("/admin/metrics/db")
+def db_metrics(admin_user: tablesmodel.User = Depends(oAuth2.require_admin)):
+    return {
+        "sync_pool": database.sync_pool_stats.snapshot(),
+        "async_pool": database.async_pool_stats.snapshot(),
+    }
+
+#Live edit channel of this worker: subscribers, events published here and received from other workers
+@router.get("/admin/metrics/collab")
+def collab_metrics(admin_user: tablesmodel.User = Depends(oAuth2.require_admin)):
+    return collab.hub.stats()
+
+#Statements slower than SLOW_QUERY_MS seen by this worker, most recent last
+@router.get("/admin/metrics/slow-queries")
+def slow_queries(admin_user: tablesmodel.User = Depends(oAuth2.require_admin)):
+    return list(metrics.registry.slow_log)
+
+#Prometheus scrape endpoint: request latency / query histograms, SQL totals, pool and cache gauges of this worker
+#async: rendered on the event loop, where the request histograms are updated
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(metrics.render(cache_stats()), media_type="text/plain; version=0.0.4; charset=utf-8")
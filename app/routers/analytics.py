@@ -0,0 +1,56 @@
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+from .. import tablesmodel, oAuth2, utils
+from ..database import get_db
+from ..services import analytics
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+#scope: any of overlay_id / floor_plan_id / building / type (none = every overlay)
+#window: start/end (default the last 30 days), day_start/day_end hours and weekdays_only in ANALYTICS_TIMEZONE
+#the reports are plain def routes: their NumPy work runs in the threadpool, not on the event loop
+def window_params(start: Optional[datetime] = Query(None), end: Optional[datetime] = Query(None), overlay_id: Optional[int] = Query(None),
+                  floor_plan_id: Optional[int] = Query(None), building: Optional[str] = Query(None), type: Optional[str] = Query(None),
+                  day_start: int = Query(0, ge=0, le=23), day_end: int = Query(24, ge=1, le=24), weekdays_only: bool = Query(False)):
+    end = utils.naive_utc(end) if end is not None else utils.naive_utc(datetime.now(timezone.utc))
+    start = utils.naive_utc(start) if start is not None else end - timedelta(days=30)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be after start")
+    if end - start > timedelta(days=731):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Window is limited to two years")
+    if day_end <= day_start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="day_end must be after day_start")
+    return analytics.Window(start, end, overlay_id=overlay_id, floor_plan_id=floor_plan_id, building=building, type=type,
+                            day_start=day_start, day_end=day_end, weekdays_only=weekdays_only)
+
+def json_response(report: dict) -> Response:
+    #a row per overlay, thousands for a building: orjson takes a fraction of jsonable_encoder's time
+    return Response(content=orjson.dumps(report), media_type="application/json")
+
+#booked share of the available hours per overlay (busiest first) and for the whole scope
+@router.get("/utilization")
+def utilization(window: analytics.Window = Depends(window_params), db: Session = Depends(get_db),
+                current_user: tablesmodel.User = Depends(oAuth2.get_token_principal)):
+    return json_response(analytics.utilization(db, window))
+
+#utilization by weekday and hour of day, and the busiest of those slots
+@router.get("/peak-hours")
+def peak_hours(window: analytics.Window = Depends(window_params), top: int = Query(10, ge=1, le=168), db: Session = Depends(get_db),
+               current_user: tablesmodel.User = Depends(oAuth2.get_token_principal)):
+    return analytics.peak_hours(db, window, top)
+
+#how often bookings exceed a room's capacity or use at most half of it
+@router.get("/capacity-fit")
+def capacity_fit(window: analytics.Window = Depends(window_params), db: Session = Depends(get_db),
+                 current_user: tablesmodel.User = Depends(oAuth2.get_token_principal)):
+    return json_response(analytics.capacity_fit(db, window))
+
+#recompute the hourly rollups from the bookings table (after imports or capacity changes)
+@router.post("/rebuild")
+def rebuild(floor_plan_id: Optional[int] = Query(None), db: Session = Depends(get_db), admin_user: tablesmodel.User = Depends(oAuth2.require_admin)):
+    rows = analytics.rebuild(db, floor_plan_id)
+    db.commit()
+    return {"rollup_rows": rows}
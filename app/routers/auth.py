@@ -1,29 +1,44 @@
-from fastapi import APIRouter, status, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, status, HTTPException, Depends
 from ..database import get_db
 from sqlalchemy.orm import Session
 
 from .. import schemas, tablesmodel, utils, oAuth2
+from ..config import settings
+from ..services import hashing, mailer, otp_store, principal_cache
 
 router = APIRouter(prefix="/auth", tags=['Authentication'])
 
+async def hash_password(password: str) -> str:
+    try:
+        return await hashing.hash(password)
+    except hashing.HashingBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many password operations, retry shortly", headers={"Retry-After": "1"})
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await hashing.verify(plain_password, hashed_password)
+    except hashing.HashingBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many password operations, retry shortly", headers={"Retry-After": "1"})
+
 """ {
     "email": "user@gmail.com",
     "password": "password"
 } """ 
 @router.post("/signup", response_model=schemas.UserOut)
-async def create_user(user:schemas.UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def create_user(user:schemas.UserCreate, db: Session = Depends(get_db)):
     
     user_found = db.query(tablesmodel.User).filter(tablesmodel.User.email==user.email).first()
 
     if user_found:
        raise HTTPException(status_code=status.HTTP_302_FOUND, detail="Email already exists")
     
-    hashed_password = utils.hash(user.password)
+    hashed_password = await hash_password(user.password)
     new_user = tablesmodel.User(email=user.email, password=hashed_password, role="user")
     db.add(new_user)
+    mailer.enqueue(db, user.email, *utils.signup_email())
     db.commit()
+    mailer.notify()
     db.refresh(new_user)
-    background_tasks.add_task(utils.send_signup_email, user.email)
     return new_user   
 
 """ {
@@ -38,48 +53,56 @@ async def login_user(user_credentials:schemas.UserLogin ,db: Session = Depends(g
     if not user:
        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid Credentials")
     
-    if not utils.verify(user_credentials.password, user.password):
+    if not await verify_password(user_credentials.password, user.password):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid Credentials")
+
+    #upgrade hashes made with older argon2 cost settings
+    if hashing.needs_rehash(user.password):
+        user.password = await hash_password(user_credentials.password)
+        db.commit()
+
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account deactivated")
     
     access_token = oAuth2.create_access_token(data={"user_id": user.id, "role": user.role})
     return {"access_token": access_token, "token_type": "Bearer"}
 
+OTP_LOCKED = "Too many attempts, request a new OTP once this one expires"
+
+def send_otp(db: Session, user: tablesmodel.User):
+    otp = otp_store.get_store().issue(db, user.email)
+    if otp is None:
+        #locked: no new code, and no mail to send
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=OTP_LOCKED)
+    mailer.enqueue(db, user.email, *utils.otp_email(otp), expires_after=settings.otp_ttl_seconds)
+    db.commit()
+    mailer.notify()
+
 #http://127.0.0.1:8000/forgot-password/user@gmail.com
 @router.post("/forgot-password/{email}")
-async def forgot_password(email: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def forgot_password(email: str, db: Session = Depends(get_db)):
     user = db.query(tablesmodel.User).filter(tablesmodel.User.email == email).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User with this email does not exist")
 
-    otp = utils.generate_otp()
-    db_otp = tablesmodel.OTP(email=email, otp=otp)
-    db.add(db_otp)
-    db.commit()
-    background_tasks.add_task(utils.send_otp_email, user.email, otp)
+    #replaces any earlier code of this email
+    send_otp(db, user)
 
     return {"message": "OTP sent successfully"}
 
 @router.post("/resend-otp/{email}")
-async def resend_otp(email: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def resend_otp(email: str, db: Session = Depends(get_db)):
     user = db.query(tablesmodel.User).filter(tablesmodel.User.email == email).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User with this email does not exist")
 
-    db.query(tablesmodel.OTP).filter(tablesmodel.OTP.email==email).delete(synchronize_session=False)
-    db.commit()
-
-    otp = utils.generate_otp()
-
-    db_otp = tablesmodel.OTP(email=email, otp=otp)
-    db.add(db_otp)
-    db.commit()
-    background_tasks.add_task(utils.send_otp_email, user.email, otp)
+    send_otp(db, user)
 
     return {"message": "OTP resend successfully"}
 
 """ {
     "email": "user@gmail.com",
-    "otp": "5294"
+    "otp": "05294817"
 } """
 @router.post("/otp-verification")
 async def reset_password(otp_data: schemas.OTP, db: Session = Depends(get_db)):
@@ -87,15 +110,15 @@ async def reset_password(otp_data: schemas.OTP, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email not found")
 
-    otp_record = db.query(tablesmodel.OTP).filter(tablesmodel.OTP.email == otp_data.email).first()
-    if not otp_record:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="OTP not found")
-    
-    if otp_data.otp != otp_record.otp:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid OTP")
-    
-    db.delete(otp_record)
+    result = otp_store.get_store().verify(db, otp_data.email, otp_data.otp)
+    #committed whatever the outcome: a wrong guess uses up an attempt
     db.commit()
+    if result == otp_store.MISSING:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="OTP not found or expired")
+    if result == otp_store.LOCKED:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=OTP_LOCKED)
+    if result == otp_store.INVALID:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid OTP")
 
     return {"message": "OTP is correct"}
 
@@ -111,8 +134,9 @@ async def reset_password(password_data: schemas.PasswordReset, db: Session = Dep
     if password_data.new_password != password_data.confirm_password:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="New password and confirm password do not match")
 
-    hashed_password = utils.hash(password_data.new_password)
+    hashed_password = await hash_password(password_data.new_password)
     user.password = hashed_password
 
     db.commit()
+    principal_cache.cache.invalidate(user.id)
     return {"message": "Password reset successfully"}
\ No newline at end of file
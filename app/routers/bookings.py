@@ -1,37 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
-from .. import schemas, tablesmodel, oAuth2
-from ..database import get_db
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+from .. import schemas, tablesmodel, oAuth2, pagination, utils, http_cache
+from ..database import get_db, get_async_db
+from ..services import analytics, availability, booking_index, booking_locks
 
 router = APIRouter(prefix="/bookings", tags=["bookings"])
 
 @router.post("", response_model=schemas.BookingOut)
 def create_booking(payload: schemas.BookingCreate, db: Session = Depends(get_db), current_user: tablesmodel.User = Depends(oAuth2.get_current_user)):
+    start_ts, end_ts = utils.naive_utc(payload.start_ts), utils.naive_utc(payload.end_ts)
+    #serialize writers of this room until commit, then read the room (and its booking epoch) under the lock
+    booking_locks.lock_overlay(db, payload.overlay_id)
     overlay = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.id == payload.overlay_id).first()
     if not overlay:
+        db.rollback()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Overlay (room) not found")
 
     #conflict check
-    overlapping = db.query(tablesmodel.Booking).filter(
-        tablesmodel.Booking.overlay_id == payload.overlay_id,
-        ~(
-            (tablesmodel.Booking.end_ts <= payload.start_ts) |
-            (tablesmodel.Booking.start_ts >= payload.end_ts)
-        )
-    ).all()
+    if booking_index.index.enabled:
+        overlapping = [
+            {"id": r[2], "start_ts": r[0], "end_ts": r[1], "organizer_id": r[3]}
+            for r in booking_index.index.conflicts(db, overlay.id, overlay.booking_epoch, start_ts, end_ts)
+        ]
+    else:
+        overlapping = [
+            {"id": b.id, "start_ts": b.start_ts, "end_ts": b.end_ts, "organizer_id": b.organizer_id}
+            for b in db.query(tablesmodel.Booking).filter(
+                tablesmodel.Booking.overlay_id == payload.overlay_id,
+                availability.overlap_filter(start_ts, end_ts)
+            ).all()
+        ]
 
     if overlapping:
         conflicts = []
         for b in overlapping:
             conflicts.append({
-                "id": b.id,
-                "start_ts": b.start_ts.isoformat() if isinstance(b.start_ts, datetime) else str(b.start_ts),
-                "end_ts": b.end_ts.isoformat() if isinstance(b.end_ts, datetime) else str(b.end_ts),
-                "organizer_id": b.organizer_id
+                "id": b["id"],
+                "start_ts": b["start_ts"].isoformat() if isinstance(b["start_ts"], datetime) else str(b["start_ts"]),
+                "end_ts": b["end_ts"].isoformat() if isinstance(b["end_ts"], datetime) else str(b["end_ts"]),
+                "organizer_id": b["organizer_id"]
             })
 
+        db.rollback()   #release the room lock before answering
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={
             "message": "booking_conflict",
             "conflicts": conflicts
@@ -41,59 +55,118 @@ def create_booking(payload: schemas.BookingCreate, db: Session = Depends(get_db)
     b = tablesmodel.Booking(
         overlay_id=payload.overlay_id,
         organizer_id=current_user.id if current_user else None,
-        start_ts=payload.start_ts,
-        end_ts=payload.end_ts,
+        start_ts=start_ts,
+        end_ts=end_ts,
         participants=payload.participants,
-        status="confirmed"
+        status="confirmed",
+        **analytics.capacity_flags(payload.participants, overlay.capacity)
     )
+    old_epoch = overlay.booking_epoch
+    overlay.booking_epoch = old_epoch + 1
     
     db.add(b)
+    analytics.record_booking(db, b)
     db.commit()
     db.refresh(b)
+    booking_index.index.record_booking(b.overlay_id, old_epoch, old_epoch + 1, b)
     return b
 
+@router.post("/{id}/cancel", response_model=schemas.BookingOut)
+def cancel_booking(id: int, db: Session = Depends(get_db), current_user: tablesmodel.User = Depends(oAuth2.get_current_user)):
+    b = db.get(tablesmodel.Booking, id)
+    if not b:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
+    if b.organizer_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the organizer or an admin can cancel a booking")
+
+    #same room lock as create_booking, then re-read both rows under it
+    booking_locks.lock_overlay(db, b.overlay_id)
+    db.refresh(b)
+    if b.status == "cancelled":
+        db.rollback()
+        return b
+    overlay = db.get(tablesmodel.Overlay, b.overlay_id, populate_existing=True)
+
+    b.status = "cancelled"
+    old_epoch = overlay.booking_epoch
+    overlay.booking_epoch = old_epoch + 1
+    analytics.record_booking(db, b, sign=-1)
+    db.commit()
+    db.refresh(b)
+    booking_index.index.remove_booking(b.overlay_id, old_epoch, old_epoch + 1, b.id)
+    return b
+
+#declared before /{id} so "available" is not captured as a booking id
+@router.get("/available")
+async def available_rooms(start: datetime = Query(...), end: datetime = Query(...), capacity: Optional[int] = Query(None), floor_plan_id: Optional[int] = Query(None),
+                    building: Optional[str] = Query(None), limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_async_db)):
+    #start/end are required query params (ISO datetime), limit/offset page through the free rooms
+    #one set-based query (rooms anti-joined against overlapping bookings) instead of a COUNT per candidate room
+    available = await db.run_sync(availability.find_available_rooms, start, end, capacity=capacity, floor_plan_id=floor_plan_id, building=building, limit=limit, offset=offset)
+    return [availability.room_to_dict(o) for o in available]
+
+def nearest_rooms(db: Session, origin_overlay_id: Optional[int], floor_plan_id: Optional[int], x: Optional[float], y: Optional[float],
+                  start: datetime, end: datetime, capacity: Optional[int], k: int):
+    if origin_overlay_id is not None:
+        origin = db.get(tablesmodel.Overlay, origin_overlay_id)
+        if not origin:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Origin overlay not found")
+        floor_plan_id, x, y = origin.floor_plan_id, origin.x + origin.width / 2, origin.y + origin.height / 2
+    elif floor_plan_id is None or x is None or y is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass origin_overlay_id, or floor_plan_id with x and y")
+
+    fp = db.get(tablesmodel.FloorPlan, floor_plan_id)
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+
+    results = []
+    for room, dist in availability.find_nearest_rooms(db, floor_plan_id, x, y, start, end, capacity=capacity, k=k):
+        #straight-line distance between centroids; meters only when the floor plan has a scale
+        results.append({**availability.room_to_dict(room), "distance_px": round(dist, 1),
+                        "distance_m": round(dist / fp.pixels_per_meter, 2) if fp.pixels_per_meter else None})
+    return {"floor_plan_id": floor_plan_id, "origin": {"x": x, "y": y}, "start": start, "end": end, "rooms": results}
+
+#k nearest free rooms on the origin's floor; the window defaults to now + `minutes`
+@router.get("/nearest")
+async def nearest_available_rooms(origin_overlay_id: Optional[int] = Query(None), floor_plan_id: Optional[int] = Query(None), x: Optional[float] = Query(None),
+                                  y: Optional[float] = Query(None), start: Optional[datetime] = Query(None), end: Optional[datetime] = Query(None),
+                                  minutes: int = Query(30, ge=1, le=1440), capacity: Optional[int] = Query(None), k: int = Query(5, ge=1, le=100),
+                                  db: AsyncSession = Depends(get_async_db)):
+    start = utils.naive_utc(start) if start is not None else utils.naive_utc(datetime.now(timezone.utc))
+    end = utils.naive_utc(end) if end is not None else start + timedelta(minutes=minutes)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be after start")
+    return await db.run_sync(nearest_rooms, origin_overlay_id, floor_plan_id, x, y, start, end, capacity, k)
+
 @router.get("/{id}", response_model=schemas.BookingOut)
-def get_booking(id: int, db: Session = Depends(get_db), current_user: tablesmodel.User = Depends(oAuth2.get_current_user)):
-    b = db.query(tablesmodel.Booking).filter(tablesmodel.Booking.id == id).first()
+async def get_booking(id: int, db: AsyncSession = Depends(get_async_db), current_user: tablesmodel.User = Depends(oAuth2.get_token_principal)):
+    b = await db.get(tablesmodel.Booking, id)
     if not b:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
     return b
 
-@router.get("/overlay/{overlay_id}", response_model=List[schemas.BookingOut])
-def list_bookings_for_overlay(overlay_id: int, db: Session = Depends(get_db)):
-    bs = db.query(tablesmodel.Booking).filter(tablesmodel.Booking.overlay_id == overlay_id).order_by(tablesmodel.Booking.start_ts).all()
-    return bs
+@router.get("/overlay/{overlay_id}", response_model=schemas.Page[schemas.BookingOut])
+async def list_bookings_for_overlay(overlay_id: int, request: Request, response: Response, start: Optional[datetime] = Query(None), end: Optional[datetime] = Query(None),
+                                    cursor: Optional[str] = Query(None), limit: int = Query(100, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    #every booking write bumps the room's booking epoch
+    epoch = await db.scalar(select(tablesmodel.Overlay.booking_epoch).where(tablesmodel.Overlay.id == overlay_id))
+    if epoch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Overlay (room) not found")
+    etag = http_cache.version_etag("bookings", overlay_id, epoch)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.REVALIDATE)
 
-@router.get("/available")
-def available_rooms(start: datetime = Query(...), end: datetime = Query(...), capacity: Optional[int] = Query(None), db: Session = Depends(get_db)):
-    #start/end are required query params (ISO datetime)
-    q = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.type == "room") #find candidate rooms (type='room')
-    
-    if capacity is not None:
-        q = q.filter(tablesmodel.Overlay.capacity >= capacity)
-    candidates = q.all()
-    available = []
-
-    for candidate in candidates:
-        overlapping = db.query(tablesmodel.Booking).filter(
-            tablesmodel.Booking.overlay_id == candidate.id,
-            ~(
-                (tablesmodel.Booking.end_ts <= start) |
-                (tablesmodel.Booking.start_ts >= end)
-            )
-        ).count()
-        if overlapping == 0:
-            available.append(candidate)
-
-    return [ {
-        "id": o.id,
-        "floor_plan_id": o.floor_plan_id,
-        "type": o.type,
-        "label": o.label,
-        "capacity": o.capacity,
-        "x": o.x,
-        "y": o.y,
-        "width": o.width,
-        "height": o.height,
-        "props": o.props
-    } for o in available ]
\ No newline at end of file
+    #start/end keep bookings overlapping that window; keyset on (start_ts, id)
+    order = (tablesmodel.Booking.start_ts, tablesmodel.Booking.id)
+    query = select(tablesmodel.Booking).where(tablesmodel.Booking.overlay_id == overlay_id)
+    if start is not None:
+        query = query.where(tablesmodel.Booking.end_ts > utils.naive_utc(start))
+    if end is not None:
+        query = query.where(tablesmodel.Booking.start_ts < utils.naive_utc(end))
+    if cursor:
+        query = query.where(pagination.after(order, pagination.decode_cursor(cursor, datetime, int)))
+
+    bs = (await db.scalars(query.order_by(*order).limit(limit + 1))).all()
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = http_cache.REVALIDATE
+    return pagination.page(bs, limit, lambda b: (b.start_ts, b.id))
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status
-from fastapi.responses import JSONResponse
+import os
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Optional
 
-from .. import schemas, tablesmodel, oAuth2
-from ..database import get_db
-from ..services import storage
+from .. import schemas, tablesmodel, oAuth2, http_cache, pagination, utils
+from ..config import settings
+from ..database import get_db, get_async_db
+from ..services import analytics, booking_index, collab, heatmap, jobs, overlay_diff, overlay_snapshots, storage, tiles, versioning
 
 router = APIRouter(prefix="/floorplans", tags=["floorplans"])
 
@@ -13,103 +18,236 @@ router = APIRouter(prefix="/floorplans", tags=["floorplans"])
 def upload_floorplan(file: UploadFile = File(...), name: str = Form(None), building: str = Form(None), floor_number: int = Form(None), 
                      pixels_per_meter: float = Form(None), db: Session = Depends(get_db), current_user: tablesmodel.User = Depends(oAuth2.get_current_user)):
     
-    path = storage.save_upload_local(file)
+    try:
+        stored = storage.save_upload(file)
+    except storage.UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
     fp = tablesmodel.FloorPlan(
         name=name,
         building=building,
         floor_number=floor_number,
-        image_path=path,
+        image_path=stored.path,
+        file_sha256=stored.sha256,
+        file_size=stored.size,
+        processing_status="pending",
         pixels_per_meter=pixels_per_meter,
         uploaded_by=current_user.id if current_user else None,
     )
 
     db.add(fp)
+    db.flush()
+    #version 1 is the empty floor, the base of the version history
+    versioning.record_version(db, fp.id, fp.version, [], [], [], lambda: [], created_by=fp.uploaded_by)
+    #tiles, thumbnail and dimensions are produced off the request path, see GET /floorplans/{id}/processing
+    job = jobs.enqueue_floorplan_processing(db, fp)
     db.commit()
+    jobs.submit(job.id, fp.id)
     db.refresh(fp)
     return fp
 
-@router.get("", response_model=List[schemas.FloorPlanOut])
-def list_floorplans(db: Session = Depends(get_db)):
-    fps = db.query(tablesmodel.FloorPlan).order_by(tablesmodel.FloorPlan.created_at.desc()).all()
-    return fps
+@router.get("", response_model=schemas.Page[schemas.FloorPlanOut])
+async def list_floorplans(building: Optional[str] = Query(None), floor_number: Optional[int] = Query(None), cursor: Optional[str] = Query(None),
+                          limit: int = Query(50, ge=1, le=500), db: AsyncSession = Depends(get_async_db)):
+    #newest first, keyset on (created_at, id)
+    order = (tablesmodel.FloorPlan.created_at, tablesmodel.FloorPlan.id)
+    query = select(tablesmodel.FloorPlan)
+    if building is not None:
+        query = query.where(tablesmodel.FloorPlan.building == building)
+    if floor_number is not None:
+        query = query.where(tablesmodel.FloorPlan.floor_number == floor_number)
+    if cursor:
+        query = query.where(pagination.after(order, pagination.decode_cursor(cursor, datetime, int), descending=True))
+
+    fps = (await db.scalars(query.order_by(*(c.desc() for c in order)).limit(limit + 1))).all()
+    return pagination.page(fps, limit, lambda fp: (fp.created_at, fp.id))
 
 @router.get("/{id}", response_model=schemas.FloorPlanOut)
-def get_floorplan(id: int, db: Session = Depends(get_db)):
-    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+async def get_floorplan(id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    fp = await db.get(tablesmodel.FloorPlan, id)
 
     if not fp:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+
+    #edits bump the version, post-upload processing changes the status along with the image fields
+    etag = http_cache.version_etag("fp", fp.id, fp.version, fp.processing_status)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.REVALIDATE)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = http_cache.REVALIDATE
     return fp
 
+def serve_stored(request: Request, key: str, etag: str, media_type: Optional[str] = None):
+    #content-addressed keys never change, so ETag + immutable caching; FileResponse answers Range requests
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.IMMUTABLE)
+
+    #remote stores hand out a presigned URL so the bytes never pass through the API
+    backend = storage.get_backend()
+    url = backend.download_url(key)
+    if url:
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    path = backend.local_path(key)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    return FileResponse(path, media_type=media_type, headers={"ETag": etag, "Cache-Control": http_cache.IMMUTABLE})
+
+@router.get("/{id}/processing")
+def get_processing_status(id: int, db: Session = Depends(get_db)):
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+
+    job = db.query(tablesmodel.ProcessingJob).filter(tablesmodel.ProcessingJob.floor_plan_id == id).order_by(tablesmodel.ProcessingJob.id.desc()).first()
+    if not job:
+        return {"processing_status": fp.processing_status, "job": None}
+    return {"processing_status": fp.processing_status, "job": {
+        "id": job.id,
+        "status": job.status,
+        "step": job.step,
+        "progress": job.progress,
+        "attempts": job.attempts,
+        "error": job.error,
+        "result": job.result,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }}
+
+@router.get("/{id}/file")
+def download_floorplan_file(id: int, request: Request, db: Session = Depends(get_db)):
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    return serve_stored(request, fp.image_path, f'"{fp.file_sha256 or fp.image_path}"')
+
+@router.get("/{id}/thumbnail")
+def get_thumbnail(id: int, request: Request, db: Session = Depends(get_db)):
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    if fp.tile_max_zoom is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No thumbnail for this floorplan")
+    return serve_stored(request, tiles.thumbnail_key(fp.file_sha256), f'"{fp.file_sha256}-thumbnail"', media_type="image/png")
+
+@router.get("/{id}/tiles/{z}/{x}/{y}")
+def get_tile(id: int, z: int, x: int, y: int, request: Request, db: Session = Depends(get_db)):
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    if fp.tile_max_zoom is None or not 0 <= z <= fp.tile_max_zoom or x < 0 or y < 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tile not found")
+
+    scale = 2 ** (fp.tile_max_zoom - z)
+    if x * tiles.TILE_SIZE * scale >= fp.image_width or y * tiles.TILE_SIZE * scale >= fp.image_height:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tile not found")
+    return serve_stored(request, tiles.tile_key(fp.file_sha256, z, x, y), f'"{fp.file_sha256}-{z}-{x}-{y}"', media_type="image/png")
+
+#utilization heatmap as an RGBA PNG over the plan image; X-Heatmap-Scale image pixels per heatmap pixel
+#from/to default to the last 30 days, day_start/day_end/weekdays_only count business hours only (ANALYTICS_TIMEZONE)
+@router.get("/{id}/heatmap")
+def get_heatmap(id: int, request: Request, start: Optional[datetime] = Query(None, alias="from"), end: Optional[datetime] = Query(None, alias="to"),
+                day_start: int = Query(0, ge=0, le=23), day_end: int = Query(24, ge=1, le=24), weekdays_only: bool = Query(False),
+                max_size: Optional[int] = Query(None, ge=64, le=8192), db: Session = Depends(get_db),
+                current_user: tablesmodel.User = Depends(oAuth2.get_token_principal)):
+    end = utils.naive_utc(end) if end is not None else utils.naive_utc(datetime.now(timezone.utc))
+    start = utils.naive_utc(start) if start is not None else end - timedelta(days=30)
+    if end <= start or day_end <= day_start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty time window")
+    if end - start > timedelta(days=731):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Window is limited to two years")
+
+    fp = db.get(tablesmodel.FloorPlan, id)
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    token = heatmap.cache_token(db, id)
+    window = analytics.Window(start, end, floor_plan_id=id, day_start=day_start, day_end=day_end, weekdays_only=weekdays_only)
+    #?max_size can shrink the render, not grow it past HEATMAP_MAX_SIZE (render time and cache bytes scale with its square)
+    max_size = min(max_size or settings.heatmap_max_size, settings.heatmap_max_size)
+
+    #new bookings or overlay edits change the token; the window is whole hours so "last 30 days" stays cacheable within the hour
+    etag = http_cache.version_etag("heatmap", id, *token, window.start.strftime("%Y%m%d%H"), window.end.strftime("%Y%m%d%H"), day_start, day_end, int(weekdays_only), max_size)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.REVALIDATE)
+    png, scale = heatmap.render(db, fp, window, token, max_size)
+    return Response(png, media_type="image/png", headers={"ETag": etag, "Cache-Control": http_cache.REVALIDATE, "X-Heatmap-Scale": str(scale)})
+
 @router.put("/{id}/save")
 def save_overlays(id: int, payload: schemas.SaveOverlays, db: Session = Depends(get_db), current_user: tablesmodel.User = Depends(oAuth2.get_current_user)):
-    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+    #row lock like the single-overlay routes: concurrent saves from the same version queue here and the later one gets the 409
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).with_for_update().first()
     if not fp:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
 
-    #lock check (optimistic)
+    #lock check (optimistic); the current overlays go back pre-serialized, see services/overlay_snapshots
     if payload.client_version != fp.version:
-        server_overlays = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.floor_plan_id == fp.id).all()
-        
-        server_overlays_json = []
-        for o in server_overlays:
-            server_overlays_json.append({
-                "id": o.id,
-                "type": o.type,
-                "label": o.label,
-                "capacity": o.capacity,
-                "x": o.x,
-                "y": o.y,
-                "width": o.width,
-                "height": o.height,
-                "props": o.props,
-                "created_by": o.created_by,
-                "created_at": o.created_at.isoformat() if o.created_at is not None else None
-            })
-
-        return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={
-            "message": "version_mismatch",
-            "server_version": fp.version,
-            "server_overlays": server_overlays_json
-        })
-
-    #delete old overlays and insert new ones
-    db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.floor_plan_id == fp.id).delete()
-    db.commit()
+        server_overlays = overlay_snapshots.load(db, fp.id, fp.version)
+        return Response(status_code=status.HTTP_409_CONFLICT, media_type="application/json",
+                        content=b'{"message":"version_mismatch","server_version":%d,"server_overlays":%b}' % (fp.version, server_overlays))
 
-    for ov in payload.overlays:
-        new_ov = tablesmodel.Overlay(
-            floor_plan_id=fp.id,
-            type=ov.type,
-            label=ov.label,
-            capacity=ov.capacity,
-            x=ov.x,
-            y=ov.y,
-            width=ov.width,
-            height=ov.height,
-            props=ov.props,
-            created_by=current_user.id if current_user else None
-        )
-        db.add(new_ov)
+    #diff against the stored overlays: overlays with an id are updated when changed, ids missing from the payload
+    #are deleted and overlays without an id are inserted, all as bulk statements in one transaction
+    incoming = [ov.model_dump() for ov in payload.overlays]
+    try:
+        diff = overlay_diff.compute_diff(overlay_diff.load_overlay_fields(db, fp.id), incoming)
+    except overlay_diff.UnknownOverlays as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    fp.version = fp.version + 1
-    version_entry = tablesmodel.FloorPlanVersion(
-        floor_plan_id=fp.id,
-        version=fp.version,
-        changes={"overlays": [ov.dict() for ov in payload.overlays]},
-        created_by=current_user.id if current_user else None
-    )
+    created_by = current_user.id if current_user else None
+    inserted_ids = overlay_diff.apply_diff(db, fp.id, diff, created_by=created_by)
 
-    db.add(version_entry)
+    new_ids = iter(inserted_ids)
+    snapshot = []
+    for ov in incoming:
+        snapshot.append({"id": ov["id"] if ov["id"] is not None else next(new_ids), **{f: ov[f] for f in overlay_diff.OVERLAY_FIELDS}})
+    snapshot.sort(key=lambda o: o["id"])
+    inserted = set(inserted_ids)
+    added = [o for o in snapshot if o["id"] in inserted]
+
+    fp.version = fp.version + 1
+    versioning.record_version(db, fp.id, fp.version, added, diff.updates, diff.deletes, lambda: snapshot, created_by=created_by)
+    event = collab.enqueue(db, collab.patch_event(fp.id, fp.version, added, diff.updates, diff.deletes, user_id=created_by))
     db.commit()
     db.refresh(fp)
-    return {"status": "ok", "new_version": fp.version}
+    versioning.snapshot_cache.put((fp.id, fp.version), snapshot)
+    collab.broadcast(event)
+
+    #bookings of deleted overlays went with them (ON DELETE CASCADE)
+    booking_index.index.invalidate(diff.deletes)
+    return {"status": "ok", "new_version": fp.version, "inserted_ids": inserted_ids,
+            "updated": len(diff.updates), "deleted": len(diff.deletes)}
 
-@router.get("/{id}/versions")
-def list_versions(id: int, db: Session = Depends(get_db)):
+@router.get("/{id}/versions", response_model=schemas.Page[schemas.VersionOut])
+def list_versions(id: int, cursor: Optional[str] = Query(None), limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
     fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
     if not fp:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
-    
-    versions = db.query(tablesmodel.FloorPlanVersion).filter(tablesmodel.FloorPlanVersion.floor_plan_id == id).order_by(tablesmodel.FloorPlanVersion.version.desc()).all()
-    return [{"version": v.version, "changes": v.changes, "created_at": v.created_at} for v in versions]
\ No newline at end of file
+
+    #metadata only, payloads are rebuilt per version by GET /floorplans/{id}/versions/{version}; newest first,
+    #the cursor is the last version seen (served by the (floor_plan_id, version) unique index)
+    query = db.query(tablesmodel.FloorPlanVersion.version, tablesmodel.FloorPlanVersion.is_checkpoint, tablesmodel.FloorPlanVersion.created_by,
+                     tablesmodel.FloorPlanVersion.created_at).filter(tablesmodel.FloorPlanVersion.floor_plan_id == id)
+    if cursor:
+        query = query.filter(tablesmodel.FloorPlanVersion.version < pagination.decode_cursor(cursor, int)[0])
+    versions = query.order_by(tablesmodel.FloorPlanVersion.version.desc()).limit(limit + 1).all()
+    return pagination.page(versions, limit, lambda v: (v.version,))
+
+@router.get("/{id}/versions/{version}")
+def get_version(id: int, version: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == id).first()
+    if not fp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+
+    #a recorded version never changes
+    etag = http_cache.version_etag("fp", id, "version", version)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.IMMUTABLE)
+
+    try:
+        overlays = versioning.rebuild(db, id, version)
+    except versioning.VersionNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Version not found")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = http_cache.IMMUTABLE
+    return {"version": version, "overlays": overlays}
@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from .. import schemas, tablesmodel, oAuth2
-from ..database import get_db
+from .. import schemas, tablesmodel, oAuth2, pagination, http_cache
+from ..database import get_db, get_async_db
+from ..services import booking_index, collab, overlay_snapshots, spatial, versioning
 
 router = APIRouter(prefix="/overlays", tags=["overlays"])
 
+#single-overlay edits change the floor too: bump its version and record the patch so the
+#version history (and optimistic saves) see every change; returns the live event to broadcast after the commit
+def bump_version(db: Session, fp: tablesmodel.FloorPlan, added=(), updated=(), removed=(), created_by=None):
+    fp.version = fp.version + 1
+    db.flush()
+    versioning.record_version(db, fp.id, fp.version, list(added), list(updated), list(removed),
+                              lambda: versioning.load_snapshot(db, fp.id), created_by=created_by)
+    return collab.enqueue(db, collab.patch_event(fp.id, fp.version, added, updated, removed, user_id=created_by))
+
 # POST /overlays
 # Body: OverlayCreate
 @router.post("", response_model=schemas.OverlayOut)
 def create_overlay(payload: schemas.OverlayCreate, db: Session = Depends(get_db), current_user: tablesmodel.User = Depends(oAuth2.get_current_user)):
-    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == payload.floor_plan_id).first()
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == payload.floor_plan_id).with_for_update().first()
     if not fp:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
 
@@ -28,7 +40,10 @@ def create_overlay(payload: schemas.OverlayCreate, db: Session = Depends(get_db)
         created_by=current_user.id if current_user else None
     )
     db.add(ov)
+    db.flush()
+    event = bump_version(db, fp, added=[versioning.overlay_to_version_dict(ov)], created_by=ov.created_by)
     db.commit()
+    collab.broadcast(event)
     db.refresh(ov)
     return ov
 
@@ -39,6 +54,7 @@ def update_overlay(id: int, payload: schemas.OverlayBase, db: Session = Depends(
     ov = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.id == id).first()
     if not ov:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Overlay not found")
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == ov.floor_plan_id).with_for_update().first()
     ov.type = payload.type
     ov.label = payload.label
     ov.capacity = payload.capacity
@@ -47,7 +63,9 @@ def update_overlay(id: int, payload: schemas.OverlayBase, db: Session = Depends(
     ov.width = payload.width
     ov.height = payload.height
     ov.props = payload.props
+    event = bump_version(db, fp, updated=[versioning.overlay_to_version_dict(ov)], created_by=current_user.id if current_user else None)
     db.commit()
+    collab.broadcast(event)
     db.refresh(ov)
     return ov
 
@@ -57,12 +75,72 @@ def delete_overlay(id: int, db: Session = Depends(get_db), current_user: tablesm
     ov = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.id == id).first()
     if not ov:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Overlay not found")
+    fp = db.query(tablesmodel.FloorPlan).filter(tablesmodel.FloorPlan.id == ov.floor_plan_id).with_for_update().first()
     db.delete(ov)
+    event = bump_version(db, fp, removed=[id], created_by=current_user.id if current_user else None)
     db.commit()
+    collab.broadcast(event)
+    booking_index.index.invalidate([id])
     return {"message": "overlay deleted"}
 
-# GET /floorplans/{id}/overlays
-@router.get("/floorplan/{floorplan_id}", response_model=List[schemas.OverlayOut])
-def list_overlays_for_floorplan(floorplan_id: int, db: Session = Depends(get_db)):
-    overlays = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.floor_plan_id == floorplan_id).all()
-    return overlays
\ No newline at end of file
+# GET /overlays/floorplan/{id}
+# Without a limit the whole floor is returned in one page (the editor loads it all)
+@router.get("/floorplan/{floorplan_id}", response_model=schemas.Page[schemas.OverlayOut])
+async def list_overlays_for_floorplan(floorplan_id: int, request: Request, response: Response, type: Optional[str] = Query(None), label: Optional[str] = Query(None),
+                                      cursor: Optional[str] = Query(None), limit: Optional[int] = Query(None, ge=1, le=10000), db: AsyncSession = Depends(get_async_db)):
+    #every overlay write bumps the floor's version, so polling editors revalidate with one primary key lookup
+    version = await db.scalar(select(tablesmodel.FloorPlan.version).where(tablesmodel.FloorPlan.id == floorplan_id))
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    etag = http_cache.version_etag("overlays", floorplan_id, version)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.REVALIDATE)
+
+    if type is None and not label and not cursor and limit is None:
+        #the whole floor (the editor load): pre-serialized once per version
+        items = await overlay_snapshots.load_async(db, floorplan_id, version)
+        return Response(content=b'{"items":' + items + b',"next_cursor":null}', media_type="application/json",
+                        headers={"ETag": etag, "Cache-Control": http_cache.REVALIDATE})
+
+    #read after the version: a commit in between only makes the rows newer than the tag, and the next poll refetches
+    query = select(tablesmodel.Overlay).where(tablesmodel.Overlay.floor_plan_id == floorplan_id)
+    if type is not None:
+        query = query.where(tablesmodel.Overlay.type == type)
+    if label:
+        #substring match, evaluated within the floor's index range
+        query = query.where(tablesmodel.Overlay.label.icontains(label, autoescape=True))
+    if cursor:
+        query = query.where(tablesmodel.Overlay.id > pagination.decode_cursor(cursor, int)[0])
+    query = query.order_by(tablesmodel.Overlay.id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    overlays = (await db.scalars(query)).all()
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = http_cache.REVALIDATE
+    return pagination.page(overlays, limit, lambda ov: (ov.id,))
+
+
+# GET /overlays/floorplan/{id}/at?x=&y=
+# Overlays containing the point, smallest first (a seat before the room around it)
+@router.get("/floorplan/{floorplan_id}/at", response_model=List[schemas.OverlayOut])
+async def overlays_at_point(floorplan_id: int, x: int = Query(...), y: int = Query(...), db: AsyncSession = Depends(get_async_db)):
+    grid = await db.run_sync(spatial.floor_index, floorplan_id)
+    if grid is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    return grid.at(x, y)
+
+# GET /overlays/floorplan/{id}/within?bbox=x1,y1,x2,y2
+# Overlays intersecting the box (or only those fully inside it with contained=true), for viewport loading
+@router.get("/floorplan/{floorplan_id}/within", response_model=List[schemas.OverlayOut])
+async def overlays_within_bbox(floorplan_id: int, bbox: str = Query(..., description="x1,y1,x2,y2 in image pixels"), contained: bool = Query(False),
+                               db: AsyncSession = Depends(get_async_db)):
+    try:
+        x1, y1, x2, y2 = (int(float(v)) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox must be x1,y1,x2,y2")
+
+    grid = await db.run_sync(spatial.floor_index, floorplan_id)
+    if grid is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Floorplan not found")
+    return grid.within(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), contained=contained)
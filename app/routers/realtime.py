@@ -0,0 +1,58 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from .. import tablesmodel, oAuth2
+from ..database import sessionLocal
+from ..services import collab
+
+router = APIRouter(tags=["realtime"])
+
+def authorize(token: str, floor_plan_id: int):
+    #browsers can't set headers on a WebSocket, so the bearer token comes as ?token=
+    with sessionLocal() as db:
+        user = oAuth2.resolve_user(token, db)
+        version = db.scalar(select(tablesmodel.FloorPlan.version).where(tablesmodel.FloorPlan.id == floor_plan_id))
+    return user, version
+
+# WS /ws/floorplans/{id}?token=
+# Pushes every committed overlay change of the floor plan, see services/collab for the messages
+@router.websocket("/ws/floorplans/{id}")
+async def floorplan_events(websocket: WebSocket, id: int, token: str = Query(...)):
+    #subscribe before reading the version, so nothing committed in between is missed
+    sub = collab.hub.subscribe(id)
+    try:
+        try:
+            user, version = await run_in_threadpool(authorize, token, id)
+        except HTTPException as e:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+            return
+        if version is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Floorplan not found")
+            return
+
+        await websocket.accept()
+        await websocket.send_json({"type": "hello", "floor_plan_id": id, "version": version})
+
+        async def send():
+            while True:
+                await websocket.send_text(await sub.queue.get())
+
+        async def receive():
+            #clients only send keepalives; this ends when they disconnect
+            while True:
+                await websocket.receive_text()
+
+        tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for r in results:
+                if isinstance(r, Exception) and not isinstance(r, (WebSocketDisconnect, RuntimeError)):
+                    print(f"[collab] websocket closed: {type(r).__name__}: {r}")
+    finally:
+        collab.hub.unsubscribe(sub)
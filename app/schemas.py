@@ -1,6 +1,8 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Generic, TypeVar
+
+T = TypeVar("T")
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -52,7 +54,14 @@ class FloorPlanOut(BaseModel):
     building: Optional[str]
     floor_number: Optional[int]
     image_path: str
+    file_sha256: Optional[str] = None
+    file_size: Optional[int] = None
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    tile_max_zoom: Optional[int] = None
+    processing_status: Optional[str] = None
     pixels_per_meter: Optional[float]
+    suggested_pixels_per_meter: Optional[float] = None
     version: int
     uploaded_by: Optional[int]
     created_at: datetime
@@ -82,10 +91,13 @@ class OverlayOut(OverlayBase):
     class Config:
         from_attributes = True
 
+class OverlaySave(OverlayBase):
+    id: Optional[int] = None    #omit for new overlays, send the stored id to keep (and update) an existing one
+
 class SaveOverlays(BaseModel):
     floor_plan_id: int
     client_version: int
-    overlays: List[OverlayBase]
+    overlays: List[OverlaySave]
 
 class BookingCreate(BaseModel):
     overlay_id: int
@@ -100,4 +112,17 @@ class BookingOut(BookingCreate):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None     #send back as ?cursor= for the next page, null on the last page
+
+class VersionOut(BaseModel):
+    version: int
+    is_checkpoint: bool
+    created_by: Optional[int]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
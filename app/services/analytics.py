@@ -0,0 +1,273 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+import numpy as np
+from sqlalchemy import ARRAY, Double, Integer, any_, bindparam, cast, func, select, text
+from sqlalchemy.dialects.postgresql import BIT, insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..config import settings
+from ..utils import naive_utc
+
+#Occupancy analytics over hourly per-overlay rollups (occupancy_hourly). Booking writes keep the
+#rollups current in their own transaction (record_booking with sign +1 on create, -1 on cancel);
+#rebuild() recomputes them from the bookings table in one pass. Queries let Postgres reduce the
+#window to per-overlay or per-hour sums; site-time bucketing and the statistics are computed with NumPy.
+
+HOUR = timedelta(hours=1)
+REBUILD_LOCK_NAMESPACE = 0x6f63   #'oc', first key of the two-int advisory lock form (see booking_locks)
+ROLLUP_FIELDS = ("booked_seconds", "participant_seconds", "bookings", "over_capacity", "under_half")
+
+def hour_buckets(start: datetime, end: datetime) -> Iterator[Tuple[datetime, int]]:
+    #(hour, whole seconds of [start, end) inside it); seconds are floored, as in rebuild()
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        nxt = hour + HOUR
+        yield hour, int((min(end, nxt) - max(start, hour)).total_seconds())
+        hour = nxt
+
+def capacity_flags(participants: Optional[int], capacity: Optional[int]) -> dict:
+    #Booking columns, set when the booking is made; same rules as FLAGS_SQL
+    return {"over_capacity": participants is not None and capacity is not None and participants > capacity,
+            "under_half": bool(participants) and bool(capacity) and participants * 2 <= capacity}
+
+def record_booking(db: Session, booking: tablesmodel.Booking, sign: int = 1):
+    #part of the caller's transaction, under the room lock the booking write holds; the shared rollup
+    #lock lets booking writes run side by side but waits for a rebuild (and holds one off) until commit.
+    #Over/under capacity come from the booking's flags: a cancel takes back what its create added, even
+    #after the room's capacity changed
+    db.execute(text("SELECT pg_advisory_xact_lock_shared(:ns, 0)"), {"ns": REBUILD_LOCK_NAMESPACE})
+    start, end = naive_utc(booking.start_ts), naive_utc(booking.end_ts)
+    if end <= start:
+        return
+    participants = booking.participants or 0
+    over, under = int(booking.over_capacity), int(booking.under_half)
+
+    rows = []
+    for i, (hour, seconds) in enumerate(hour_buckets(start, end)):
+        first = i == 0
+        rows.append({"overlay_id": booking.overlay_id, "hour": hour, "booked_seconds": sign * seconds,
+                     "participant_seconds": sign * seconds * participants, "bookings": sign * first,
+                     "over_capacity": sign * first * over, "under_half": sign * first * under})
+    stmt = pg_insert(tablesmodel.OccupancyHourly).values(rows)
+    stmt = stmt.on_conflict_do_update(index_elements=["overlay_id", "hour"],
+                                      set_={f: getattr(tablesmodel.OccupancyHourly, f) + stmt.excluded[f] for f in ROLLUP_FIELDS})
+    db.execute(stmt)
+
+REBUILD_SQL = """
+INSERT INTO occupancy_hourly (overlay_id, hour, booked_seconds, participant_seconds, bookings, over_capacity, under_half)
+SELECT b.overlay_id, h.hour,
+       SUM(s.seconds),
+       SUM(s.seconds * COALESCE(b.participants, 0)),
+       COUNT(*) FILTER (WHERE h.hour = date_trunc('hour', b.start_ts)),
+       COUNT(*) FILTER (WHERE h.hour = date_trunc('hour', b.start_ts) AND b.over_capacity),
+       COUNT(*) FILTER (WHERE h.hour = date_trunc('hour', b.start_ts) AND b.under_half)
+FROM bookings b
+JOIN overlays o ON o.id = b.overlay_id
+CROSS JOIN LATERAL generate_series(date_trunc('hour', b.start_ts), b.end_ts - interval '1 microsecond', interval '1 hour') AS h(hour)
+CROSS JOIN LATERAL (SELECT FLOOR(EXTRACT(EPOCH FROM LEAST(b.end_ts, h.hour + interval '1 hour') - GREATEST(b.start_ts, h.hour)))::int AS seconds) s
+WHERE b.status IS DISTINCT FROM 'cancelled' AND b.end_ts > b.start_ts {scope}
+GROUP BY b.overlay_id, h.hour
+"""
+
+#bookings whose flags differ from what the room's current capacity gives (only those rows are written)
+FLAGS_SQL = """
+UPDATE bookings b
+SET over_capacity = COALESCE(b.participants > o.capacity, false),
+    under_half = COALESCE(b.participants > 0 AND b.participants * 2 <= o.capacity, false)
+FROM overlays o
+WHERE o.id = b.overlay_id {scope}
+  AND (b.over_capacity, b.under_half) IS DISTINCT FROM (COALESCE(b.participants > o.capacity, false),
+                                                        COALESCE(b.participants > 0 AND b.participants * 2 <= o.capacity, false))
+"""
+
+def rebuild(db: Session, floor_plan_id: Optional[int] = None) -> int:
+    #recompute from bookings (e.g. after importing history); the bookings are flagged over/under capacity
+    #again against the current capacities first, so later cancels subtract what the rebuild counted.
+    #exclusive: no other rebuild and no booking write in between its DELETE and INSERT (either would collide
+    #on the primary key); booking writes wait until the rebuild commits
+    db.execute(text("SELECT pg_advisory_xact_lock(:ns, 0)"), {"ns": REBUILD_LOCK_NAMESPACE})
+    if floor_plan_id is None:
+        db.execute(text(FLAGS_SQL.format(scope="")))
+        db.execute(text("DELETE FROM occupancy_hourly"))
+        result = db.execute(text(REBUILD_SQL.format(scope="")))
+    else:
+        params = {"floor_plan_id": floor_plan_id}
+        db.execute(text(FLAGS_SQL.format(scope="AND o.floor_plan_id = :floor_plan_id")), params)
+        db.execute(text("DELETE FROM occupancy_hourly WHERE overlay_id IN (SELECT id FROM overlays WHERE floor_plan_id = :floor_plan_id)"), params)
+        result = db.execute(text(REBUILD_SQL.format(scope="AND o.floor_plan_id = :floor_plan_id")), params)
+    return result.rowcount
+
+class Window:
+    #scope (any of overlay / floor plan / building / overlay type) and a time window with optional business hours
+    def __init__(self, start: datetime, end: datetime, overlay_id: Optional[int] = None, floor_plan_id: Optional[int] = None,
+                 building: Optional[str] = None, type: Optional[str] = None, day_start: int = 0, day_end: int = 24, weekdays_only: bool = False):
+        #rollups are hourly: the window is widened to whole hours
+        self.start = naive_utc(start).replace(minute=0, second=0, microsecond=0)
+        end = naive_utc(end)
+        self.end = end if end == end.replace(minute=0, second=0, microsecond=0) else end.replace(minute=0, second=0, microsecond=0) + HOUR
+        self.overlay_id = overlay_id
+        self.floor_plan_id = floor_plan_id
+        self.building = building
+        self.type = type
+        self.day_start = day_start
+        self.day_end = day_end
+        self.weekdays_only = weekdays_only
+        self.tz = settings.analytics_timezone
+        self._hours = None
+
+    def describe(self) -> dict:
+        return {"start": self.start, "end": self.end, "timezone": self.tz, "day_start": self.day_start, "day_end": self.day_end,
+                "weekdays_only": self.weekdays_only}
+
+    def overlays_query(self):
+        stmt = select(tablesmodel.Overlay.id, tablesmodel.Overlay.label, tablesmodel.Overlay.floor_plan_id, tablesmodel.Overlay.type,
+                      tablesmodel.Overlay.capacity)
+        if self.overlay_id is not None:
+            stmt = stmt.where(tablesmodel.Overlay.id == self.overlay_id)
+        if self.floor_plan_id is not None:
+            stmt = stmt.where(tablesmodel.Overlay.floor_plan_id == self.floor_plan_id)
+        if self.type is not None:
+            stmt = stmt.where(tablesmodel.Overlay.type == self.type)
+        if self.building is not None:
+            stmt = stmt.join(tablesmodel.FloorPlan, tablesmodel.FloorPlan.id == tablesmodel.Overlay.floor_plan_id).where(
+                tablesmodel.FloorPlan.building == self.building)
+        return stmt.order_by(tablesmodel.Overlay.id)
+
+    def local_time(self):
+        #every hour of the window (UTC), its site-time weekday (Monday = 0) and hour of day, and whether it is counted
+        if self._hours is None:
+            utc = np.arange(np.datetime64(self.start, "h"), np.datetime64(self.end, "h"), dtype="datetime64[h]")
+            minutes = utc.astype("datetime64[m]").astype(np.int64)
+            if self.tz != "UTC":
+                zone = ZoneInfo(self.tz)
+                minutes = minutes + np.array([h.astype(datetime).replace(tzinfo=timezone.utc).astimezone(zone).utcoffset() // timedelta(minutes=1)
+                                              for h in utc], dtype=np.int64)
+            hour_of_day = minutes // 60 % 24
+            weekday = (minutes // 1440 + 3) % 7      #1970-01-01 was a Thursday
+            counted = (hour_of_day >= self.day_start) & (hour_of_day < self.day_end)
+            if self.weekdays_only:
+                counted &= weekday < 5
+            self._hours = (utc, weekday, hour_of_day, counted)
+        return self._hours
+
+    def rollups_where(self, stmt, overlay_ids):
+        #ids as one array parameter: Postgres scans the covering (overlay_id, hour) index per id, without heap reads
+        stmt = stmt.where(tablesmodel.OccupancyHourly.hour >= self.start, tablesmodel.OccupancyHourly.hour < self.end)
+        if self.scoped:
+            stmt = stmt.where(tablesmodel.OccupancyHourly.overlay_id == any_(bindparam("overlay_ids", list(overlay_ids), type_=ARRAY(Integer))))
+        utc, _, _, counted = self.local_time()
+        if not counted.all():
+            #business hours / weekdays as one bit per hour of the window, looked up by the row's hour_no: timezone()
+            #or date arithmetic per rollup row cost more than the scan, and joining the counted hours (hashed) doubles it.
+            #"<> 0" rather than "= 1": Postgres guesses 0.5% of rows for the equality and sorts them all to group
+            mask = cast(bindparam("counted", "".join("1" if c else "0" for c in counted.tolist())), BIT(varying=True))
+            stmt = stmt.where(func.get_bit(mask, tablesmodel.OccupancyHourly.hour_no - int(utc[0].astype(np.int64))) != 0)
+        return stmt
+
+    @property
+    def scoped(self) -> bool:
+        return any(v is not None for v in (self.overlay_id, self.floor_plan_id, self.building, self.type))
+
+    def slots(self) -> np.ndarray:
+        #counted (weekday, hour) slots of the window in site time: 7 x 24, Monday first
+        _, weekday, hour_of_day, counted = self.local_time()
+        return np.bincount((weekday * 24 + hour_of_day)[counted], minlength=168).reshape(7, 24)
+
+def _per_overlay(db: Session, window: Window):
+    overlays = db.execute(window.overlays_query()).all()
+    ids = np.array([o.id for o in overlays], dtype=np.int64)
+    sums = np.zeros((len(ids), len(ROLLUP_FIELDS)), dtype=np.float64)
+    #participant_seconds summed as float8: the sum of a bigint is a numeric, several times slower to add up
+    columns = [func.sum(getattr(tablesmodel.OccupancyHourly, f)) for f in ROLLUP_FIELDS]
+    columns[1] = func.sum(cast(tablesmodel.OccupancyHourly.participant_seconds, Double))
+    if not len(ids):
+        return overlays, sums
+    rows = db.execute(window.rollups_where(select(tablesmodel.OccupancyHourly.overlay_id, *columns), ids.tolist()).group_by(tablesmodel.OccupancyHourly.overlay_id)).all()
+    if rows:
+        data = np.array(rows, dtype=np.float64)
+        #overlays created since the first query are not in scope
+        pos = np.minimum(np.searchsorted(ids, data[:, 0].astype(np.int64)), len(ids) - 1)
+        known = ids[pos] == data[:, 0]
+        sums[pos[known]] = data[known, 1:]
+    return overlays, sums
+
+def _pct(x) -> Optional[float]:
+    return None if x is None or not np.isfinite(x) else round(float(x) * 100, 2)
+
+def utilization(db: Session, window: Window) -> dict:
+    overlays, sums = _per_overlay(db, window)
+    available = float(window.slots().sum()) * 3600
+    booked, participant_seconds = sums[:, 0], sums[:, 1]
+    capacity = np.array([o.capacity or 0 for o in overlays], dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        util = np.clip(booked / available, 0, 1) if available else np.zeros(len(overlays))
+        seats = np.where(capacity > 0, participant_seconds / (capacity * available), np.nan) if available else np.full(len(overlays), np.nan)
+
+    order = np.argsort(-util, kind="stable")
+    summary = {
+        "overlays": len(overlays),
+        "available_hours_per_overlay": available / 3600,
+        "booked_hours": float(booked.sum()) / 3600,
+        "bookings": int(sums[:, 2].sum()),
+        "utilization_pct": _pct(util.mean()) if len(util) else None,
+        "median_utilization_pct": _pct(np.median(util)) if len(util) else None,
+        "p90_utilization_pct": _pct(np.percentile(util, 90)) if len(util) else None,
+        "seat_occupancy_pct": _pct(np.nanmean(seats)) if np.isfinite(seats).any() else None,
+        "idle_overlays": int((booked == 0).sum()),
+    }
+    return {"window": window.describe(), "summary": summary, "overlays": [
+        {"id": overlays[i].id, "label": overlays[i].label, "floor_plan_id": overlays[i].floor_plan_id, "type": overlays[i].type,
+         "capacity": overlays[i].capacity, "utilization_pct": _pct(util[i]), "seat_occupancy_pct": _pct(seats[i]),
+         "booked_hours": round(float(booked[i]) / 3600, 2), "bookings": int(sums[i, 2])}
+        for i in order
+    ]}
+
+def peak_hours(db: Session, window: Window, top: int = 10) -> dict:
+    ids = db.scalars(window.overlays_query().with_only_columns(tablesmodel.Overlay.id)).all()
+    n_overlays = len(ids)
+    #Postgres sums the scope per UTC hour, the site-time weekday/hour bins are NumPy's
+    booked = np.zeros(168, dtype=np.float64)
+    if ids:
+        hour_col = tablesmodel.OccupancyHourly.hour
+        rows = db.execute(window.rollups_where(select(hour_col, func.sum(tablesmodel.OccupancyHourly.booked_seconds)), ids).group_by(hour_col)).all()
+        if rows:
+            utc, weekday, hour_of_day, _ = window.local_time()
+            pos = np.searchsorted(utc, np.array([r[0] for r in rows], dtype="datetime64[h]"))
+            np.add.at(booked, weekday[pos] * 24 + hour_of_day[pos], np.array([r[1] for r in rows], dtype=np.float64))
+    booked = booked.reshape(7, 24)
+    capacity_seconds = window.slots() * n_overlays * 3600.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        util = np.where(capacity_seconds > 0, booked / capacity_seconds, np.nan)
+
+    flat = np.where(np.isfinite(util), util, -1).ravel()
+    best = np.argsort(-flat, kind="stable")[:top]
+    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    return {
+        "window": window.describe(),
+        "overlays": n_overlays,
+        "utilization_pct": [[_pct(v) for v in row] for row in util],     #[weekday][hour], Monday first
+        "peaks": [{"weekday": days[i // 24], "hour": int(i % 24), "utilization_pct": _pct(flat[i])} for i in best if flat[i] > 0],
+    }
+
+def capacity_fit(db: Session, window: Window) -> dict:
+    overlays, sums = _per_overlay(db, window)
+    bookings, over, under = sums[:, 2], sums[:, 3], sums[:, 4]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        over_rate, under_rate = over / bookings, under / bookings
+    total = bookings.sum()
+    booked = np.flatnonzero(bookings > 0)
+    worst = booked[np.argsort(-over_rate[booked], kind="stable")]
+    return {
+        "window": window.describe(),
+        "bookings": int(total),
+        "over_capacity_pct": _pct(over.sum() / total) if total else None,
+        "under_half_capacity_pct": _pct(under.sum() / total) if total else None,
+        "overlays": [
+            {"id": overlays[i].id, "label": overlays[i].label, "capacity": overlays[i].capacity, "bookings": int(bookings[i]),
+             "over_capacity_pct": _pct(over_rate[i]), "under_half_capacity_pct": _pct(under_rate[i])}
+            for i in worst
+        ],
+    }
@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import numpy as np
+from sqlalchemy import and_, exists, select
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..utils import naive_utc
+from . import booking_index
+
+ROOM_PAGE = 200     #candidate rooms per query when the booking index answers a limited search
+
+def overlap_filter(start: datetime, end: datetime):
+    #half-open intervals: [start, end) overlaps [b.start, b.end) unless one ends before the other starts
+    #cancelled bookings free their slot
+    return and_(tablesmodel.Booking.start_ts < end, tablesmodel.Booking.end_ts > start, tablesmodel.Booking.status.is_distinct_from("cancelled"))
+
+def rooms_query(capacity: Optional[int] = None, floor_plan_id: Optional[int] = None, building: Optional[str] = None):
+    stmt = select(tablesmodel.Overlay).where(tablesmodel.Overlay.type == "room")
+
+    if capacity is not None:
+        stmt = stmt.where(tablesmodel.Overlay.capacity >= capacity)
+    if floor_plan_id is not None:
+        stmt = stmt.where(tablesmodel.Overlay.floor_plan_id == floor_plan_id)
+    if building is not None:
+        stmt = stmt.join(tablesmodel.FloorPlan, tablesmodel.FloorPlan.id == tablesmodel.Overlay.floor_plan_id).where(tablesmodel.FloorPlan.building == building)
+    return stmt
+
+def available_rooms_query(start: datetime, end: datetime, capacity: Optional[int] = None, floor_plan_id: Optional[int] = None, building: Optional[str] = None):
+    #anti-join: a room is free when no booking on it overlaps the window
+    #served by the (overlay_id, start_ts, end_ts) index on bookings
+    busy = exists().where(tablesmodel.Booking.overlay_id == tablesmodel.Overlay.id, overlap_filter(start, end))
+    return rooms_query(capacity, floor_plan_id, building).where(~busy).order_by(tablesmodel.Overlay.id)
+
+def find_available_rooms(db: Session, start: datetime, end: datetime, capacity: Optional[int] = None, floor_plan_id: Optional[int] = None,
+                         building: Optional[str] = None, limit: Optional[int] = None, offset: int = 0):
+    start, end = naive_utc(start), naive_utc(end)
+    if booking_index.index.enabled:
+        #candidate rooms are read in id order a page at a time, their bookings come from the in-process
+        #index (misses loaded in one batch per page); a limited search stops once offset + limit are free
+        stmt = rooms_query(capacity, floor_plan_id, building).order_by(tablesmodel.Overlay.id)
+        page_size = max(2 * (offset + limit), ROOM_PAGE) if limit is not None else None
+        free, last_id = [], None
+        while True:
+            page = stmt if last_id is None else stmt.where(tablesmodel.Overlay.id > last_id)
+            rooms = db.scalars(page.limit(page_size) if page_size else page).all()
+            busy = booking_index.index.busy_overlays(db, {o.id: o.booking_epoch for o in rooms}, start, end)
+            free.extend(o for o in rooms if o.id not in busy)
+            if page_size is None or len(rooms) < page_size or len(free) >= offset + limit:
+                return free[offset:offset + limit] if limit is not None else free[offset:]
+            last_id = rooms[-1].id
+
+    stmt = available_rooms_query(start, end, capacity, floor_plan_id, building)
+    if offset:
+        stmt = stmt.offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.scalars(stmt).all()
+
+def find_nearest_rooms(db: Session, floor_plan_id: int, x: float, y: float, start: datetime, end: datetime, capacity: Optional[int] = None,
+                       k: int = 5) -> List[Tuple[tablesmodel.Overlay, float]]:
+    #k free rooms of the floor closest to (x, y), as (room, distance in image pixels) nearest first
+    start, end = naive_utc(start), naive_utc(end)
+    geometry = (tablesmodel.Overlay.id, tablesmodel.Overlay.x, tablesmodel.Overlay.y, tablesmodel.Overlay.width, tablesmodel.Overlay.height)
+    if booking_index.index.enabled:
+        rows = db.execute(rooms_query(capacity, floor_plan_id).with_only_columns(*geometry, tablesmodel.Overlay.booking_epoch)).all()
+        busy = booking_index.index.busy_overlays(db, {r[0]: r[5] for r in rows}, start, end)
+        rows = [r for r in rows if r[0] not in busy]
+    else:
+        rows = db.execute(available_rooms_query(start, end, capacity, floor_plan_id).with_only_columns(*geometry)).all()
+    if not rows:
+        return []
+
+    #centroid distances for every free room at once, then only the k best are sorted
+    geo = np.array([r[:5] for r in rows], dtype=np.float64)
+    dist = np.hypot(geo[:, 1] + geo[:, 3] / 2 - x, geo[:, 2] + geo[:, 4] / 2 - y)
+    if len(dist) > k:
+        nearest = np.argpartition(dist, k)[:k]
+        nearest = nearest[np.argsort(dist[nearest], kind="stable")]
+    else:
+        nearest = np.argsort(dist, kind="stable")
+
+    ids = [int(geo[i, 0]) for i in nearest]
+    rooms = {o.id: o for o in db.scalars(select(tablesmodel.Overlay).where(tablesmodel.Overlay.id.in_(ids)))}
+    return [(rooms[oid], float(dist[i])) for oid, i in zip(ids, nearest) if oid in rooms]
+
+def room_to_dict(o: tablesmodel.Overlay):
+    return {
+        "id": o.id,
+        "floor_plan_id": o.floor_plan_id,
+        "type": o.type,
+        "label": o.label,
+        "capacity": o.capacity,
+        "x": o.x,
+        "y": o.y,
+        "width": o.width,
+        "height": o.height,
+        "props": o.props
+    }
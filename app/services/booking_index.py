@@ -0,0 +1,177 @@
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..utils import naive_utc
+from ..config import settings
+
+#In-process cache of each room's bookings as a sorted interval array, used for conflict checks
+#and availability probes. Entries are tagged with Overlay.booking_epoch, which every booking
+#write bumps in the same transaction, so an entry whose epoch no longer matches the row is
+#stale (another worker wrote to that room) and is reloaded from the bookings table.
+
+LOAD_CHUNK = 1000
+
+class RoomIntervals:
+    __slots__ = ("epoch", "loaded_from", "starts", "ends", "rows", "disjoint")
+
+    def __init__(self, epoch: int, loaded_from: datetime, rows: List[tuple]):
+        #rows are (start_ts, end_ts, id, organizer_id) sorted by start_ts
+        self.epoch = epoch
+        self.loaded_from = loaded_from
+        self.rows = rows
+        self.starts = [r[0] for r in rows]
+        self.ends = [r[1] for r in rows]
+        #bookings written under the room lock never overlap, which keeps ends sorted too;
+        #rows from before that (double-bookings) fall back to a scan
+        self.disjoint = all(self.ends[i] <= self.starts[i + 1] for i in range(len(rows) - 1))
+
+    def overlapping(self, start: datetime, end: datetime) -> List[tuple]:
+        hi = bisect.bisect_left(self.starts, end)
+        if self.disjoint:
+            lo = bisect.bisect_right(self.ends, start)
+            return self.rows[lo:hi]
+        return [r for r in self.rows[:hi] if r[1] > start]
+
+    def insert(self, row: tuple):
+        i = bisect.bisect_right(self.starts, row[0])
+        self.rows.insert(i, row)
+        self.starts.insert(i, row[0])
+        self.ends.insert(i, row[1])
+        if self.disjoint:
+            self.disjoint = (i == 0 or self.ends[i - 1] <= row[0]) and (i == len(self.rows) - 1 or row[1] <= self.starts[i + 1])
+
+    def remove(self, booking_id: int) -> bool:
+        for i, r in enumerate(self.rows):
+            if r[2] == booking_id:
+                del self.rows[i], self.starts[i], self.ends[i]
+                return True
+        return False
+
+class BookingIndex:
+    def __init__(self, enabled: bool, max_overlays: int, horizon: timedelta):
+        self.enabled = enabled
+        self.max_overlays = max_overlays
+        self.horizon = horizon
+        self._entries: "OrderedDict[int, RoomIntervals]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _lookup(self, overlay_id: int, epoch: int, start: datetime) -> Optional[RoomIntervals]:
+        entry = self._entries.get(overlay_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.epoch != epoch or entry.loaded_from > start:
+            self.stale += 1
+            return None
+        self._entries.move_to_end(overlay_id)
+        self.hits += 1
+        return entry
+
+    def _store(self, overlay_id: int, entry: RoomIntervals):
+        self._entries[overlay_id] = entry
+        self._entries.move_to_end(overlay_id)
+        while len(self._entries) > self.max_overlays:
+            self._entries.popitem(last=False)
+
+    def _load(self, db: Session, epochs: Dict[int, int], loaded_from: datetime) -> Dict[int, RoomIntervals]:
+        rows_by_overlay: Dict[int, List[tuple]] = {oid: [] for oid in epochs}
+        ids = list(epochs)
+        for i in range(0, len(ids), LOAD_CHUNK):
+            stmt = select(
+                tablesmodel.Booking.overlay_id, tablesmodel.Booking.start_ts, tablesmodel.Booking.end_ts,
+                tablesmodel.Booking.id, tablesmodel.Booking.organizer_id
+            ).where(
+                tablesmodel.Booking.overlay_id.in_(ids[i:i + LOAD_CHUNK]),
+                tablesmodel.Booking.end_ts > loaded_from,
+                tablesmodel.Booking.status.is_distinct_from("cancelled")
+            ).order_by(tablesmodel.Booking.overlay_id, tablesmodel.Booking.start_ts)
+            for overlay_id, start_ts, end_ts, booking_id, organizer_id in db.execute(stmt):
+                rows_by_overlay[overlay_id].append((start_ts, end_ts, booking_id, organizer_id))
+        return {oid: RoomIntervals(epochs[oid], loaded_from, rows) for oid, rows in rows_by_overlay.items()}
+
+    def _resolve(self, db: Session, epochs: Dict[int, int], start: datetime) -> Dict[int, RoomIntervals]:
+        found = {}
+        missing = {}
+        with self._lock:
+            for oid, epoch in epochs.items():
+                entry = self._lookup(oid, epoch, start)
+                if entry is None:
+                    missing[oid] = epoch
+                else:
+                    found[oid] = entry
+
+        if missing:
+            loaded_from = min(datetime.utcnow() - self.horizon, start)
+            loaded = self._load(db, missing, loaded_from)
+            with self._lock:
+                for oid, entry in loaded.items():
+                    self._store(oid, entry)
+            found.update(loaded)
+        return found
+
+    def conflicts(self, db: Session, overlay_id: int, epoch: int, start: datetime, end: datetime) -> List[tuple]:
+        start, end = naive_utc(start), naive_utc(end)
+        return self._resolve(db, {overlay_id: epoch}, start)[overlay_id].overlapping(start, end)
+
+    def busy_overlays(self, db: Session, epochs: Dict[int, int], start: datetime, end: datetime) -> Set[int]:
+        start, end = naive_utc(start), naive_utc(end)
+        return {oid for oid, entry in self._resolve(db, epochs, start).items() if entry.overlapping(start, end)}
+
+    def record_booking(self, overlay_id: int, old_epoch: int, new_epoch: int, booking: tablesmodel.Booking):
+        #called after our own commit; only an entry that was current before the write can be patched in place
+        with self._lock:
+            entry = self._entries.get(overlay_id)
+            if entry is None:
+                return
+            if entry.epoch != old_epoch:
+                del self._entries[overlay_id]
+                return
+            if naive_utc(booking.end_ts) > entry.loaded_from:
+                entry.insert((naive_utc(booking.start_ts), naive_utc(booking.end_ts), booking.id, booking.organizer_id))
+            entry.epoch = new_epoch
+
+    def remove_booking(self, overlay_id: int, old_epoch: int, new_epoch: int, booking_id: int):
+        #after our own commit of a cancellation, same rules as record_booking
+        with self._lock:
+            entry = self._entries.get(overlay_id)
+            if entry is None:
+                return
+            if entry.epoch != old_epoch:
+                del self._entries[overlay_id]
+                return
+            entry.remove(booking_id)
+            entry.epoch = new_epoch
+
+    def invalidate(self, overlay_ids: Optional[Iterable[int]] = None):
+        with self._lock:
+            if overlay_ids is None:
+                self._entries.clear()
+                return
+            for oid in overlay_ids:
+                self._entries.pop(oid, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+index = BookingIndex(
+    enabled=settings.booking_index_enabled,
+    max_overlays=settings.booking_index_max_overlays,
+    horizon=timedelta(hours=settings.booking_index_horizon_hours),
+)
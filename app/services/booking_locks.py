@@ -0,0 +1,10 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+#first key of the two-int advisory lock form, keeps booking locks apart from any other advisory lock users
+BOOKING_LOCK_NAMESPACE = 0x626b   #'bk'
+
+def lock_overlay(db: Session, overlay_id: int):
+    #transaction-scoped: released on commit/rollback, so the overlap check and the insert
+    #run serialized per room while bookings of different rooms never wait on each other
+    db.execute(text("SELECT pg_advisory_xact_lock(:ns, :key)"), {"ns": BOOKING_LOCK_NAMESPACE, "key": overlay_id})
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Dict, Optional, Set
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+
+#Live floor plan edits for connected editors (GET /ws/floorplans/{id}).
+#Writers call enqueue() inside their transaction, which adds a pg_notify so every other worker hears
+#about the change exactly when (and only if) it commits, then broadcast() after the commit to reach
+#this worker's own subscribers without the database round trip. Each worker LISTENs on one asyncpg
+#connection and fans notifications from other workers out to its local subscribers.
+#
+#Messages are JSON objects:
+#   {"type": "hello", "floor_plan_id", "version"}                          on connect
+#   {"type": "patch", "floor_plan_id", "version", "base", "added", "updated", "removed", "user_id", "ts"}
+#   {"type": "version", "floor_plan_id", "version", "base", "user_id", "ts"}  patch too big for NOTIFY, fetch it
+#   {"type": "resync", "floor_plan_id"}                                     events were dropped, reload the floor
+#Broadcasts from different request threads can arrive out of order, clients apply patches by version.
+
+CHANNEL = "floorplan_events"
+NOTIFY_LIMIT = 7900     #Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+WORKER_ID = uuid.uuid4().hex[:12]
+
+def _forked():
+    #workers forked from one preloaded app must not mistake each other's notifications for their own
+    global WORKER_ID
+    WORKER_ID = uuid.uuid4().hex[:12]
+
+os.register_at_fork(after_in_child=_forked)
+
+def patch_event(floor_plan_id: int, version: int, added=(), updated=(), removed=(), user_id=None) -> dict:
+    return {"type": "patch", "floor_plan_id": floor_plan_id, "version": version, "base": version - 1,
+            "added": list(added), "updated": list(updated), "removed": list(removed), "user_id": user_id}
+
+class Subscriber:
+    def __init__(self, floor_plan_id: int, max_queue: int):
+        self.floor_plan_id = floor_plan_id
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            #a client that can't keep up gets one resync instead of an ever growing backlog
+            self.dropped += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(json.dumps({"type": "resync", "floor_plan_id": self.floor_plan_id}))
+
+class Hub:
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._floors: Dict[int, Set[Subscriber]] = {}
+        self.published = 0
+        self.received = 0
+        self.delivered = 0
+
+    #subscribe/unsubscribe/fanout only run on the event loop, no lock needed
+    def subscribe(self, floor_plan_id: int) -> Subscriber:
+        sub = Subscriber(floor_plan_id, self.max_queue)
+        self._floors.setdefault(floor_plan_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        subs = self._floors.get(sub.floor_plan_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._floors[sub.floor_plan_id]
+
+    def fanout(self, floor_plan_id: int, message: str):
+        #serialized once, the same string goes to every subscriber
+        for sub in list(self._floors.get(floor_plan_id, ())):
+            sub.offer(message)
+            self.delivered += 1
+
+    def resync_all(self):
+        for floor_plan_id in list(self._floors):
+            self.fanout(floor_plan_id, json.dumps({"type": "resync", "floor_plan_id": floor_plan_id}))
+
+    def stats(self):
+        return {
+            "worker": WORKER_ID,
+            "floors": len(self._floors),
+            "subscribers": sum(len(s) for s in self._floors.values()),
+            "published": self.published,
+            "received": self.received,
+            "delivered": self.delivered,
+            "listening": _listener is not None and not _listener.done(),
+        }
+
+hub = Hub(settings.collab_queue_size)
+
+def enqueue(db: Session, event: dict) -> dict:
+    #part of the caller's transaction; pass the result to broadcast() after the commit
+    event = {**event, "ts": time.time()}
+    payload = json.dumps({**event, "origin": WORKER_ID}, separators=(",", ":"), default=str)
+    if len(payload.encode()) > NOTIFY_LIMIT:
+        #other workers only learn the new version, their clients fetch GET /floorplans/{id}/versions/{version}
+        slim = {k: event[k] for k in ("floor_plan_id", "version", "base", "user_id", "ts")}
+        payload = json.dumps({"type": "version", **slim, "origin": WORKER_ID}, separators=(",", ":"))
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+    return event
+
+def broadcast(event: dict):
+    #callable from request threads; delivery happens on the event loop
+    hub.published += 1
+    loop = hub.loop
+    if loop is None or loop.is_closed():
+        return
+    message = json.dumps(event, separators=(",", ":"), default=str)
+    loop.call_soon_threadsafe(hub.fanout, event["floor_plan_id"], message)
+
+def _on_notify(connection, pid, channel, payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+    if event.pop("origin", None) == WORKER_ID:
+        return      #already delivered by broadcast()
+    hub.received += 1
+    hub.fanout(event["floor_plan_id"], json.dumps(event, separators=(",", ":")))
+
+async def _listen():
+    import asyncpg
+
+    delay, connected_before = 1, False
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(host=settings.database_hostname, port=int(settings.database_port), user=settings.database_username,
+                                         password=settings.database_password, database=settings.database_name)
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda c: lost.set())
+            await conn.add_listener(CHANNEL, _on_notify)
+            if connected_before:
+                #notifications sent while we were disconnected are gone
+                hub.resync_all()
+            connected_before, delay = True, 1
+            await lost.wait()
+        except asyncio.CancelledError:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+            raise
+        except (OSError, asyncpg.PostgresError) as e:
+            print(f"[collab] listener failed: {type(e).__name__}: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+_listener: Optional[asyncio.Task] = None
+
+async def start():
+    global _listener
+    hub.loop = asyncio.get_running_loop()
+    if settings.collab_listen and _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+async def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
+    hub.loop = None
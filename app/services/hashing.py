@@ -0,0 +1,38 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import utils
+from ..config import settings
+
+#argon2 runs in C and releases the GIL, so a small thread pool hashes in parallel while the event
+#loop keeps serving. Work beyond the queue limit is refused (HashingBusy -> 503) instead of piling up.
+
+class HashingBusy(Exception):
+    pass
+
+_pool = ThreadPoolExecutor(max_workers=settings.hash_pool_size, thread_name_prefix="argon2")
+_lock = threading.Lock()
+_pending = 0
+
+async def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= settings.hash_pool_size + settings.hash_queue_limit:
+            raise HashingBusy()
+        _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+    finally:
+        with _lock:
+            _pending -= 1
+
+async def hash(password: str) -> str:
+    return await _run(utils.hash, password)
+
+async def verify(plain_password: str, hashed_password: str) -> bool:
+    return await _run(utils.verify, plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    #true for hashes made with older argon2 cost settings
+    return utils.pwd_context.needs_update(hashed_password)
@@ -0,0 +1,155 @@
+import io
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from PIL import Image
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..config import settings
+from . import analytics
+
+#Utilization heatmap of a floor plan: every overlay's booked share of the window (from the hourly
+#occupancy rollups, one aggregate query) painted into its rectangle on a canvas aligned to the floor
+#plan image, colour-mapped and encoded as an RGBA PNG (transparent where there is no overlay) to lay
+#over the plan or its tiles. Large plans are rendered at a power-of-two reduction, the same levels as
+#the tile pyramid. PNGs are cached per (floor plan, version, booking epochs, window).
+
+#green -> yellow -> red, interpolated into a 256 entry lookup table
+COLOR_STOPS = [(0.0, (26, 152, 80)), (0.5, (254, 224, 139)), (1.0, (215, 48, 39))]
+ALPHA = 170
+
+def _colormap() -> np.ndarray:
+    pos = np.array([p for p, _ in COLOR_STOPS])
+    colors = np.array([c for _, c in COLOR_STOPS], dtype=np.float64)
+    t = np.linspace(0, 1, 256)
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for ch in range(3):
+        lut[:, ch] = np.round(np.interp(t, pos, colors[:, ch]))
+    lut[:, 3] = ALPHA
+    return lut
+
+LUT = _colormap()
+
+def scale_for(width: int, height: int, max_size: int) -> int:
+    #smallest power of two that brings the longer side within max_size
+    return 2 ** max(0, math.ceil(math.log2(max(width, height) / max_size))) if max(width, height) > max_size else 1
+
+def cache_token(db: Session, floor_plan_id: int):
+    #(version, sum of booking epochs): overlay edits bump the first, every booking write on the floor the second
+    row = db.execute(select(tablesmodel.FloorPlan.version, select(func.coalesce(func.sum(tablesmodel.Overlay.booking_epoch), 0)).where(
+        tablesmodel.Overlay.floor_plan_id == floor_plan_id).scalar_subquery()).where(tablesmodel.FloorPlan.id == floor_plan_id)).first()
+    return None if row is None else (row[0], int(row[1]))
+
+def overlay_utilization(db: Session, floor_plan_id: int, window: analytics.Window):
+    #geometry of the floor's overlays and their utilization (0..1) over the window's counted hours
+    rows = db.execute(select(tablesmodel.Overlay.id, tablesmodel.Overlay.x, tablesmodel.Overlay.y, tablesmodel.Overlay.width,
+                             tablesmodel.Overlay.height).where(tablesmodel.Overlay.floor_plan_id == floor_plan_id).order_by(tablesmodel.Overlay.id)).all()
+    geo = np.array(rows, dtype=np.int64).reshape(-1, 5)
+    util = np.zeros(len(geo), dtype=np.float64)
+    available = float(window.slots().sum()) * 3600
+    if len(geo) and available:
+        ids = geo[:, 0]
+        booked = db.execute(window.rollups_where(select(tablesmodel.OccupancyHourly.overlay_id, func.sum(tablesmodel.OccupancyHourly.booked_seconds)),
+                                                 ids.tolist()).group_by(tablesmodel.OccupancyHourly.overlay_id)).all()
+        if booked:
+            data = np.array(booked, dtype=np.float64)
+            pos = np.minimum(np.searchsorted(ids, data[:, 0].astype(np.int64)), len(ids) - 1)
+            known = ids[pos] == data[:, 0]
+            util[pos[known]] = np.clip(data[known, 1] / available, 0, 1)
+    return geo, util
+
+def rasterize(geo: np.ndarray, util: np.ndarray, width: int, height: int, scale: int) -> np.ndarray:
+    #canvas of utilization per pixel, NaN where no overlay; overlapping overlays show the smallest
+    #(a desk over its room), as hit-testing picks it: larger rectangles are painted first
+    w, h = -(-width // scale), -(-height // scale)
+    canvas = np.full((h, w), np.nan, dtype=np.float32)
+    if not len(geo):
+        return canvas
+    x, y, gw, gh = geo[:, 1], geo[:, 2], geo[:, 3], geo[:, 4]
+    x0 = np.clip(np.minimum(x, x + gw) // scale, 0, w)
+    x1 = np.clip(-(-np.maximum(x, x + gw) // scale), 0, w)
+    y0 = np.clip(np.minimum(y, y + gh) // scale, 0, h)
+    y1 = np.clip(-(-np.maximum(y, y + gh) // scale), 0, h)
+    visible = np.flatnonzero((x1 > x0) & (y1 > y0))
+    for i in visible[np.argsort(-((x1 - x0) * (y1 - y0))[visible], kind="stable")]:
+        canvas[y0[i]:y1[i], x0[i]:x1[i]] = util[i]
+    return canvas
+
+def colorize(canvas: np.ndarray) -> np.ndarray:
+    covered = ~np.isnan(canvas)
+    index = np.zeros(canvas.shape, dtype=np.uint8)
+    index[covered] = np.round(canvas[covered] * 255).astype(np.uint8)
+    rgba = LUT[index]
+    rgba[~covered, 3] = 0
+    return rgba
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buf, format="PNG", compress_level=settings.tiles_png_compress_level)
+    return buf.getvalue()
+
+class HeatmapCache:
+    #LRU bounded by the PNG bytes held, like overlay_snapshots
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry: tuple):
+        #entry is (png bytes, scale)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = entry
+            self._size += len(entry[0])
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+cache = HeatmapCache(settings.heatmap_cache_bytes)
+
+def render(db: Session, fp: tablesmodel.FloorPlan, window: analytics.Window, token: tuple, max_size: int):
+    #(png bytes, scale); pixel (px, py) covers image pixels [px*scale, (px+1)*scale) on each axis
+    key = (fp.id, token, window.start, window.end, window.day_start, window.day_end, window.weekdays_only, window.tz, max_size)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    geo, util = overlay_utilization(db, fp.id, window)
+    width, height = fp.image_width, fp.image_height
+    if not width or not height:
+        #not a raster upload (e.g. PDF before processing): the overlays' extent
+        width = int(max(1, (np.maximum(geo[:, 1], geo[:, 1] + geo[:, 3])).max())) if len(geo) else 1
+        height = int(max(1, (np.maximum(geo[:, 2], geo[:, 2] + geo[:, 4])).max())) if len(geo) else 1
+    scale = scale_for(width, height, max_size)
+    entry = (encode_png(colorize(rasterize(geo, util, width, height, scale))), scale)
+    cache.put(key, entry)
+    return entry
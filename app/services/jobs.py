@@ -0,0 +1,240 @@
+import hashlib
+import multiprocessing
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import select, update
+
+from .. import tablesmodel
+from ..config import settings
+from ..database import sessionLocal
+
+#Durable post-upload processing. Jobs are rows in processing_jobs (so nothing is lost when a
+#worker restarts). Each API worker runs up to JOB_POOL_SIZE of them at a time: a runner thread
+#claims a queued job, runs its body in a child process of its own (with its own DB session) and
+#kills that process if it is still running JOB_TIMEOUT_SECONDS after the claim.
+
+FLOORPLAN_PROCESSING = "floorplan_processing"
+KILL_GRACE_SECONDS = 5     #between SIGTERM and SIGKILL of a job process
+
+#spawn, not fork: the API worker has threads and open connections a forked child must not share
+_mp = multiprocessing.get_context("spawn")
+_queue: Optional[queue.Queue] = None
+_runners: List[threading.Thread] = []
+_running: Dict[int, multiprocessing.Process] = {}
+_stopping = threading.Event()
+_lock = threading.Lock()
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _set_job(job_id: int, only_if_running: bool = False, **values) -> bool:
+    with sessionLocal() as db:
+        stmt = update(tablesmodel.ProcessingJob).where(tablesmodel.ProcessingJob.id == job_id)
+        if only_if_running:
+            stmt = stmt.where(tablesmodel.ProcessingJob.status == "running")
+        updated = db.execute(stmt.values(updated_at=_now(), **values)).rowcount
+        db.commit()
+        return updated > 0
+
+def _fail(job_id: int, floor_plan_id: int, error: str):
+    #only a job that is still running fails, and only then does its floor plan
+    if not _set_job(job_id, only_if_running=True, status="failed", error=error[:500], finished_at=_now()):
+        return
+    with sessionLocal() as db:
+        db.execute(update(tablesmodel.FloorPlan).where(tablesmodel.FloorPlan.id == floor_plan_id).values(processing_status="failed"))
+        db.commit()
+
+def _claim(job_id: int) -> bool:
+    #several API workers may resubmit the same queued job on startup, only one gets to run it
+    with sessionLocal() as db:
+        claimed = db.execute(update(tablesmodel.ProcessingJob).where(
+            tablesmodel.ProcessingJob.id == job_id, tablesmodel.ProcessingJob.status == "queued"
+        ).values(status="running", started_at=_now(), updated_at=_now(), attempts=tablesmodel.ProcessingJob.attempts + 1
+        ).returning(tablesmodel.ProcessingJob.id)).first()
+        db.commit()
+        return claimed is not None
+
+#--- job body, runs in the job's child process ---
+
+def _rasterize_pdf(data: bytes):
+    #first page only; optional dependency, PDFs stay without a pyramid when it is missing
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    pdf = pypdfium2.PdfDocument(data)
+    try:
+        return pdf[0].render(scale=settings.pdf_raster_dpi / 72).to_pil()
+    finally:
+        pdf.close()
+
+def _suggest_pixels_per_meter(dpi) -> Optional[float]:
+    #a scan at `dpi` of a drawing at 1:drawing_scale covers drawing_scale real meters per printed meter
+    if not dpi or not dpi[0]:
+        return None
+    return round(float(dpi[0]) / 0.0254 / settings.drawing_scale, 3)
+
+def process_floorplan(job_id: int, floor_plan_id: int):
+    #the job has been claimed by the runner that started this process
+    from . import storage, tiles
+
+    with sessionLocal() as db:
+        fp = db.get(tablesmodel.FloorPlan, floor_plan_id)
+        if fp is None:
+            _set_job(job_id, only_if_running=True, status="failed", error="floorplan deleted", finished_at=_now())
+            return
+        image_path, sha256 = fp.image_path, fp.file_sha256
+
+    def step(name: str, progress: int):
+        _set_job(job_id, only_if_running=True, step=name, progress=progress)
+
+    backend = storage.get_backend()
+    step("hashing", 5)
+    data = backend.get_bytes(image_path)
+    actual = hashlib.sha256(data).hexdigest()
+    result = {"sha256_verified": sha256 in (None, actual)}
+    values = {"file_sha256": actual, "processing_status": "ready"}
+
+    step("decoding", 15)
+    if image_path.lower().endswith(".pdf"):
+        img = _rasterize_pdf(data)
+        dpi = (settings.pdf_raster_dpi, settings.pdf_raster_dpi) if img is not None else None
+    else:
+        img = tiles.open_image(data)
+        dpi = img.info.get("dpi") if img is not None else None
+    del data
+
+    result["suggested_pixels_per_meter"] = values["suggested_pixels_per_meter"] = _suggest_pixels_per_meter(dpi)
+
+    if img is not None:
+        last = [0]
+
+        def tile_progress(done: int, total: int):
+            #tiles are 20..95% of the job, reported in 5% steps to keep DB writes low
+            pct = 20 + int(75 * done / total)
+            if pct - last[0] >= 5:
+                last[0] = pct
+                step("tiling", pct)
+
+        pyramid = tiles.build_pyramid(backend, actual, tiles.to_array(img), progress=tile_progress)
+        values.update(image_width=pyramid.width, image_height=pyramid.height, tile_max_zoom=pyramid.max_zoom)
+        result.update(width=pyramid.width, height=pyramid.height, max_zoom=pyramid.max_zoom)
+
+    with sessionLocal() as db:
+        db.execute(update(tablesmodel.FloorPlan).where(tablesmodel.FloorPlan.id == floor_plan_id).values(**values))
+        db.commit()
+    _set_job(job_id, only_if_running=True, status="done", step="done", progress=100, result=result, finished_at=_now())
+
+def _child(job_id: int, floor_plan_id: int):
+    try:
+        process_floorplan(job_id, floor_plan_id)
+    except Exception as e:
+        _fail(job_id, floor_plan_id, f"{type(e).__name__}: {e}")
+
+#--- API worker side ---
+
+def _run(job_id: int, floor_plan_id: int):
+    #claimed here, so the timeout counts from when the job starts, not from when it was queued;
+    #several API workers may hold the same queued job (resubmitted on startup), only one claims it
+    if not _claim(job_id):
+        return
+    proc = _mp.Process(target=_child, args=(job_id, floor_plan_id), name=f"job-{job_id}", daemon=True)
+    with _lock:
+        stopping = _stopping.is_set()
+        if not stopping:
+            proc.start()
+            _running[job_id] = proc
+    if stopping:
+        _set_job(job_id, only_if_running=True, status="queued")
+        return
+    try:
+        proc.join(settings.job_timeout_seconds)
+        timed_out = proc.is_alive()
+        if timed_out:
+            proc.terminate()
+            proc.join(KILL_GRACE_SECONDS)
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+    finally:
+        with _lock:
+            _running.pop(job_id, None)
+    if _stopping.is_set():
+        #killed by shutdown(), which put the job back in the queue
+        return
+    if timed_out:
+        _fail(job_id, floor_plan_id, f"timed out after {settings.job_timeout_seconds}s")
+    elif proc.exitcode != 0:
+        #errors raised by the job body already failed it, this is a crash (e.g. out of memory)
+        _fail(job_id, floor_plan_id, f"job process exited with code {proc.exitcode}")
+
+def _runner(jobs: queue.Queue):
+    while True:
+        item = jobs.get()
+        if item is None:
+            return
+        try:
+            _run(*item)
+        except Exception as e:
+            #left queued (or running, recovered on a later start) for another try
+            print(f"[jobs] could not run job {item[0]}: {type(e).__name__}: {e}")
+
+def start():
+    global _queue, _runners
+    with _lock:
+        if _queue is not None:
+            return
+        _stopping.clear()
+        _queue = queue.Queue()
+        _runners = [threading.Thread(target=_runner, args=(_queue,), name=f"job-runner-{i}", daemon=True) for i in range(settings.job_pool_size)]
+        for t in _runners:
+            t.start()
+
+    #resume queued jobs, and jobs whose runner died mid-way (claimed longer ago than the timeout)
+    stale = _now() - timedelta(seconds=settings.job_timeout_seconds + KILL_GRACE_SECONDS)
+    with sessionLocal() as db:
+        db.execute(update(tablesmodel.ProcessingJob).where(
+            tablesmodel.ProcessingJob.status == "running", tablesmodel.ProcessingJob.started_at < stale
+        ).values(status="queued"))
+        db.commit()
+        pending = db.execute(select(tablesmodel.ProcessingJob.id, tablesmodel.ProcessingJob.floor_plan_id).where(
+            tablesmodel.ProcessingJob.status == "queued")).all()
+    for job_id, floor_plan_id in pending:
+        submit(job_id, floor_plan_id)
+
+def shutdown():
+    #running jobs are killed and queued again for the next worker to start
+    global _queue, _runners
+    with _lock:
+        if _queue is None:
+            return
+        _stopping.set()
+        for _ in _runners:
+            _queue.put(None)
+        running = list(_running.items())
+        runners, _queue, _runners = _runners, None, []
+    for job_id, proc in running:
+        proc.terminate()
+    for job_id, proc in running:
+        proc.join(KILL_GRACE_SECONDS)
+        if proc.is_alive():
+            proc.kill()
+        _set_job(job_id, only_if_running=True, status="queued", step="queued", progress=0)
+    for t in runners:
+        t.join(timeout=KILL_GRACE_SECONDS)
+
+def enqueue_floorplan_processing(db, fp: tablesmodel.FloorPlan) -> tablesmodel.ProcessingJob:
+    #part of the caller's transaction; call submit() once it has committed
+    job = tablesmodel.ProcessingJob(floor_plan_id=fp.id, kind=FLOORPLAN_PROCESSING, status="queued", progress=0, step="queued")
+    db.add(job)
+    return job
+
+def submit(job_id: int, floor_plan_id: int):
+    #never raises: the job is committed, if this worker cannot run it the row stays queued for the next start
+    jobs = _queue
+    if jobs is None:
+        #no runners in this process (e.g. a script, or shutting down)
+        return
+    jobs.put((job_id, floor_plan_id))
@@ -0,0 +1,170 @@
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel, utils
+from ..config import settings
+from ..database import sessionLocal
+
+#Email outbox: handlers only insert a row (in their own transaction), a sender drains the table in
+#batches over one persistent SMTP connection and retries failures with exponential backoff.
+#The sender runs as a thread in the API worker (EMAIL_SENDER_ENABLED) or as its own process:
+#    python -m app.services.mailer
+#Bodies are cleared once a message is sent or given up on. Messages carrying a secret (reset codes) are
+#enqueued with expires_after: unsent once that passes, they are dropped and their body purged.
+
+def enqueue(db: Session, recipient: str, subject: str, html: str, expires_after: Optional[float] = None):
+    #part of the caller's transaction; call notify() after the commit
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_after) if expires_after is not None else None
+    db.add(tablesmodel.EmailOutbox(recipient=recipient, subject=subject, html=html, status="pending", expires_at=expires_at))
+
+def notify():
+    #wake this worker's sender instead of waiting for its next poll
+    _wakeup.set()
+
+class SMTPConnection:
+    #one authenticated connection reused across messages, reopened when the server drops it or it sat idle
+    def __init__(self, host: str, port: int, starttls: bool, username: Optional[str], password: Optional[str], idle_seconds: float):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.idle_seconds = idle_seconds
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def send(self, sender: str, recipient: str, message: str):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.sendmail(sender, recipient, message)
+        except smtplib.SMTPServerDisconnected:
+            #stale connection: reconnect once and retry
+            self._smtp = None
+            self._connect()
+            self._smtp.sendmail(sender, recipient, message)
+        self._last_used = time.monotonic()
+
+def connection_from_settings() -> SMTPConnection:
+    return SMTPConnection(settings.smtp_host, settings.smtp_port, settings.smtp_starttls,
+                          settings.smtp_username or settings.email, settings.smtp_password, settings.smtp_idle_seconds)
+
+def drain_once(db: Session, conn: SMTPConnection) -> int:
+    now = datetime.now(timezone.utc)
+    #SKIP LOCKED lets several senders drain the same table without sending a message twice
+    batch = db.scalars(select(tablesmodel.EmailOutbox).where(
+        tablesmodel.EmailOutbox.status == "pending", tablesmodel.EmailOutbox.next_attempt_at <= now,
+        or_(tablesmodel.EmailOutbox.expires_at.is_(None), tablesmodel.EmailOutbox.expires_at > now)
+    ).order_by(tablesmodel.EmailOutbox.id).limit(settings.email_batch_size).with_for_update(skip_locked=True)).all()
+
+    for msg in batch:
+        try:
+            conn.send(settings.email, msg.recipient, utils.build_message(msg.subject, msg.recipient, msg.html))
+        except (smtplib.SMTPException, OSError) as e:
+            conn.close()
+            msg.attempts += 1
+            msg.last_error = f"{type(e).__name__}: {e}"[:500]
+            if msg.attempts >= settings.email_max_attempts:
+                msg.status = "failed"
+                msg.html = None
+            else:
+                backoff = min(settings.email_retry_base_seconds * 2 ** (msg.attempts - 1), settings.email_retry_max_seconds)
+                msg.next_attempt_at = now + timedelta(seconds=backoff)
+            continue
+        msg.status = "sent"
+        msg.sent_at = datetime.now(timezone.utc)
+        msg.html = None     #the body is not needed once delivered
+
+    db.commit()
+    return len(batch)
+
+def purge_expired(batch_size: int) -> int:
+    #expired messages with a secret in the body, whether or not a sender is running; returns how many
+    total = 0
+    while True:
+        expired = select(tablesmodel.EmailOutbox.id).where(
+            tablesmodel.EmailOutbox.expires_at <= func.now(), tablesmodel.EmailOutbox.html.is_not(None)
+        ).limit(batch_size).with_for_update(skip_locked=True)
+        with sessionLocal() as db:
+            n = db.execute(update(tablesmodel.EmailOutbox).where(tablesmodel.EmailOutbox.id.in_(expired)).values(
+                status="expired", html=None)).rowcount
+            db.commit()
+        total += n
+        if n < batch_size:
+            return total
+
+_wakeup = threading.Event()
+
+class OutboxSender(threading.Thread):
+    def __init__(self):
+        super().__init__(name="email-outbox", daemon=True)
+        self._stopping = threading.Event()
+        self.conn = connection_from_settings()
+        self.sent = 0
+
+    def run(self):
+        while not self._stopping.is_set():
+            _wakeup.clear()
+            try:
+                with sessionLocal() as db:
+                    n = drain_once(db, self.conn)
+                self.sent += n
+            except Exception as e:
+                #DB hiccups must not kill the sender, the rows are still there next round
+                print(f"[mailer] drain failed: {type(e).__name__}: {e}")
+                n = 0
+            if n < settings.email_batch_size:
+                #caught up: sleep until a local enqueue or the next poll (for rows enqueued by other workers)
+                _wakeup.wait(settings.email_poll_seconds)
+        self.conn.close()
+
+    def stop(self):
+        self._stopping.set()
+        _wakeup.set()
+
+_sender: Optional[OutboxSender] = None
+
+def start():
+    global _sender
+    if settings.email_sender_enabled and _sender is None:
+        _sender = OutboxSender()
+        _sender.start()
+
+def shutdown():
+    global _sender
+    if _sender is not None:
+        _sender.stop()
+        _sender.join(timeout=10)
+        _sender = None
+
+if __name__ == "__main__":
+    sender = OutboxSender()
+    sender.start()
+    try:
+        sender.join()
+    except KeyboardInterrupt:
+        sender.stop()
+        sender.join()
@@ -0,0 +1,180 @@
+import abc
+import hashlib
+import hmac
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+from sqlalchemy import and_, case, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel, utils
+from ..config import settings
+from ..database import sessionLocal
+from . import mailer
+
+#Password reset codes: one live code per email (a new one replaces it), valid for OTP_TTL_SECONDS. The
+#OTP_MAX_ATTEMPTS guesses belong to the email, not to the code: a resend within the TTL keeps the count,
+#and once they are used up the email stays locked until the code expires: no new code is issued (or mailed).
+#Only an HMAC of the code is kept, compared in constant time; a check is one unique index probe. Expired
+#codes are deleted in batches by a sweeper thread in each worker. OTP_BACKEND=memory keeps them in a dict
+#instead, for deployments with a single worker process (codes are lost on restart). The sweeper also purges
+#reset mails that expired unsent, the outbox is the one place a code is stored in clear.
+
+VALID, MISSING, INVALID, LOCKED = "valid", "missing", "invalid", "locked"
+
+def digest(email: str, code: str) -> str:
+    return hmac.new(settings.secret_key.encode(), f"{email}\0{code}".encode(), hashlib.sha256).hexdigest()
+
+class OTPStore(abc.ABC):
+    @abc.abstractmethod
+    def issue(self, db: Session, email: str) -> Optional[str]:
+        #new code for email, replacing any earlier one; None while the email is locked (nothing to send);
+        #part of the caller's transaction
+        ...
+
+    @abc.abstractmethod
+    def verify(self, db: Session, email: str, code: str) -> str:
+        #VALID (and the code is used up), MISSING (none or expired), INVALID or LOCKED (out of attempts);
+        #the caller commits whatever the outcome, the attempt counts
+        ...
+
+    @abc.abstractmethod
+    def sweep(self, batch_size: int) -> int:
+        #delete expired codes, returns how many
+        ...
+
+class DatabaseOTPStore(OTPStore):
+    def issue(self, db: Session, email: str) -> Optional[str]:
+        code = utils.generate_otp()
+        OTP = tablesmodel.OTP
+        values = {"otp_hash": digest(email, code), "expires_at": func.now() + timedelta(seconds=settings.otp_ttl_seconds), "created_at": func.now()}
+        live = OTP.expires_at > func.now()
+        #on conflict the OTP columns are the earlier code's row: a locked one is left alone (no row returned)
+        row = db.execute(pg_insert(OTP).values(email=email, attempts=0, **values).on_conflict_do_update(
+            index_elements=[OTP.email], set_={**values, "attempts": case((live, OTP.attempts), else_=0)},
+            where=~and_(live, OTP.attempts >= settings.otp_max_attempts)).returning(OTP.id)).first()
+        return code if row is not None else None
+
+    def verify(self, db: Session, email: str, code: str) -> str:
+        #count the attempt before comparing: concurrent guesses cannot get past the limit
+        row = db.execute(update(tablesmodel.OTP).where(tablesmodel.OTP.email == email, tablesmodel.OTP.expires_at > func.now()).values(
+            attempts=tablesmodel.OTP.attempts + 1).returning(tablesmodel.OTP.otp_hash, tablesmodel.OTP.attempts)).first()
+        if row is None:
+            return MISSING
+        otp_hash, attempts = row
+        if attempts > settings.otp_max_attempts:
+            return LOCKED
+        if hmac.compare_digest(otp_hash, digest(email, code)):
+            db.execute(delete(tablesmodel.OTP).where(tablesmodel.OTP.email == email))
+            return VALID
+        #a locked row stays until it expires, deleting it would hand out a fresh budget on the next resend
+        return LOCKED if attempts >= settings.otp_max_attempts else INVALID
+
+    def sweep(self, batch_size: int) -> int:
+        #short transactions; workers sweeping at the same time skip each other's rows
+        total = 0
+        while True:
+            expired = select(tablesmodel.OTP.id).where(tablesmodel.OTP.expires_at <= func.now()).order_by(
+                tablesmodel.OTP.expires_at).limit(batch_size).with_for_update(skip_locked=True)
+            with sessionLocal() as db:
+                n = db.execute(delete(tablesmodel.OTP).where(tablesmodel.OTP.id.in_(expired))).rowcount
+                db.commit()
+            total += n
+            if n < batch_size:
+                return total
+
+class MemoryOTPStore(OTPStore):
+    def __init__(self):
+        self._codes: Dict[str, list] = {}     #email -> [hash, expires (monotonic), attempts]
+        self._lock = threading.Lock()
+
+    def issue(self, db: Session, email: str) -> Optional[str]:
+        code = utils.generate_otp()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._codes.get(email)
+            if entry is None or entry[1] <= now:
+                self._codes[email] = [digest(email, code), now + settings.otp_ttl_seconds, 0]
+            elif entry[2] >= settings.otp_max_attempts:
+                return None
+            else:
+                entry[0], entry[1] = digest(email, code), now + settings.otp_ttl_seconds
+        return code
+
+    def verify(self, db: Session, email: str, code: str) -> str:
+        with self._lock:
+            entry = self._codes.get(email)
+            if entry is None or entry[1] <= time.monotonic():
+                return MISSING
+            entry[2] += 1
+            if entry[2] > settings.otp_max_attempts:
+                return LOCKED
+            if hmac.compare_digest(entry[0], digest(email, code)):
+                del self._codes[email]
+                return VALID
+            return LOCKED if entry[2] >= settings.otp_max_attempts else INVALID
+
+    def sweep(self, batch_size: int) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [email for email, entry in self._codes.items() if entry[1] <= now]
+        total = 0
+        for i in range(0, len(expired), batch_size):
+            #a batch per lock hold, so verify() never waits behind the whole sweep
+            with self._lock:
+                for email in expired[i:i + batch_size]:
+                    entry = self._codes.get(email)
+                    if entry is not None and entry[1] <= now:
+                        del self._codes[email]
+                        total += 1
+        return total
+
+_store: Optional[OTPStore] = None
+
+def create_store() -> OTPStore:
+    if settings.otp_backend == "database":
+        return DatabaseOTPStore()
+    if settings.otp_backend == "memory":
+        return MemoryOTPStore()
+    raise RuntimeError(f"Unknown OTP_BACKEND: {settings.otp_backend}")
+
+def get_store() -> OTPStore:
+    global _store
+    if _store is None:
+        _store = create_store()
+    return _store
+
+class Sweeper(threading.Thread):
+    def __init__(self):
+        super().__init__(name="otp-sweeper", daemon=True)
+        self._stopping = threading.Event()
+        self.deleted = 0
+
+    def run(self):
+        while not self._stopping.wait(settings.otp_sweep_interval_seconds):
+            try:
+                self.deleted += get_store().sweep(settings.otp_sweep_batch_size)
+                mailer.purge_expired(settings.otp_sweep_batch_size)
+            except Exception as e:
+                #the next round retries, expired codes are already rejected by verify()
+                print(f"[otp] sweep failed: {type(e).__name__}: {e}")
+
+    def stop(self):
+        self._stopping.set()
+
+_sweeper: Optional[Sweeper] = None
+
+def start():
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = Sweeper()
+        _sweeper.start()
+
+def shutdown():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.stop()
+        _sweeper.join(timeout=10)
+        _sweeper = None
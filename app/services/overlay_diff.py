@@ -0,0 +1,62 @@
+from typing import Dict, List, Sequence
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+
+#columns a client can edit; everything else (ids, audit columns, booking epoch) is server owned
+OVERLAY_FIELDS = ("type", "label", "capacity", "x", "y", "width", "height", "props")
+
+class UnknownOverlays(Exception):
+    def __init__(self, ids: Sequence[int]):
+        super().__init__(f"Overlays not found on this floorplan: {sorted(ids)}")
+        self.ids = sorted(ids)
+
+class OverlayDiff:
+    def __init__(self, inserts: List[dict], updates: List[dict], deletes: List[int]):
+        self.inserts = inserts      #field dicts without id, in payload order
+        self.updates = updates      #field dicts with id, only rows that actually changed
+        self.deletes = deletes      #ids no longer present in the payload
+
+    def is_empty(self):
+        return not (self.inserts or self.updates or self.deletes)
+
+def load_overlay_fields(db: Session, floor_plan_id: int) -> Dict[int, dict]:
+    columns = [getattr(tablesmodel.Overlay, f) for f in OVERLAY_FIELDS]
+    rows = db.execute(select(tablesmodel.Overlay.id, *columns).where(tablesmodel.Overlay.floor_plan_id == floor_plan_id))
+    return {row.id: {f: getattr(row, f) for f in OVERLAY_FIELDS} for row in rows}
+
+def compute_diff(existing: Dict[int, dict], incoming: Sequence[dict]) -> OverlayDiff:
+    inserts, updates, seen, unknown = [], [], set(), set()
+
+    for ov in incoming:
+        fields = {f: ov.get(f) for f in OVERLAY_FIELDS}
+        oid = ov.get("id")
+        if oid is None:
+            inserts.append(fields)
+            continue
+        if oid not in existing or oid in seen:
+            unknown.add(oid)
+            continue
+        seen.add(oid)
+        if fields != existing[oid]:
+            updates.append({"id": oid, **fields})
+
+    if unknown:
+        raise UnknownOverlays(unknown)
+
+    deletes = [oid for oid in existing if oid not in seen]
+    return OverlayDiff(inserts, updates, deletes)
+
+def apply_diff(db: Session, floor_plan_id: int, diff: OverlayDiff, created_by=None) -> List[int]:
+    #bulk statements inside the caller's transaction; returns the ids of the inserted rows in payload order
+    if diff.deletes:
+        db.execute(delete(tablesmodel.Overlay).where(tablesmodel.Overlay.id.in_(diff.deletes)).execution_options(synchronize_session=False))
+    if diff.updates:
+        db.execute(update(tablesmodel.Overlay), diff.updates)
+    if not diff.inserts:
+        return []
+
+    rows = [{**fields, "floor_plan_id": floor_plan_id, "created_by": created_by} for fields in diff.inserts]
+    stmt = insert(tablesmodel.Overlay).returning(tablesmodel.Overlay.id, sort_by_parameter_order=True)
+    return list(db.scalars(stmt, rows).all())
@@ -0,0 +1,150 @@
+import asyncio
+import glob
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..config import settings
+
+#A floor's full overlay list serialized once per committed version, as the JSON array bytes of
+#OverlayOut objects. Readers of the whole floor (the editor load, the 409 of a stale save) get these
+#bytes as-is instead of building an ORM object and a Pydantic model per overlay. Entries are keyed by
+#(floor_plan_id, version) and built on first read of that version; they live in a per-worker LRU
+#bounded by bytes and, with OVERLAY_SNAPSHOT_DIR, in files shared by the workers of a host.
+
+COLUMNS = ("id", "floor_plan_id", "type", "label", "capacity", "x", "y", "width", "height", "props", "created_by", "created_at")
+
+def _overlays_stmt(floor_plan_id: int):
+    return select(*(getattr(tablesmodel.Overlay, c) for c in COLUMNS)).where(
+        tablesmodel.Overlay.floor_plan_id == floor_plan_id).order_by(tablesmodel.Overlay.id)
+
+def _version_stmt(floor_plan_id: int):
+    return select(tablesmodel.FloorPlan.version).where(tablesmodel.FloorPlan.id == floor_plan_id)
+
+def serialize(rows) -> bytes:
+    #UTC timestamps end in "Z", as Pydantic writes them
+    return orjson.dumps([dict(zip(COLUMNS, r)) for r in rows], option=orjson.OPT_UTC_Z)
+
+class SnapshotStore:
+    def __init__(self, max_bytes: int, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key) -> str:
+        return os.path.join(self.directory, f"{key[0]}-{key[1]}.json")
+
+    def _remember(self, key, data: bytes):
+        with self._lock:
+            #the same key and the floor's older versions go
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1] <= key[1]]:
+                self._size -= len(self._entries.pop(stale))
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                self.disk_hits += 1
+                self._remember(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    def put(self, key, data: bytes):
+        self._remember(key, data)
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        #older versions of this floor are never read again
+        for old in glob.glob(os.path.join(self.directory, f"{key[0]}-*.json")):
+            try:
+                if int(os.path.basename(old)[:-5].split("-", 1)[1]) < key[1]:
+                    os.remove(old)
+            except (ValueError, OSError):
+                pass
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+store = SnapshotStore(settings.overlay_snapshot_cache_bytes, settings.overlay_snapshot_dir)
+
+def load(db: Session, floor_plan_id: int, version: int) -> bytes:
+    key = (floor_plan_id, version)
+    data = store.get(key)
+    if data is None:
+        data = serialize(db.execute(_overlays_stmt(floor_plan_id)).all())
+        #only cache what provably is `version`: a commit between the two reads leaves the rows newer
+        if db.scalar(_version_stmt(floor_plan_id)) == version:
+            store.put(key, data)
+    return data
+
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+async def load_async(db: AsyncSession, floor_plan_id: int, version: int) -> bytes:
+    key = (floor_plan_id, version)
+    data = store.get(key)
+    if data is not None:
+        return data
+
+    #editors told about a new version all refetch at once: one build per worker, the rest wait for it
+    pending = _inflight.get(key)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except Exception:
+            pass    #that build failed or its request went away, build it here instead
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        data = serialize((await db.execute(_overlays_stmt(floor_plan_id))).all())
+        if await db.scalar(_version_stmt(floor_plan_id)) == version:
+            store.put(key, data)
+        future.set_result(data)
+        return data
+    except BaseException:
+        future.set_exception(RuntimeError("overlay snapshot build failed"))
+        future.exception()      #mark retrieved, there may be no waiters
+        raise
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
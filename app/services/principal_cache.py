@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from ..config import settings
+
+#Resolved users kept per worker so authenticated requests skip the users lookup. Entries hold a
+#detached snapshot (never an ORM object bound to a closed session), expire after a TTL, and are
+#dropped explicitly when a user's role, password or active flag changes on this worker; the TTL
+#bounds how long other workers can keep serving the old values.
+
+class Principal:
+    __slots__ = ("id", "email", "role", "is_active", "is_verified", "created_at")
+
+    def __init__(self, id: int, email: Optional[str], role: str, is_active: bool = True, is_verified: bool = False, created_at=None):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.is_active = is_active
+        self.is_verified = is_verified
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user.id, user.email, user.role, user.is_active, user.is_verified, user.created_at)
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.token_hits = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, principal: Principal):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "token_only": self.token_hits,
+        }
+
+cache = PrincipalCache(settings.principal_cache_ttl_seconds, settings.principal_cache_max_entries)
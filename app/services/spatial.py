@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..config import settings
+
+#Per floor plan uniform-grid index over overlay rectangles, for "what is at (x, y)" and "what is in
+#this viewport". Overlays are bucketed into the cells they cover (CSR layout: cell -> slice of
+#overlay positions), so a query only tests the overlays of the cells it touches, vectorized.
+#Indexes are keyed by (floor_plan_id, version): every overlay write bumps FloorPlan.version, so a
+#stale index is simply never looked up again and ages out of the LRU.
+
+MAX_CELLS_PER_OVERLAY = 64      #bigger overlays (zones, whole wings) skip the grid and are always tested
+
+OVERLAY_COLUMNS = ("id", "floor_plan_id", "type", "label", "capacity", "x", "y", "width", "height", "props", "created_by", "created_at")
+
+class GridIndex:
+    def __init__(self, overlays: List[dict]):
+        self.overlays = overlays
+        n = len(overlays)
+        x = np.fromiter((o["x"] for o in overlays), dtype=np.int64, count=n)
+        y = np.fromiter((o["y"] for o in overlays), dtype=np.int64, count=n)
+        w = np.fromiter((o["width"] for o in overlays), dtype=np.int64, count=n)
+        h = np.fromiter((o["height"] for o in overlays), dtype=np.int64, count=n)
+        #normalized corners, negative sizes drawn right-to-left are allowed
+        self.x0, self.x1 = np.minimum(x, x + w), np.maximum(x, x + w)
+        self.y0, self.y1 = np.minimum(y, y + h), np.maximum(y, y + h)
+        self.area = (self.x1 - self.x0) * (self.y1 - self.y0)
+
+        if n == 0:
+            self.origin, self.cell, self.gw, self.gh = (0, 0), 1, 1, 1
+            self.offsets = np.zeros(2, dtype=np.int64)
+            self.items = self.large = np.zeros(0, dtype=np.int64)
+            return
+
+        #cells about the size of a typical overlay, so most overlays land in 1-4 cells, but never more
+        #than ~4 cells per overlay so sparse floors don't allocate a huge empty grid
+        ox, oy = int(self.x0.min()), int(self.y0.min())
+        span = (int(self.x1.max()) - ox + 1) * (int(self.y1.max()) - oy + 1)
+        typical = int(np.median(np.maximum(self.x1 - self.x0, self.y1 - self.y0)))
+        cell = max(typical, int(np.ceil(np.sqrt(span / (4 * n)))), 1)
+        self.origin, self.cell = (ox, oy), cell
+        self.gw = (int(self.x1.max()) - ox) // cell + 1
+        self.gh = (int(self.y1.max()) - oy) // cell + 1
+
+        cx0, cx1 = (self.x0 - ox) // cell, (self.x1 - ox) // cell
+        cy0, cy1 = (self.y0 - oy) // cell, (self.y1 - oy) // cell
+        nx, ny = cx1 - cx0 + 1, cy1 - cy0 + 1
+        counts = nx * ny
+        small = counts <= MAX_CELLS_PER_OVERLAY
+        self.large = np.flatnonzero(~small)
+
+        #expand every (small) overlay into the cells it covers, then group by cell
+        owner = np.repeat(np.flatnonzero(small), counts[small])
+        first = np.repeat(np.cumsum(counts[small]) - counts[small], counts[small])
+        local = np.arange(owner.size) - first
+        cell_ids = (cy0[owner] + local // nx[owner]) * self.gw + cx0[owner] + local % nx[owner]
+        order = np.argsort(cell_ids, kind="stable")
+        self.items = owner[order]
+        self.offsets = np.searchsorted(cell_ids[order], np.arange(self.gw * self.gh + 1))
+
+    def _cells(self, cx0: int, cy0: int, cx1: int, cy1: int) -> np.ndarray:
+        cx0, cy0 = max(cx0, 0), max(cy0, 0)
+        cx1, cy1 = min(cx1, self.gw - 1), min(cy1, self.gh - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return self.large
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) * 4 >= self.gw * self.gh:
+            #most of the floor: testing every overlay is cheaper than gathering cells
+            return np.arange(len(self.overlays))
+        rows = [self.items[self.offsets[cy * self.gw + cx0]:self.offsets[cy * self.gw + cx1 + 1]] for cy in range(cy0, cy1 + 1)]
+        return np.unique(np.concatenate(rows + [self.large]))
+
+    def at(self, x: int, y: int) -> List[dict]:
+        #smallest first, so a seat inside a room comes before the room
+        ox, oy = self.origin
+        cand = self._cells((x - ox) // self.cell, (y - oy) // self.cell, (x - ox) // self.cell, (y - oy) // self.cell)
+        hit = cand[(self.x0[cand] <= x) & (x <= self.x1[cand]) & (self.y0[cand] <= y) & (y <= self.y1[cand])]
+        hit = hit[np.argsort(self.area[hit], kind="stable")]
+        return [self.overlays[i] for i in hit]
+
+    def within(self, x0: int, y0: int, x1: int, y1: int, contained: bool = False) -> List[dict]:
+        #overlays intersecting the box (or fully inside it), in id order
+        ox, oy = self.origin
+        cand = self._cells((x0 - ox) // self.cell, (y0 - oy) // self.cell, (x1 - ox) // self.cell, (y1 - oy) // self.cell)
+        if contained:
+            mask = (self.x0[cand] >= x0) & (self.x1[cand] <= x1) & (self.y0[cand] >= y0) & (self.y1[cand] <= y1)
+        else:
+            mask = (self.x0[cand] <= x1) & (self.x1[cand] >= x0) & (self.y0[cand] <= y1) & (self.y1[cand] >= y0)
+        return [self.overlays[i] for i in np.sort(cand[mask])]
+
+class SpatialIndexCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, GridIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[GridIndex]:
+        with self._lock:
+            grid = self._entries.get(key)
+            if grid is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return grid
+
+    def put(self, key, grid: GridIndex):
+        with self._lock:
+            #a newer version replaces the floor's older index right away
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1] < key[1]]:
+                del self._entries[stale]
+            self._entries[key] = grid
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+indexes = SpatialIndexCache(settings.spatial_index_max_floors)
+
+def floor_index(db: Session, floor_plan_id: int) -> Optional[GridIndex]:
+    #None when the floor plan does not exist
+    version = db.scalar(select(tablesmodel.FloorPlan.version).where(tablesmodel.FloorPlan.id == floor_plan_id))
+    if version is None:
+        return None
+    grid = indexes.get((floor_plan_id, version))
+    if grid is not None:
+        return grid
+
+    #read after the version: a concurrent commit can only make these rows newer than the key, and the
+    #next request then sees the bumped version and rebuilds
+    columns = [getattr(tablesmodel.Overlay, c) for c in OVERLAY_COLUMNS]
+    rows = db.execute(select(*columns).where(tablesmodel.Overlay.floor_plan_id == floor_plan_id).order_by(tablesmodel.Overlay.id)).all()
+    grid = GridIndex([dict(zip(OVERLAY_COLUMNS, r)) for r in rows])
+    indexes.put((floor_plan_id, version), grid)
+    return grid
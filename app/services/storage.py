@@ -1,21 +1,206 @@
+import abc
+import hashlib
 import os
 import uuid
+from typing import BinaryIO, Optional
 from fastapi import UploadFile
 
-UPLOAD_DIR = os.path.join(os.getcwd(), "uploads")
+from ..config import settings
 
-def ensure_upload_dir():
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+CHUNK_SIZE = 1024 * 1024    #bytes read per step, bounds memory per upload
+UPLOAD_PREFIX = "uploads"
 
-def save_upload_local(upload_file: UploadFile) -> str:
-    ensure_upload_dir()
-    ext = os.path.splitext(upload_file.filename)[1]
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    dest_path = os.path.join(UPLOAD_DIR, unique_name)
+#Files are addressed by key ("uploads/<sha256><ext>"), which is what FloorPlan.image_path stores.
+#The local driver resolves keys under a directory, the S3 driver uses them as object keys.
 
-    with open(dest_path, "wb") as f:
-        content = upload_file.file.read()
-        f.write(content)
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the upload limit of {limit} bytes")
+        self.limit = limit
 
-    #return path relative to project root which is stored in PostgreSQL
-    return f"uploads/{unique_name}"
\ No newline at end of file
+class StoredFile:
+    def __init__(self, path: str, sha256: str, size: int):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+def _chunks(fileobj: BinaryIO, limit: int, digest):
+    size = 0
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        size += len(chunk)
+        if size > limit:
+            raise UploadTooLarge(limit)
+        digest.update(chunk)
+        yield chunk
+
+class StorageBackend(abc.ABC):
+    @abc.abstractmethod
+    def save_stream(self, fileobj: BinaryIO, ext: str, limit: int) -> StoredFile:
+        ...
+
+    @abc.abstractmethod
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        ...
+
+    @abc.abstractmethod
+    def get_bytes(self, key: str) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    def local_path(self, key: str) -> Optional[str]:
+        #filesystem path when the bytes can be served from this host, None otherwise
+        return None
+
+    def download_url(self, key: str) -> Optional[str]:
+        #presigned URL when clients can fetch the bytes directly from the store, None otherwise
+        return None
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save_stream(self, fileobj: BinaryIO, ext: str, limit: int) -> StoredFile:
+        upload_dir = self.local_path(UPLOAD_PREFIX)
+        os.makedirs(upload_dir, exist_ok=True)
+        tmp_path = os.path.join(upload_dir, f".tmp-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in _chunks(fileobj, limit, digest):
+                    size += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        #content addressed: the same drawing uploaded twice shares one file
+        sha256 = digest.hexdigest()
+        key = f"{UPLOAD_PREFIX}/{sha256}{ext}"
+        if os.path.exists(self.local_path(key)):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, self.local_path(key))
+        return StoredFile(key, sha256, size)
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_bytes(self, key: str) -> bytes:
+        with open(self.local_path(key), "rb") as f:
+            return f.read()
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None, access_key_id: Optional[str] = None,
+                 secret_access_key: Optional[str] = None, part_size: int = 8 * 1024 * 1024, presign_expiry: int = 900):
+        import boto3     #only needed when this driver is selected
+
+        self.bucket = bucket
+        self.part_size = max(part_size, 5 * 1024 * 1024)     #S3 minimum for every part but the last
+        self.presign_expiry = presign_expiry
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region,
+                                   aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key)
+
+    def _multipart_upload(self, key: str, fileobj: BinaryIO, limit: int, digest) -> int:
+        #parts are buffered up to part_size, so memory per upload stays bounded
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+        parts, buffer, size = [], bytearray(), 0
+        try:
+            def flush():
+                part_number = len(parts) + 1
+                r = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=bytes(buffer))
+                parts.append({"ETag": r["ETag"], "PartNumber": part_number})
+                buffer.clear()
+
+            for chunk in _chunks(fileobj, limit, digest):
+                size += len(chunk)
+                buffer.extend(chunk)
+                if len(buffer) >= self.part_size:
+                    flush()
+            if buffer or not parts:
+                flush()
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return size
+
+    def save_stream(self, fileobj: BinaryIO, ext: str, limit: int) -> StoredFile:
+        #the content key is only known once the stream is hashed: upload to a temp key, then copy into place
+        tmp_key = f"{UPLOAD_PREFIX}/.tmp-{uuid.uuid4().hex}"
+        digest = hashlib.sha256()
+        size = self._multipart_upload(tmp_key, fileobj, limit, digest)
+
+        sha256 = digest.hexdigest()
+        key = f"{UPLOAD_PREFIX}/{sha256}{ext}"
+        try:
+            if not self.exists(key):
+                self.client.copy_object(Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": tmp_key})
+        finally:
+            self.client.delete_object(Bucket=self.bucket, Key=tmp_key)
+        return StoredFile(key, sha256, size)
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **extra)
+
+    def get_bytes(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def download_url(self, key: str) -> str:
+        return self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=self.presign_expiry)
+
+_backend: Optional[StorageBackend] = None
+
+def create_backend() -> StorageBackend:
+    if settings.storage_backend == "local":
+        return LocalStorage(settings.local_storage_root or os.getcwd())
+    if settings.storage_backend == "s3":
+        if not settings.s3_bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Storage(settings.s3_bucket, endpoint_url=settings.s3_endpoint_url, region=settings.s3_region,
+                         access_key_id=settings.s3_access_key_id, secret_access_key=settings.s3_secret_access_key,
+                         part_size=settings.s3_part_size, presign_expiry=settings.s3_presign_expiry_seconds)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {settings.storage_backend}")
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+def save_upload(upload_file: UploadFile) -> StoredFile:
+    limit = settings.max_upload_bytes
+    if upload_file.size is not None and upload_file.size > limit:
+        raise UploadTooLarge(limit)
+
+    ext = os.path.splitext(upload_file.filename or "")[1].lower()
+    return get_backend().save_stream(upload_file.file, ext, limit)
@@ -0,0 +1,107 @@
+import io
+import math
+from typing import Callable, Iterator, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from ..config import settings
+
+TILE_SIZE = 256
+THUMBNAIL_SIZE = 512
+
+#building scans are legitimately huge, only refuse what is clearly not a floor plan
+Image.MAX_IMAGE_PIXELS = settings.tiles_max_image_pixels
+
+#Deep-zoom layout: level max_zoom is the full-resolution image, each lower level halves both
+#sides, level 0 fits in one tile. Tiles are TILE_SIZE squares (edge tiles may be smaller),
+#stored under the file hash so identical uploads share one pyramid.
+
+def tile_key(sha256: str, z: int, x: int, y: int) -> str:
+    return f"tiles/{sha256}/{z}/{x}/{y}.png"
+
+def thumbnail_key(sha256: str) -> str:
+    return f"tiles/{sha256}/thumbnail.png"
+
+def max_zoom_for(width: int, height: int) -> int:
+    return max(0, math.ceil(math.log2(max(width, height) / TILE_SIZE)))
+
+def open_image(data: bytes) -> Optional[Image.Image]:
+    #None for files Pillow cannot decode as a raster (e.g. PDFs) or refuses as too large
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except (OSError, Image.DecompressionBombError):
+        return None
+    return img
+
+def to_array(img: Image.Image) -> np.ndarray:
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    return np.asarray(img)
+
+def downsample(arr: np.ndarray) -> np.ndarray:
+    #2x2 box filter over the whole level at once: pad to even sides, then sum the four
+    #phase-shifted views in uint16 and round back to uint8
+    h, w = arr.shape[:2]
+    if h % 2 or w % 2:
+        arr = np.pad(arr, ((0, h % 2), (0, w % 2), (0, 0)), mode="edge")
+    acc = arr[0::2, 0::2].astype(np.uint16)
+    acc += arr[1::2, 0::2]
+    acc += arr[0::2, 1::2]
+    acc += arr[1::2, 1::2]
+    return ((acc + 2) >> 2).astype(np.uint8)
+
+def encode_png(arr: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format="PNG", compress_level=settings.tiles_png_compress_level)
+    return buf.getvalue()
+
+def iter_tiles(arr: np.ndarray) -> Iterator[Tuple[int, int, int, bytes]]:
+    h, w = arr.shape[:2]
+    level = arr
+    for z in range(max_zoom_for(w, h), -1, -1):
+        lh, lw = level.shape[:2]
+        for y in range(0, lh, TILE_SIZE):
+            for x in range(0, lw, TILE_SIZE):
+                #tiles are views into the level array, no copy until PNG encoding
+                yield z, x // TILE_SIZE, y // TILE_SIZE, encode_png(level[y:y + TILE_SIZE, x:x + TILE_SIZE])
+        if z:
+            level = downsample(level)
+
+def thumbnail(arr: np.ndarray) -> bytes:
+    img = Image.fromarray(arr)
+    img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+class Pyramid:
+    def __init__(self, width: int, height: int, max_zoom: int):
+        self.width = width
+        self.height = height
+        self.max_zoom = max_zoom
+
+def tile_count(width: int, height: int) -> int:
+    count = 0
+    for z in range(max_zoom_for(width, height), -1, -1):
+        count += math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+        width, height = (width + 1) // 2, (height + 1) // 2
+    return count
+
+def build_pyramid(backend, sha256: str, arr: np.ndarray, progress: Optional[Callable[[int, int], None]] = None) -> Pyramid:
+    #progress(done, total) is called as tiles are written
+    h, w = arr.shape[:2]
+    pyramid = Pyramid(w, h, max_zoom_for(w, h))
+
+    #content addressed: an identical earlier upload already produced this pyramid
+    if backend.exists(thumbnail_key(sha256)):
+        return pyramid
+
+    total = tile_count(w, h)
+    for done, (z, x, y, png) in enumerate(iter_tiles(arr), 1):
+        backend.put_bytes(tile_key(sha256, z, x, y), png, content_type="image/png")
+        if progress:
+            progress(done, total)
+    #written last, marks the pyramid complete
+    backend.put_bytes(thumbnail_key(sha256), thumbnail(arr), content_type="image/png")
+    return pyramid
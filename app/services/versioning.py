@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from .. import tablesmodel
+from ..config import settings
+from .overlay_diff import OVERLAY_FIELDS
+
+#Version history is stored as a full checkpoint every `version_checkpoint_interval` versions and
+#compact patches in between:
+#   checkpoint: changes = {"overlays": [overlay, ...]}                    (same shape as older rows)
+#   patch:      changes = {"base": v - 1, "added": [...], "updated": [...], "removed": [id, ...]}
+#Overlays are {"id", *OVERLAY_FIELDS} dicts, snapshots are ordered by id.
+
+class VersionNotFound(Exception):
+    pass
+
+def overlay_to_version_dict(o) -> dict:
+    return {"id": o.id, **{f: getattr(o, f) for f in OVERLAY_FIELDS}}
+
+def load_snapshot(db: Session, floor_plan_id: int) -> List[dict]:
+    overlays = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.floor_plan_id == floor_plan_id).order_by(tablesmodel.Overlay.id).all()
+    return [overlay_to_version_dict(o) for o in overlays]
+
+class SnapshotCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[List[dict]]:
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self._entries.move_to_end(key)
+            return snapshot
+
+    def put(self, key, snapshot: List[dict]):
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+snapshot_cache = SnapshotCache(settings.version_cache_size)
+
+def _last_checkpoint(db: Session, floor_plan_id: int, upto: int) -> Optional[int]:
+    return db.scalar(select(func.max(tablesmodel.FloorPlanVersion.version)).where(
+        tablesmodel.FloorPlanVersion.floor_plan_id == floor_plan_id,
+        tablesmodel.FloorPlanVersion.is_checkpoint.is_(True),
+        tablesmodel.FloorPlanVersion.version <= upto
+    ))
+
+def _patch_base(db: Session, floor_plan_id: int, upto: int):
+    #(version, keyed) of the newest checkpoint; keyed is false for snapshots written before overlays kept their ids
+    overlays = tablesmodel.FloorPlanVersion.changes["overlays"]
+    keyed = or_(func.json_array_length(overlays) == 0, overlays[0]["id"].isnot(None))
+    return db.execute(select(tablesmodel.FloorPlanVersion.version, keyed).where(
+        tablesmodel.FloorPlanVersion.floor_plan_id == floor_plan_id,
+        tablesmodel.FloorPlanVersion.is_checkpoint.is_(True),
+        tablesmodel.FloorPlanVersion.version <= upto
+    ).order_by(tablesmodel.FloorPlanVersion.version.desc()).limit(1)).first()
+
+def record_version(db: Session, floor_plan_id: int, version: int, added: List[dict], updated: List[dict], removed: List[int],
+                   snapshot: Callable[[], List[dict]], created_by=None):
+    #added/updated/removed describe the change from version - 1; snapshot() is only called when a checkpoint is due
+    #patches name overlays by id, so a checkpoint without ids cannot be patched and a full one is written instead
+    last = _patch_base(db, floor_plan_id, version - 1)
+    if last is None or not last[1] or version - last[0] >= settings.version_checkpoint_interval:
+        entry = tablesmodel.FloorPlanVersion(floor_plan_id=floor_plan_id, version=version, is_checkpoint=True,
+                                             changes={"overlays": sorted(snapshot(), key=lambda o: o["id"])}, created_by=created_by)
+    else:
+        entry = tablesmodel.FloorPlanVersion(floor_plan_id=floor_plan_id, version=version, is_checkpoint=False,
+                                             changes={"base": version - 1, "added": added, "updated": updated, "removed": removed}, created_by=created_by)
+    db.add(entry)
+    return entry
+
+def apply_patch(state: Dict[int, dict], patch: dict):
+    for oid in patch.get("removed", []):
+        state.pop(oid, None)
+    for o in patch.get("updated", []):
+        state[o["id"]] = o
+    for o in patch.get("added", []):
+        state[o["id"]] = o
+
+def _keyed(overlays: List[dict]) -> Dict[int, dict]:
+    #snapshots written before overlays kept their ids have no "id", those are keyed -n..-1 by position to keep their order
+    return {o.get("id", i - len(overlays)): o for i, o in enumerate(overlays)}
+
+def rebuild(db: Session, floor_plan_id: int, version: int) -> List[dict]:
+    cached = snapshot_cache.get((floor_plan_id, version))
+    if cached is not None:
+        return cached
+
+    checkpoint = _last_checkpoint(db, floor_plan_id, version)
+    if checkpoint is None:
+        raise VersionNotFound()
+
+    #start from the newest already rebuilt version between the checkpoint and the target, if any
+    base, state = checkpoint, None
+    for v in range(version - 1, checkpoint - 1, -1):
+        cached = snapshot_cache.get((floor_plan_id, v))
+        if cached is not None:
+            base, state = v, _keyed(cached)
+            break
+
+    rows = db.execute(select(tablesmodel.FloorPlanVersion.version, tablesmodel.FloorPlanVersion.changes).where(
+        tablesmodel.FloorPlanVersion.floor_plan_id == floor_plan_id,
+        tablesmodel.FloorPlanVersion.version >= base,
+        tablesmodel.FloorPlanVersion.version <= version
+    ).order_by(tablesmodel.FloorPlanVersion.version)).all()
+
+    if not rows or rows[-1].version != version:
+        raise VersionNotFound()
+
+    for row in rows:
+        if state is None:
+            state = _keyed(row.changes.get("overlays", []))
+        elif row.version > base:
+            apply_patch(state, row.changes)
+
+    snapshot = [o for _, o in sorted(state.items())]
+    snapshot_cache.put((floor_plan_id, version), snapshot)
+    return snapshot
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, TIMESTAMP, text, Boolean, Float, JSON, DateTime, UniqueConstraint
+from sqlalchemy import Column, String, Integer, ForeignKey, TIMESTAMP, text, Boolean, Float, JSON, BigInteger, DateTime, UniqueConstraint, Index, Computed
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -17,8 +17,14 @@ class OTP(Base):
     __tablename__ = 'otps'
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    email = Column(String, ForeignKey('users.email'))
-    otp = Column(String, nullable=False)
+    email = Column(String, ForeignKey('users.email'), nullable=False, unique=True)     #one live code per email, replaced on resend
+    otp_hash = Column(String(64), nullable=False)     #HMAC-SHA256 of the code, never the code itself
+    attempts = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+    #the sweeper deletes expired codes in expires_at order
+    __table_args__ = (Index('ix_otps_expires_at', 'expires_at'),)
 
 class FloorPlan(Base):
     __tablename__ = "floor_plans"
@@ -27,7 +33,14 @@ class FloorPlan(Base):
     building = Column(String, nullable=True)
     floor_number = Column(Integer, nullable=True)
     image_path = Column(String, nullable=False)     #s3/minio key or local path
+    file_sha256 = Column(String(64), nullable=True, index=True)     #content hash, also the stored file name
+    file_size = Column(BigInteger, nullable=True)
+    image_width = Column(Integer, nullable=True)
+    image_height = Column(Integer, nullable=True)
+    tile_max_zoom = Column(Integer, nullable=True)     #deepest tile level, null when no pyramid (e.g. PDF)
+    processing_status = Column(String, nullable=False, default="ready", server_default=text("'ready'"))   #pending / ready / failed
     pixels_per_meter = Column(Float, nullable=True)
+    suggested_pixels_per_meter = Column(Float, nullable=True)     #from scan DPI, filled by post-upload processing
     units = Column(String, default="meters")
     version = Column(Integer, default=1)
     uploaded_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
@@ -36,6 +49,10 @@ class FloorPlan(Base):
     overlays = relationship("Overlay", back_populates="floor_plan", cascade="all, delete-orphan")
     versions = relationship("FloorPlanVersion", back_populates="floor_plan", cascade="all, delete-orphan")
 
+    #keyset order of GET /floorplans, unfiltered and filtered by building / floor
+    __table_args__ = (Index('ix_floor_plans_created', 'created_at', 'id'),
+                      Index('ix_floor_plans_building_floor', 'building', 'floor_number', 'created_at', 'id'))
+
 class Overlay(Base):
     __tablename__ = "overlays"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -48,11 +65,16 @@ class Overlay(Base):
     width = Column(Integer, nullable=False)
     height = Column(Integer, nullable=False)
     props = Column(JSON, default={})
+    booking_epoch = Column(Integer, nullable=False, default=0, server_default=text('0'))    #bumped on every booking write
     created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
     floor_plan = relationship("FloorPlan", back_populates="overlays")
 
+    #keyset order of a floor's overlays, unfiltered and filtered by type
+    __table_args__ = (Index('ix_overlays_floor_plan_id', 'floor_plan_id', 'id'),
+                      Index('ix_overlays_floor_plan_type', 'floor_plan_id', 'type', 'id'))
+
 class Booking(Base):
     __tablename__ = "bookings"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -63,6 +85,29 @@ class Booking(Base):
     participants = Column(Integer, nullable=True)
     status = Column(String, default="confirmed")   #confirmed / cancelled / pending
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    #how the rollups counted it against the room's capacity when booked (or last rebuilt), a cancel subtracts these
+    over_capacity = Column(Boolean, nullable=False, default=False, server_default=text('false'))
+    under_half = Column(Boolean, nullable=False, default=False, server_default=text('false'))
+
+    #covers overlap probes (conflict check and the availability anti-join) per room, and the keyset order
+    #(start_ts, id) of a room's bookings: ties on start_ts are sorted on id after the index scan
+    __table_args__ = (Index('ix_bookings_overlay_time', 'overlay_id', 'start_ts', 'end_ts'),)
+
+class OccupancyHourly(Base):
+    __tablename__ = "occupancy_hourly"
+    #per overlay and hour rollup of its non-cancelled bookings, maintained with each booking write
+    overlay_id = Column(Integer, ForeignKey("overlays.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime, primary_key=True)       #naive UTC like Booking timestamps, truncated to the hour
+    booked_seconds = Column(Integer, nullable=False, default=0)
+    participant_seconds = Column(BigInteger, nullable=False, default=0)
+    bookings = Column(Integer, nullable=False, default=0)          #bookings starting in this hour
+    over_capacity = Column(Integer, nullable=False, default=0)     #...with more participants than the overlay's capacity
+    under_half = Column(Integer, nullable=False, default=0)        #...filling at most half of it
+    hour_no = Column(Integer, Computed("(date_part('epoch', hour) / 3600)::int", persisted=True))   #hours since 1970, for the business hours filter
+
+    #the reports read only this index (index-only scans), the primary key serves the upserts
+    __table_args__ = (Index('ix_occupancy_hourly_covering', 'overlay_id', 'hour',
+                            postgresql_include=['hour_no', 'booked_seconds', 'participant_seconds', 'bookings', 'over_capacity', 'under_half']),)
 
 class FloorPlanVersion(Base):
     __tablename__ = "floorplan_versions"
@@ -70,9 +115,45 @@ class FloorPlanVersion(Base):
     floor_plan_id = Column(Integer, ForeignKey("floor_plans.id", ondelete="CASCADE"), nullable=False)
     version = Column(Integer, nullable=False)
     changes = Column(JSON, nullable=True)          #snapshot or json patch
+    is_checkpoint = Column(Boolean, nullable=False, default=True, server_default=text('true'))   #full snapshot vs patch on version - 1
     created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
     floor_plan = relationship("FloorPlan", back_populates="versions")
 
-    __table_args__ = (UniqueConstraint('floor_plan_id', 'version', name='uix_floorplan_version'),)    
\ No newline at end of file
+    __table_args__ = (UniqueConstraint('floor_plan_id', 'version', name='uix_floorplan_version'),)
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    floor_plan_id = Column(Integer, ForeignKey("floor_plans.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")    #queued / running / done / failed
+    step = Column(String, nullable=True)
+    progress = Column(Integer, nullable=False, default=0)        #0-100
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    result = Column(JSON, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+    __table_args__ = (Index('ix_processing_jobs_status', 'status'),)
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html = Column(String, nullable=True)        #rendered body, cleared once sent, failed or expired
+    status = Column(String, nullable=False, default="pending")     #pending / sent / failed / expired
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    next_attempt_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    sent_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=True)     #set for bodies with a secret: purged unsent after this
+
+    __table_args__ = (Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+                      Index('ix_email_outbox_expiring', 'expires_at', postgresql_where=text('html IS NOT NULL')))
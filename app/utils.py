@@ -1,11 +1,13 @@
 from passlib.context import CryptContext
-import random
-import smtplib
+import secrets
+from datetime import datetime, timezone
+from string import Template
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from .config import settings
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", argon2__rounds=settings.argon2_time_cost,
+                           argon2__memory_cost=settings.argon2_memory_cost, argon2__parallelism=settings.argon2_parallelism)
 
 def hash(password: str):
     return pwd_context.hash(password)
@@ -13,30 +15,28 @@ def hash(password: str):
 def verify(plain_password, hashed_password):
     return pwd_context.verify(plain_password,hashed_password)
 
-def generate_otp():
-    return str(random.randint(1000, 9999))
+def naive_utc(ts: datetime) -> datetime:
+    #bookings store naive UTC timestamps; aware inputs are converted (asyncpg refuses to mix the two)
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
 
-def send_email(subject: str, recipient_email: str, html_content: str):
-    smtp_server = 'smtp.gmail.com'
-    smtp_port = 587
-    sender_email = settings.email
-    password = settings.smtp_password
+def generate_otp():
+    #leading zeros included, all 10^OTP_DIGITS codes are possible
+    return f"{secrets.randbelow(10 ** settings.otp_digits):0{settings.otp_digits}d}"
 
+def build_message(subject: str, recipient_email: str, html_content: str) -> str:
     msg = MIMEMultipart()
-    msg['From'] = sender_email
+    msg['From'] = settings.email
     msg['To'] = recipient_email
     msg['Subject'] = subject
     
     msg.attach(MIMEText(html_content, 'html'))
+    return msg.as_string()
 
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
-        server.login(sender_email, password)
-        server.sendmail(sender_email, recipient_email, msg.as_string())
-
-def send_signup_email(recipient_email: str):
-    subject = "Welcome - ReflectionSync Floor Plan Management"
-    html_content = f"""
+#templates are rendered once at import; only the OTP needs a per-message substitution
+SIGNUP_SUBJECT = "Welcome - ReflectionSync Floor Plan Management"
+SIGNUP_HTML = """
     <html>
     <body>
         <h2>Welcome to ReflectionSync Floor Plan Management</h2>
@@ -55,21 +55,24 @@ def send_signup_email(recipient_email: str):
     </body>
     </html>
     """
-    send_email(subject, recipient_email, html_content)
 
-def send_otp_email(recipient_email: str, otp: str):
-    subject = "ReflectionSync - Your OTP for Password Reset"
-    html_content = f"""
+OTP_SUBJECT = "ReflectionSync - Your OTP for Password Reset"
+OTP_HTML = Template("""
     <html>
     <body>
         <h2>ReflectionSync - Password Reset OTP</h2>
         <p>Hi,</p>
         <p>Your One-Time Password (OTP) to reset your ReflectionSync account password is:</p>
-        <h1 style="color: #d9534f;">{otp}</h1>
+        <h1 style="color: #d9534f;">$otp</h1>
         <p>This OTP is valid for a short time. If you did not request a password reset, please ignore this email or contact your administrator.</p>
         <p>Best regards,<br/>ReflectionSync Floor Plan Team</p>
         <p style="font-size: small; color: gray;">This is an automated message. Please do not reply to this email.</p>
     </body>
     </html>
-    """
-    send_email(subject, recipient_email, html_content)
\ No newline at end of file
+    """)
+
+def signup_email():
+    return SIGNUP_SUBJECT, SIGNUP_HTML
+
+def otp_email(otp: str):
+    return OTP_SUBJECT, OTP_HTML.substitute(otp=otp)
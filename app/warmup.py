@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import List
+from sqlalchemy import select
+
+from . import database, tablesmodel
+from .config import settings
+from .services import overlay_snapshots, spatial
+
+#Run by the lifespan hook in app/main.py before a worker takes requests: opens WARMUP_CONNECTIONS
+#connections in both pools and builds what an editor opening a floor plan needs (the serialized
+#overlay list and the hit-testing grid) for the WARMUP_FLOOR_PLANS most recently edited floors. The
+#booking index is left to fill on demand: it holds every future booking of a room, ~0.5s of loading
+#for a busy floor, which would delay every worker's start by more than it saves its first requests.
+#Everything runs concurrently, the blocking parts in threads. After WARMUP_TIMEOUT_SECONDS the worker
+#starts serving and whatever is left finishes in the background; failures are logged, a worker that
+#cannot reach the database still starts (and its requests fail).
+
+def recent_floor_plans(limit: int) -> List[int]:
+    #newest versions first: a backwards scan of the primary key, deduplicated here
+    with database.sessionLocal() as db:
+        rows = db.scalars(select(tablesmodel.FloorPlanVersion.floor_plan_id).order_by(tablesmodel.FloorPlanVersion.id.desc()).limit(limit * 20)).all()
+    return list(dict.fromkeys(rows))[:limit]
+
+def warm_floor(floor_plan_id: int):
+    with database.sessionLocal() as db:
+        version = db.scalar(select(tablesmodel.FloorPlan.version).where(tablesmodel.FloorPlan.id == floor_plan_id))
+        if version is None:
+            return
+        overlay_snapshots.load(db, floor_plan_id, version)
+        spatial.floor_index(db, floor_plan_id)
+
+async def fill_sync_pool(n: int):
+    #held at the same time, so the pool keeps n distinct connections
+    conns = await asyncio.gather(*(asyncio.to_thread(database.engine.connect) for _ in range(n)))
+    for conn in conns:
+        conn.close()
+
+async def fill_async_pool(n: int):
+    engine = database.get_async_engine()
+    conns = await asyncio.gather(*(engine.connect() for _ in range(n)))
+    for conn in conns:
+        await conn.close()
+
+async def warm_floors(limit: int):
+    floors = await asyncio.to_thread(recent_floor_plans, limit)
+    await asyncio.gather(*(asyncio.to_thread(warm_floor, f) for f in floors))
+    return len(floors)
+
+async def run():
+    if not settings.warmup_enabled:
+        return
+    started = time.perf_counter()
+    n = min(settings.warmup_connections, settings.db_pool_size)
+    names = ("sync pool", "async pool", "floor plans")
+    work = asyncio.gather(fill_sync_pool(n), fill_async_pool(n), warm_floors(settings.warmup_floor_plans), return_exceptions=True)
+    try:
+        results = await asyncio.wait_for(asyncio.shield(work), settings.warmup_timeout_seconds)
+    except asyncio.TimeoutError:
+        print(f"[startup] warmup still running after {settings.warmup_timeout_seconds}s, serving anyway")
+        return
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            print(f"[startup] warming the {name} failed: {type(result).__name__}: {result}")
+    floors = results[2] if isinstance(results[2], int) else 0
+    print(f"[startup] warmed up in {(time.perf_counter() - started) * 1000:.0f}ms: {n} connections per pool, {floors} floor plans")
@@ -0,0 +1,70 @@
+#Before/after benchmark for GET /bookings/available.
+#Seeds N rooms (a third of them booked) inside a transaction that is rolled back at the end,
+#then runs the old per-room COUNT loop and the set-based anti-join and reports queries + latency.
+#usage: python -m benchmarks.availability_queries 100 1000 5000
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import tablesmodel
+from app.database import engine
+from app.services import availability
+from benchmarks.results import count_queries
+
+def legacy_available_rooms(db: Session, start: datetime, end: datetime):
+    candidates = db.query(tablesmodel.Overlay).filter(tablesmodel.Overlay.type == "room").all()
+    available = []
+    for candidate in candidates:
+        overlapping = db.query(tablesmodel.Booking).filter(
+            tablesmodel.Booking.overlay_id == candidate.id,
+            ~((tablesmodel.Booking.end_ts <= start) | (tablesmodel.Booking.start_ts >= end))
+        ).count()
+        if overlapping == 0:
+            available.append(candidate)
+    return available
+
+def seed(db: Session, rooms: int, start: datetime, end: datetime):
+    fp = tablesmodel.FloorPlan(name="bench", building="bench", image_path="uploads/bench.png")
+    db.add(fp)
+    db.flush()
+    overlay_ids = db.scalars(insert(tablesmodel.Overlay).returning(tablesmodel.Overlay.id), [
+        {"floor_plan_id": fp.id, "type": "room", "label": f"R{i}", "capacity": 2 + i % 10, "x": i, "y": i, "width": 10, "height": 10, "props": {}}
+        for i in range(rooms)
+    ]).all()
+    db.execute(insert(tablesmodel.Booking), [
+        {"overlay_id": oid, "start_ts": start, "end_ts": end, "participants": 2, "status": "confirmed"}
+        for oid in overlay_ids[::3]
+    ])
+    db.flush()
+
+def measure(db: Session, fn):
+    db.expunge_all()
+    with count_queries() as stats:
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+    return len(result), stats.queries, elapsed * 1000
+
+def main(sizes):
+    start = datetime(2030, 1, 7, 9, 0)
+    end = start + timedelta(hours=1)
+
+    print(f"{'rooms':>8} {'impl':>8} {'free':>8} {'queries':>8} {'ms':>10}")
+    for size in sizes:
+        with engine.connect() as conn:
+            trans = conn.begin()
+            db = Session(bind=conn, join_transaction_mode="create_savepoint")
+            try:
+                seed(db, size, start, end)
+                for name, fn in (("legacy", lambda: legacy_available_rooms(db, start, end)),
+                                 ("setbased", lambda: availability.find_available_rooms(db, start, end))):
+                    free, queries, ms = measure(db, fn)
+                    print(f"{size:>8} {name:>8} {free:>8} {queries:>8} {ms:>10.1f}")
+            finally:
+                db.close()
+                trans.rollback()
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [100, 1000, 5000])
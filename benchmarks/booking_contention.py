@@ -0,0 +1,69 @@
+#Concurrency stress test for POST /bookings against a running server backed by a local Postgres.
+#Fires `requests` parallel bookings for the same hour spread over the given room ids, so every
+#room sees many racing writers. Reports throughput and checks the table for double-bookings.
+#usage: python -m benchmarks.booking_contention --url http://127.0.0.1:8000 --email admin@example.com \
+#           --password admin@123 --rooms 1 2 3 --requests 500
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import httpx
+from sqlalchemy import text
+
+from app.database import engine
+
+DOUBLE_BOOKINGS_SQL = text("""
+    SELECT a.id, b.id FROM bookings a
+    JOIN bookings b ON a.overlay_id = b.overlay_id AND a.id < b.id
+     AND a.start_ts < b.end_ts AND a.end_ts > b.start_ts
+    WHERE a.overlay_id = ANY(:rooms) AND a.start_ts < :end AND a.end_ts > :start
+""")
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    r = await client.post("/auth/login", json={"email": email, "password": password})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+async def book(client: httpx.AsyncClient, headers: dict, overlay_id: int, start: datetime, end: datetime):
+    r = await client.post("/bookings", headers=headers, json={
+        "overlay_id": overlay_id, "start_ts": start.isoformat(), "end_ts": end.isoformat(), "participants": 1
+    })
+    return r.status_code
+
+async def run(args):
+    #a fresh slot per run so earlier runs don't turn everything into 409s
+    start = (datetime.utcnow() + timedelta(days=365)).replace(minute=0, second=0, microsecond=0)
+    end = start + timedelta(hours=1)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        headers = {"Authorization": f"Bearer {await login(client, args.email, args.password)}"}
+        t0 = time.perf_counter()
+        codes = await asyncio.gather(*[
+            book(client, headers, args.rooms[i % len(args.rooms)], start, end) for i in range(args.requests)
+        ])
+        elapsed = time.perf_counter() - t0
+
+    statuses = Counter(codes)
+    print(f"requests={args.requests} rooms={len(args.rooms)} elapsed={elapsed:.2f}s throughput={args.requests / elapsed:.1f} req/s")
+    print(f"statuses={dict(statuses)}")
+
+    with engine.connect() as conn:
+        doubles = conn.execute(DOUBLE_BOOKINGS_SQL, {"rooms": args.rooms, "start": start, "end": end}).all()
+    print(f"double_bookings={len(doubles)}")
+
+    #exactly one winner per room is the only correct outcome
+    ok = not doubles and statuses.get(200, 0) == len(args.rooms)
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--rooms", type=int, nargs="+", required=True)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    raise SystemExit(asyncio.run(run(parser.parse_args())))
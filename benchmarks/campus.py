@@ -0,0 +1,179 @@
+#Seeded synthetic campus for benchmarks: buildings of floors, each floor a grid of rooms next to an
+#open-plan area of seats, users, and months of bookings, written straight into the app's database
+#(DATABASE_* settings) with COPY. Room bookings fill the working hours (8-18) on the hour, 30 or 60
+#minutes long, without double-bookings; seats are booked for whole days. Weekends are quiet and some
+#rooms are far more popular than others. The occupancy rollups are rebuilt at the end.
+#Everything generated is tagged (buildings "Campus <n>", users campus-user-<n>@example.com) and
+#--reset removes a previous campus first. The same --seed and sizes always give the same data.
+#usage: python -m benchmarks.campus --seed 42 --buildings 3 --floors 4 --rooms 150 --seats 300 --days 180 --reset
+import argparse
+import io
+import time
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import insert, text
+
+from app import tablesmodel, utils
+from app.database import engine, sessionLocal
+from app.services import analytics
+from benchmarks.results import write_json
+
+BUILDING_PREFIX = "Campus"
+USER_EMAIL = "campus-user-{}@example.com"
+ROOM_SIZE, SEAT_SIZE, GAP = 120, 40, 20
+PIXELS_PER_METER = 40.0
+WORK_HOURS = range(8, 18)
+ROOM_BATCH = 500
+
+def reset(conn):
+    #bookings, versions and rollups go with their overlays / floor plans (ON DELETE CASCADE)
+    conn.execute(text("DELETE FROM floor_plans WHERE building LIKE :prefix"), {"prefix": BUILDING_PREFIX + " %"})
+    conn.execute(text("DELETE FROM users WHERE email LIKE 'campus-user-%@example.com'"))
+
+def copy_rows(conn, table: str, columns, lines):
+    #lines are already CSV; one COPY per batch
+    buf = io.StringIO("".join(lines))
+    raw = conn.connection.dbapi_connection
+    with raw.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def floor_layout(rng, rooms: int, seats: int):
+    #rooms in rows on the left, the seat grid on the right; returns overlay rows and the image size
+    room_cols = max(1, int(np.ceil(np.sqrt(rooms))))
+    seat_cols = max(1, int(np.ceil(np.sqrt(seats * 2))))
+    rows = []
+    for i in range(rooms):
+        r, c = divmod(i, room_cols)
+        rows.append(("room", f"R{i + 1}", int(rng.choice([2, 4, 6, 8, 12, 20], p=[.15, .3, .25, .15, .1, .05])),
+                     GAP + c * (ROOM_SIZE + GAP), GAP + r * (ROOM_SIZE + GAP), ROOM_SIZE, ROOM_SIZE))
+    seat_x0 = GAP + room_cols * (ROOM_SIZE + GAP) + 4 * GAP
+    for i in range(seats):
+        r, c = divmod(i, seat_cols)
+        rows.append(("seat", f"S{i + 1}", 1, seat_x0 + c * (SEAT_SIZE + GAP // 2), GAP + r * (SEAT_SIZE + GAP // 2), SEAT_SIZE, SEAT_SIZE))
+    width = max(x + w for _, _, _, x, _, w, _ in rows) + GAP if rows else 1000
+    height = max(y + h for _, _, _, _, y, _, h in rows) + GAP if rows else 1000
+    return rows, int(width), int(height)
+
+def weekdays(first_day: date, days: int) -> np.ndarray:
+    #0 = Monday; 1970-01-01 was a Thursday
+    return ((np.datetime64(first_day, "D") + np.arange(days)).view("int64") + 3) % 7
+
+def room_bookings(rng, overlay_ids, capacities, first_day: date, days: int, occupancy: float, users):
+    #one Bernoulli draw per room, day and working hour; popularity and weekday scale the chance
+    n = len(overlay_ids)
+    hours = np.array(WORK_HOURS)
+    day_factor = np.where(weekdays(first_day, days) < 5, 1.0, 0.1)
+    popularity = np.clip(rng.gamma(2.0, 0.5, n), 0.05, 2.0)
+    chance = np.clip(occupancy * popularity[:, None] * day_factor[None, :], 0, 0.95)
+    booked = rng.random((n, days, len(hours))) < chance[:, :, None]
+    room, day, hour = np.nonzero(booked)
+    start = (np.datetime64(first_day, "m") + day.astype("timedelta64[D]") + hours[hour].astype("timedelta64[h]")).astype("datetime64[m]")
+    minutes = rng.choice([30, 60], size=len(room), p=[.4, .6])
+    participants = np.maximum(1, np.round(capacities[room] * rng.beta(2, 2.5, len(room)) * 1.3)).astype(int)
+    return overlay_ids[room], start, start + minutes.astype("timedelta64[m]"), participants, users[rng.integers(0, len(users), len(room))]
+
+def seat_bookings(rng, overlay_ids, first_day: date, days: int, occupancy: float, users):
+    booked = rng.random((len(overlay_ids), days)) < np.where(weekdays(first_day, days) < 5, occupancy, 0.02)[None, :]
+    seat, day = np.nonzero(booked)
+    start = np.datetime64(first_day, "m") + day.astype("timedelta64[D]") + np.timedelta64(WORK_HOURS[0], "h")
+    end = start + np.timedelta64(len(WORK_HOURS), "h")
+    return overlay_ids[seat], start, end, np.ones(len(seat), dtype=int), users[rng.integers(0, len(users), len(seat))]
+
+def booking_lines(rng, overlay_ids, start, end, participants, organizers, cancelled_share: float):
+    starts = np.datetime_as_string(start, unit="s")
+    ends = np.datetime_as_string(end, unit="s")
+    status = np.where(rng.random(len(overlay_ids)) < cancelled_share, "cancelled", "confirmed")
+    return [f"{o},{u},{s},{e},{p},{st}\n" for o, u, s, e, p, st in zip(overlay_ids.tolist(), organizers.tolist(), starts, ends, participants.tolist(), status)]
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    first_day = date.fromisoformat(args.start) if args.start else date.today() - timedelta(days=args.days // 2)
+    timings, counts = {}, {}
+    t_all = time.perf_counter()
+
+    with engine.begin() as conn:
+        if args.reset:
+            t = time.perf_counter()
+            reset(conn)
+            timings["reset_s"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        password = utils.hash(args.password)     #one hash shared by every generated user
+        user_ids = np.array(conn.execute(insert(tablesmodel.User).returning(tablesmodel.User.id), [
+            {"email": USER_EMAIL.format(i), "password": password, "is_active": True, "is_verified": True, "role": "user"}
+            for i in range(args.users)
+        ]).scalars().all(), dtype=np.int64)
+        counts["users"] = len(user_ids)
+
+        floors, overlays = [], 0
+        for b in range(args.buildings):
+            for f in range(args.floors):
+                layout, width, height = floor_layout(rng, args.rooms, args.seats)
+                fp_id = conn.execute(insert(tablesmodel.FloorPlan).returning(tablesmodel.FloorPlan.id), {
+                    "name": f"{BUILDING_PREFIX} {b + 1} / {f + 1}", "building": f"{BUILDING_PREFIX} {b + 1}", "floor_number": f + 1,
+                    "image_path": "uploads/campus.png", "image_width": width, "image_height": height, "processing_status": "ready",
+                    "pixels_per_meter": PIXELS_PER_METER, "version": 1, "uploaded_by": int(user_ids[0]) if len(user_ids) else None,
+                }).scalar_one()
+                copy_rows(conn, "overlays", ("floor_plan_id", "type", "label", "capacity", "x", "y", "width", "height", "props"),
+                          [f'{fp_id},{t_},{label},{cap},{x},{y},{w},{h},{{}}\n' for t_, label, cap, x, y, w, h in layout])
+                floors.append(fp_id)
+                overlays += len(layout)
+        counts["floor_plans"], counts["overlays"] = len(floors), overlays
+        timings["layout_s"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        rooms = conn.execute(text("SELECT id, type, capacity FROM overlays WHERE floor_plan_id = ANY(:ids) ORDER BY id"), {"ids": floors}).all()
+        ids = np.array([r[0] for r in rooms], dtype=np.int64)
+        kinds = np.array([r[1] for r in rooms])
+        caps = np.array([r[2] or 1 for r in rooms], dtype=np.int64)
+        columns = ("overlay_id", "organizer_id", "start_ts", "end_ts", "participants", "status")
+        bookings = 0
+        room_ids, room_caps = ids[kinds == "room"], caps[kinds == "room"]
+        for i in range(0, len(room_ids), ROOM_BATCH):
+            batch = room_bookings(rng, room_ids[i:i + ROOM_BATCH], room_caps[i:i + ROOM_BATCH], first_day, args.days, args.occupancy, user_ids)
+            copy_rows(conn, "bookings", columns, booking_lines(rng, *batch, args.cancelled))
+            bookings += len(batch[0])
+        seat_ids = ids[kinds == "seat"]
+        for i in range(0, len(seat_ids), ROOM_BATCH * 4):
+            batch = seat_bookings(rng, seat_ids[i:i + ROOM_BATCH * 4], first_day, args.days, args.seat_occupancy, user_ids)
+            copy_rows(conn, "bookings", columns, booking_lines(rng, *batch, args.cancelled))
+            bookings += len(batch[0])
+        counts["bookings"] = bookings
+        timings["bookings_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    db = sessionLocal()
+    try:
+        counts["rollup_rows"] = sum(analytics.rebuild(db, fp_id) for fp_id in floors)
+        db.commit()
+    finally:
+        db.close()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in ("users", "floor_plans", "overlays", "bookings", "occupancy_hourly"):
+            conn.execute(text(f"ANALYZE {table}"))
+    timings["rollups_s"] = time.perf_counter() - t
+    timings["total_s"] = time.perf_counter() - t_all
+
+    print(" ".join(f"{k}={v:,}" for k, v in counts.items()))
+    print(f"window {first_day} + {args.days} days, " + " ".join(f"{k}={v:.1f}" for k, v in timings.items()))
+    print(f"log in as {USER_EMAIL.format(0)} / {args.password}; floor plan ids {floors[0]}..{floors[-1]}")
+    if args.json:
+        write_json(args.json, "campus", args, {"counts": counts, "timings": timings, "floor_plan_ids": floors, "first_day": first_day})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--buildings", type=int, default=3)
+    parser.add_argument("--floors", type=int, default=4, help="floors per building")
+    parser.add_argument("--rooms", type=int, default=150, help="rooms per floor")
+    parser.add_argument("--seats", type=int, default=300, help="seats per floor")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--start", help="first booking day (YYYY-MM-DD), default: half the window in the past")
+    parser.add_argument("--occupancy", type=float, default=0.45, help="mean chance a room is booked in a working hour")
+    parser.add_argument("--seat-occupancy", type=float, default=0.5, help="chance a seat is booked on a weekday")
+    parser.add_argument("--cancelled", type=float, default=0.05, help="share of cancelled bookings")
+    parser.add_argument("--password", default="campus-password")
+    parser.add_argument("--reset", action="store_true", help="delete a previously generated campus first")
+    parser.add_argument("--json", help="write counts and timings to this file")
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+#Compare two result files of the same benchmark (benchmarks.load --json, or pytest --benchmark-json
+#from benchmarks/micro.py) and print the change of every latency and query metric, worst first.
+#usage: python -m benchmarks.compare results/load-main.json results/load-branch.json
+import argparse
+import json
+
+def flatten(doc: dict) -> dict:
+    metrics = {}
+    if "benchmarks" in doc:     #pytest-benchmark
+        for b in doc["benchmarks"]:
+            metrics[f"{b['name']} median_ms"] = b["stats"]["median"] * 1000
+            metrics[f"{b['name']} max_ms"] = b["stats"]["max"] * 1000
+            if "queries" in b.get("extra_info", {}):
+                metrics[f"{b['name']} queries"] = b["extra_info"]["queries"]
+        return metrics
+    for op, r in doc["results"].get("operations", {}).items():
+        for p in ("p50", "p95", "p99"):
+            if p in r["latency_ms"]:
+                metrics[f"{op} {p}_ms"] = r["latency_ms"][p]
+        if "queries_per_request" in r:
+            metrics[f"{op} queries"] = r["queries_per_request"]
+    return metrics
+
+def main(args):
+    with open(args.before) as f:
+        before = flatten(json.load(f))
+    with open(args.after) as f:
+        after = flatten(json.load(f))
+
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old * 100 if old else (0.0 if new == old else float("inf"))
+        rows.append((change, key, old, new))
+    for change, key, old, new in sorted(rows, reverse=True):
+        flag = " <-- slower" if change > args.threshold and not key.endswith("queries") else " <-- more queries" if key.endswith("queries") and new > old else ""
+        print(f"{key:<55} {old:>12.2f} -> {new:>12.2f}  {change:+7.1f}%{flag}")
+    for key in sorted(before.keys() - after.keys()):
+        print(f"{key:<55} only in {args.before}")
+    for key in sorted(after.keys() - before.keys()):
+        print(f"{key:<55} only in {args.after}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="flag latencies that grew by more than this many percent")
+    main(parser.parse_args())
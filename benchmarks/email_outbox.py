@@ -0,0 +1,50 @@
+#SMTP throughput against a local aiosmtpd stand-in (no database or real mail server needed).
+#Compares the old pattern (new connection + login per message) with the outbox sender's
+#persistent connection. Plain SMTP on localhost, so the gap shown here excludes TLS handshakes,
+#which widen it further against a real server.
+#usage: python -m benchmarks.email_outbox 2000
+import sys
+import smtplib
+import time
+from aiosmtpd.controller import Controller
+
+from app import utils
+from app.services.mailer import SMTPConnection
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+def per_message(host, port, messages):
+    for recipient, body in messages:
+        with smtplib.SMTP(host, port) as server:
+            server.sendmail("bench@example.com", recipient, body)
+
+def pooled(host, port, messages):
+    conn = SMTPConnection(host, port, starttls=False, username=None, password=None, idle_seconds=60)
+    for recipient, body in messages:
+        conn.send("bench@example.com", recipient, body)
+    conn.close()
+
+def main(count: int):
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=8025)
+    controller.start()
+    try:
+        subject, html = utils.otp_email("1234")
+        messages = [(f"user{i}@example.com", utils.build_message(subject, f"user{i}@example.com", html)) for i in range(count)]
+        for label, fn in (("per-message connection", per_message), ("persistent connection", pooled)):
+            before = handler.received
+            t0 = time.perf_counter()
+            fn(controller.hostname, controller.port, messages)
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<24} {count} msgs in {elapsed:.2f}s -> {count / elapsed:.0f} msg/s (received {handler.received - before})")
+    finally:
+        controller.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,155 @@
+#Scripted HTTP load over the campus from benchmarks.campus: --users virtual users log in, then each
+#runs --iterations rounds of browsing (their building's floor list, a floor plan, its overlays,
+#available rooms for an hour) and booking a random room; meanwhile --editors editors save the same
+#floor over and over from their last known version (a 409 refreshes it and retries), the concurrent
+#edit case. Reports per operation the statuses and latency p50/p95/p99 and the SQL statements and
+#database time per request, read from the Server-Timing header (app.metrics): turned on here when the app
+#runs in this process (no --url), a --url server needs SERVER_TIMING_ENABLED=true (and METRICS_ENABLED).
+#usage: python -m benchmarks.load --users 50 --iterations 10 --editors 5 --json results/load.json
+#       python -m benchmarks.load --url http://127.0.0.1:8000 --users 200   (a running server)
+import argparse
+import asyncio
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import httpx
+
+from benchmarks import campus
+from benchmarks.results import percentiles, write_json
+
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+class Recorder:
+    def __init__(self):
+        self.timed = set()
+        self.latency = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.db_ms = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client: httpx.AsyncClient, op: str, method: str, url: str, **kwargs) -> httpx.Response:
+        t0 = time.perf_counter()
+        r = await client.request(method, url, **kwargs)
+        self.latency[op].append((time.perf_counter() - t0) * 1000)
+        self.statuses[op][r.status_code] += 1
+        m = SERVER_TIMING.search(r.headers.get("server-timing", ""))
+        if m:
+            self.timed.add(op)
+            self.queries[op].append(int(m.group(2)))
+            self.db_ms[op].append(float(m.group(1)))
+        return r
+
+    def summary(self):
+        out = {}
+        for op, samples in self.latency.items():
+            out[op] = {"requests": len(samples), "statuses": dict(self.statuses[op]), "latency_ms": percentiles(samples)}
+            if self.queries[op] and op in self.timed:
+                out[op]["queries_per_request"] = sum(self.queries[op]) / len(self.queries[op])
+                out[op]["queries_max"] = max(self.queries[op])
+                out[op]["db_ms_per_request"] = sum(self.db_ms[op]) / len(self.db_ms[op])
+        return out
+
+async def login(rec: Recorder, client: httpx.AsyncClient, email: str, password: str) -> dict:
+    r = await rec.request(client, "login", "POST", "/auth/login", json={"email": email, "password": password})
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+async def visitor(rec: Recorder, client: httpx.AsyncClient, args, n: int, rng: random.Random, buildings):
+    headers = await login(rec, client, campus.USER_EMAIL.format(n), args.password)
+    building = buildings[n % len(buildings)]
+    for _ in range(args.iterations):
+        floors = (await rec.request(client, "list_floorplans", "GET", "/floorplans", params={"building": building}, headers=headers)).json()["items"]
+        fp = rng.choice(floors)
+        await rec.request(client, "get_floorplan", "GET", f"/floorplans/{fp['id']}", headers=headers)
+        overlays = (await rec.request(client, "list_overlays", "GET", f"/overlays/floorplan/{fp['id']}", headers=headers)).json()["items"]
+
+        start = (datetime.now(timezone.utc) + timedelta(days=rng.randint(0, 30))).replace(hour=rng.randint(8, 17), minute=0, second=0, microsecond=0)
+        window = {"start": start.isoformat(), "end": (start + timedelta(hours=1)).isoformat()}
+        await rec.request(client, "available_rooms", "GET", "/bookings/available", params={**window, "building": building}, headers=headers)
+
+        rooms = [o for o in overlays if o["type"] == "room"]
+        if rooms:
+            room = rng.choice(rooms)
+            #a 409 (room already taken) is a normal outcome
+            await rec.request(client, "create_booking", "POST", "/bookings", headers=headers, json={
+                "overlay_id": room["id"], "start_ts": window["start"], "end_ts": window["end"], "participants": rng.randint(1, room["capacity"] or 1)})
+
+async def editor(rec: Recorder, client: httpx.AsyncClient, args, n: int, rng: random.Random, floor_id: int, conflicts: list):
+    headers = await login(rec, client, campus.USER_EMAIL.format(args.users + n), args.password)
+    version = (await rec.request(client, "get_floorplan", "GET", f"/floorplans/{floor_id}", headers=headers)).json()["version"]
+    overlays = (await rec.request(client, "list_overlays", "GET", f"/overlays/floorplan/{floor_id}", headers=headers)).json()["items"]
+    for _ in range(args.edits):
+        for _attempt in range(20):
+            moved = rng.randrange(len(overlays))
+            payload = [{k: o[k] for k in ("id", "type", "label", "capacity", "x", "y", "width", "height", "props")} for o in overlays]
+            payload[moved]["x"] += rng.choice((-1, 1))
+            r = await rec.request(client, "save_overlays", "PUT", f"/floorplans/{floor_id}/save", headers=headers,
+                                  json={"floor_plan_id": floor_id, "client_version": version, "overlays": payload})
+            if r.status_code == 200:
+                version = r.json()["new_version"]
+                overlays = payload
+                break
+            if r.status_code != 409:
+                break   #counted in the statuses, this editor moves on
+            #someone saved first: take the server's state and redo the edit on top of it
+            conflicts.append(1)
+            body = r.json()
+            version, overlays = body["server_version"], body["server_overlays"]
+        await asyncio.sleep(args.edit_interval)
+
+async def run(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=120, limits=httpx.Limits(max_connections=args.users + args.editors))
+    else:
+        from app.config import settings
+        from app.main import app
+        settings.server_timing_enabled = True
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+
+    rec = Recorder()
+    async with client:
+        headers = await login(rec, client, campus.USER_EMAIL.format(0), args.password)
+        buildings, cursor = set(), None
+        while True:
+            page = (await client.get("/floorplans", params={"limit": 500, **({"cursor": cursor} if cursor else {})}, headers=headers)).json()
+            buildings |= {fp["building"] for fp in page["items"] if (fp["building"] or "").startswith(campus.BUILDING_PREFIX + " ")}
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        buildings = sorted(buildings)
+        if not buildings:
+            raise SystemExit("no campus in the database, run python -m benchmarks.campus first")
+        edit_floor = (await client.get("/floorplans", params={"building": buildings[0], "limit": 1}, headers=headers)).json()["items"][0]["id"]
+
+        rng = random.Random(args.seed)
+        conflicts = []
+        t0 = time.perf_counter()
+        tasks = [visitor(rec, client, args, n, random.Random(rng.random()), buildings) for n in range(args.users)]
+        tasks += [editor(rec, client, args, n, random.Random(rng.random()), edit_floor, conflicts) for n in range(args.editors)]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+
+    results = rec.summary()
+    total = sum(r["requests"] for r in results.values())
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s), {len(conflicts)} save conflicts retried")
+    for op, r in sorted(results.items()):
+        p = r["latency_ms"]
+        q = f" queries/req={r['queries_per_request']:.1f} (max {r['queries_max']}) db={r['db_ms_per_request']:.1f}ms" if "queries_per_request" in r else ""
+        print(f"{op:<17} n={r['requests']:<5} p50={p['p50']:.1f}ms p95={p['p95']:.1f}ms p99={p['p99']:.1f}ms statuses={r['statuses']}{q}")
+    if args.json:
+        write_json(args.json, "load", args, {"elapsed_s": elapsed, "requests": total, "save_conflicts": len(conflicts), "operations": results})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="base URL of a running server; default: the app in this process")
+    parser.add_argument("--password", default="campus-password")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--editors", type=int, default=5)
+    parser.add_argument("--edits", type=int, default=10, help="saves per editor")
+    parser.add_argument("--edit-interval", type=float, default=0.05, help="seconds between an editor's saves")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write the results to this file")
+    asyncio.run(run(parser.parse_args()))
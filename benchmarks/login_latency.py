@@ -0,0 +1,60 @@
+#Login latency under concurrent load, plus the latency of a cheap endpoint (GET /) measured
+#while the logins run, which shows whether hashing stalls the event loop for everyone else.
+#Run once against the old build and once against the new one to compare.
+#usage: python -m benchmarks.login_latency --url http://127.0.0.1:8000 --email user@example.com \
+#           --password secret --logins 200 --concurrency 50
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "max": max(samples)}
+
+def report(label, samples):
+    p = percentiles(samples)
+    print(f"{label:<10} n={len(samples):<5} " + " ".join(f"{k}={v:.1f}ms" for k, v in p.items()))
+
+async def run(args):
+    login_ms, probe_ms, statuses = [], [], {}
+    done = asyncio.Event()
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=httpx.Limits(max_connections=args.concurrency + 1)) as client:
+        async def login():
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/auth/login", json={"email": args.email, "password": args.password})
+                login_ms.append((time.perf_counter() - t0) * 1000)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        async def probe():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/")
+                probe_ms.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        t0 = time.perf_counter()
+        await asyncio.gather(*[login() for _ in range(args.logins)])
+        elapsed = time.perf_counter() - t0
+        done.set()
+        await prober
+
+    print(f"logins={args.logins} concurrency={args.concurrency} elapsed={elapsed:.2f}s statuses={statuses}")
+    report("login", login_ms)
+    report("GET /", probe_ms)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
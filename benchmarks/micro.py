@@ -0,0 +1,149 @@
+#Microbenchmarks (pytest-benchmark) of the hot paths behind the busiest endpoints, run in process
+#against the campus from benchmarks.campus (the largest campus floor and its building). Each
+#benchmark also records the SQL statements one call issues in its extra_info ("queries").
+#save_overlays commits real edits to that floor (overlays are nudged back and forth).
+#usage: python -m benchmarks.campus --reset   (once)
+#       python -m pytest benchmarks/micro.py --benchmark-json results/micro.json
+#       python -m pytest benchmarks/micro.py --benchmark-compare   (against the last saved run, with --benchmark-autosave)
+from datetime import timedelta
+import pytest
+from sqlalchemy import func, select, text
+
+pytest.importorskip("pytest_benchmark")
+
+from app import oAuth2, schemas, tablesmodel, utils
+from app.database import sessionLocal
+from app.routers import floorplans
+from app.services import analytics, availability, booking_index, heatmap, overlay_snapshots, principal_cache, spatial
+from benchmarks import campus
+from benchmarks.results import count_queries
+
+@pytest.fixture(scope="module")
+def db():
+    session = sessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture(scope="module")
+def floor(db):
+    row = db.execute(text("""
+        SELECT f.id, f.building FROM floor_plans f JOIN overlays o ON o.floor_plan_id = f.id
+        WHERE f.building LIKE :prefix GROUP BY f.id ORDER BY count(*) DESC, f.id LIMIT 1
+    """), {"prefix": campus.BUILDING_PREFIX + " %"}).first()
+    if row is None:
+        pytest.skip("no campus in the database, run python -m benchmarks.campus first")
+    db.rollback()
+    return db.get(tablesmodel.FloorPlan, row[0])
+
+@pytest.fixture(scope="module")
+def booking_span(db, floor):
+    first, last = db.execute(select(func.min(tablesmodel.Booking.start_ts), func.max(tablesmodel.Booking.end_ts)).join(
+        tablesmodel.Overlay, tablesmodel.Overlay.id == tablesmodel.Booking.overlay_id).where(tablesmodel.Overlay.floor_plan_id == floor.id)).one()
+    db.rollback()
+    return first, last
+
+@pytest.fixture(scope="module")
+def window(booking_span):
+    #a working morning in the middle of the generated bookings
+    first, last = booking_span
+    middle = (first + (last - first) / 2).replace(hour=9, minute=0, second=0, microsecond=0)
+    return middle, middle + timedelta(hours=1)
+
+def counted(benchmark, fn, *args, **kwargs):
+    #benchmark fn and record the statements one call issues
+    with count_queries() as stats:
+        fn(*args, **kwargs)
+    benchmark.extra_info["queries"] = stats.queries
+    benchmark.extra_info["db_ms"] = round(stats.db_seconds * 1000, 3)
+    return benchmark(fn, *args, **kwargs)
+
+def test_password_verify(benchmark):
+    hashed = utils.hash("campus-password")
+    assert counted(benchmark, utils.verify, "campus-password", hashed)
+
+@pytest.mark.parametrize("cached", [False, True], ids=["db", "principal_cache"])
+def test_get_current_user(benchmark, db, cached):
+    user = db.scalar(select(tablesmodel.User).where(tablesmodel.User.email == campus.USER_EMAIL.format(0)))
+    token = oAuth2.create_access_token(data={"user_id": user.id, "role": user.role})
+    db.rollback()
+
+    def resolve():
+        if not cached:
+            principal_cache.cache.invalidate(user.id)
+        return oAuth2.resolve_user(token, db)
+    assert counted(benchmark, resolve).id == user.id
+
+@pytest.mark.parametrize("indexed", [False, True], ids=["anti_join", "booking_index"])
+def test_available_rooms_building(benchmark, db, floor, window, indexed):
+    was = booking_index.index.enabled
+    booking_index.index.enabled = indexed
+    try:
+        rooms = counted(benchmark, availability.find_available_rooms, db, *window, building=floor.building)
+    finally:
+        booking_index.index.enabled = was
+    db.rollback()
+    assert isinstance(rooms, list)
+
+def test_nearest_rooms(benchmark, db, floor, window):
+    rooms = counted(benchmark, availability.find_nearest_rooms, db, floor.id, 500, 500, *window, k=5)
+    db.rollback()
+    assert len(rooms) <= 5
+
+def test_save_overlays_move(benchmark, db, floor):
+    #the editor's save: every overlay sent back, 1% of them moved by a pixel (alternating direction)
+    user = principal_cache.Principal.from_user(db.scalar(select(tablesmodel.User).where(tablesmodel.User.email == campus.USER_EMAIL.format(0))))
+    rounds = {"n": 0}
+
+    def payload():
+        db.expire_all()
+        fp = db.get(tablesmodel.FloorPlan, floor.id)
+        rows = db.execute(select(tablesmodel.Overlay).where(tablesmodel.Overlay.floor_plan_id == floor.id).order_by(tablesmodel.Overlay.id)).scalars().all()
+        rounds["n"] += 1
+        step = 1 if rounds["n"] % 2 else -1
+        overlays = [{"id": o.id, "type": o.type, "label": o.label, "capacity": o.capacity, "x": o.x + (step if i % 100 == 0 else 0), "y": o.y,
+                     "width": o.width, "height": o.height, "props": o.props or {}} for i, o in enumerate(rows)]
+        db.rollback()
+        return (floor.id, schemas.SaveOverlays(floor_plan_id=floor.id, client_version=fp.version, overlays=overlays), db, user), {}
+
+    args, _ = payload()
+    with count_queries() as stats:
+        floorplans.save_overlays(*args)
+    benchmark.extra_info["queries"] = stats.queries
+    benchmark.extra_info["db_ms"] = round(stats.db_seconds * 1000, 3)
+    result = benchmark.pedantic(floorplans.save_overlays, setup=payload, rounds=10)
+    assert result["status"] == "ok"
+
+def test_overlay_snapshot_serialize(benchmark, db, floor):
+    rows = db.execute(overlay_snapshots._overlays_stmt(floor.id)).all()
+    db.rollback()
+    assert counted(benchmark, overlay_snapshots.serialize, rows)
+
+def test_spatial_index_build(benchmark, db, floor):
+    rows = db.execute(select(*(getattr(tablesmodel.Overlay, c) for c in spatial.OVERLAY_COLUMNS)).where(tablesmodel.Overlay.floor_plan_id == floor.id)).all()
+    db.rollback()
+    overlays = [dict(zip(spatial.OVERLAY_COLUMNS, r)) for r in rows]
+    counted(benchmark, spatial.GridIndex, overlays)
+
+def test_analytics_utilization_building(benchmark, db, floor, window):
+    w = analytics.Window(window[0] - timedelta(days=30), window[0], building=floor.building, day_start=8, day_end=18, weekdays_only=True)
+    result = counted(benchmark, analytics.utilization, db, w)
+    db.rollback()
+    assert result["summary"]["overlays"] > 0
+
+def test_analytics_utilization_building_year(benchmark, db, floor, booking_span):
+    #the last year of bookings (python -m benchmarks.campus --days 365 generates a full one)
+    w = analytics.Window(booking_span[1] - timedelta(days=365), booking_span[1], building=floor.building, day_start=8, day_end=18, weekdays_only=True)
+    result = counted(benchmark, analytics.utilization, db, w)
+    db.rollback()
+    assert result["summary"]["overlays"] > 0
+
+def test_heatmap_render_uncached(benchmark, db, floor, window):
+    w = analytics.Window(window[0] - timedelta(days=30), window[0], floor_plan_id=floor.id)
+    token = heatmap.cache_token(db, floor.id)
+
+    def render():
+        heatmap.cache.clear()
+        return heatmap.render(db, floor, w, token, 2048)
+    png, scale = counted(benchmark, render)
+    db.rollback()
+    assert png.startswith(b"\x89PNG")
@@ -0,0 +1,61 @@
+#Full-floor overlay list serialization, in process on synthetic rows (no database needed).
+#Compares the response_model path (ORM objects validated into Page[OverlayOut], then JSON encoded
+#by FastAPI) with building the orjson snapshot from rows, and with serving a cached snapshot.
+#Each variant is timed as a bare function and as a request through a FastAPI app.
+#usage: python -m benchmarks.overlay_serialization 5000
+import sys
+import time
+from datetime import datetime, timezone
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from app import schemas, tablesmodel
+from app.services import overlay_snapshots
+
+def synthetic_rows(n: int):
+    now = datetime.now(timezone.utc)
+    return [(i, 1, "seat" if i % 4 else "room", f"S-{i}", 1 + i % 8, (i % 100) * 40, (i // 100) * 40, 30, 30,
+             {"zone": i % 7, "accessible": i % 3 == 0}, 1, now) for i in range(1, n + 1)]
+
+def orm_objects(rows):
+    return [tablesmodel.Overlay(**dict(zip(overlay_snapshots.COLUMNS, r))) for r in rows]
+
+def bench(label: str, fn, repeat: int = 20):
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<44} {best * 1000:>9.2f} ms")
+
+def main(n: int):
+    rows = synthetic_rows(n)
+    objs = orm_objects(rows)
+    cached = overlay_snapshots.serialize(rows)
+    page_model = schemas.Page[schemas.OverlayOut]
+    print(f"{n} overlays, {len(cached):,} bytes of JSON")
+
+    bench("pydantic: validate + dump_json", lambda: page_model.model_validate({"items": objs, "next_cursor": None}).model_dump_json())
+    bench("orjson: snapshot from rows", lambda: overlay_snapshots.serialize(rows))
+
+    app = FastAPI()
+
+    @app.get("/response-model", response_model=page_model)
+    def via_response_model():
+        return {"items": objs, "next_cursor": None}
+
+    @app.get("/snapshot-build")
+    def via_snapshot_build():
+        return Response(b'{"items":' + overlay_snapshots.serialize(rows) + b',"next_cursor":null}', media_type="application/json")
+
+    @app.get("/snapshot-cached")
+    def via_snapshot_cached():
+        return Response(b'{"items":' + cached + b',"next_cursor":null}', media_type="application/json")
+
+    with TestClient(app) as client:
+        for path in ("/response-model", "/snapshot-build", "/snapshot-cached"):
+            bench(f"request: GET {path}", lambda: client.get(path).content)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
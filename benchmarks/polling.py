@@ -0,0 +1,53 @@
+#Editor polling with and without conditional requests: repeatedly GET a floor plan and its overlays,
+#once as plain GETs and once sending If-None-Match with the last ETag, and report bytes received,
+#latency, and rows Postgres read for the run (pg_stat_database deltas, so run it on an idle database).
+#Uses the app's DATABASE_* settings to read the statistics.
+#usage: python -m benchmarks.polling --url http://127.0.0.1:8000 --floorplan 1 --polls 500
+import argparse
+import statistics
+import time
+import httpx
+from sqlalchemy import text
+
+from app.database import engine
+
+def db_counters():
+    #statistics are flushed by backends asynchronously, give them a moment
+    time.sleep(1.5)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_stat_clear_snapshot()"))
+        row = conn.execute(text("SELECT tup_returned, tup_fetched, xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()")).one()
+    return {"rows_scanned": row[0], "rows_fetched": row[1], "transactions": row[2]}
+
+def poll(client: httpx.Client, paths, polls: int, conditional: bool):
+    etags, received, ms, statuses = {}, 0, [], {}
+    before = db_counters()
+    for _ in range(polls):
+        for path in paths:
+            headers = {"If-None-Match": etags[path]} if conditional and path in etags else {}
+            t0 = time.perf_counter()
+            r = client.get(path, headers=headers)
+            ms.append((time.perf_counter() - t0) * 1000)
+            received += len(r.content)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+            if "etag" in r.headers:
+                etags[path] = r.headers["etag"]
+    after = db_counters()
+    return received, ms, statuses, {k: after[k] - before[k] for k in after}
+
+def main(args):
+    paths = [f"/floorplans/{args.floorplan}", f"/overlays/floorplan/{args.floorplan}"]
+    with httpx.Client(base_url=args.url, timeout=60) as client:
+        for label, conditional in (("plain GET", False), ("If-None-Match", True)):
+            received, ms, statuses, db = poll(client, paths, args.polls, conditional)
+            q = statistics.quantiles(ms, n=100, method="inclusive")
+            print(f"{label:<14} requests={len(ms)} statuses={statuses} bytes={received:,} ({received / len(ms):,.0f}/req) "
+                  f"p50={q[49]:.2f}ms p95={q[94]:.2f}ms")
+            print(f"{'':<14} db: " + " ".join(f"{k}={v:,}" for k, v in db.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--floorplan", type=int, required=True)
+    parser.add_argument("--polls", type=int, default=500)
+    main(parser.parse_args())
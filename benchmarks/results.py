@@ -0,0 +1,53 @@
+#Helpers shared by the benchmark scripts: latency percentiles, a SQL statement counter (app.metrics'),
+#and JSON result files that carry enough context (commit, host, arguments) to compare runs over time.
+import json
+import os
+import platform
+import statistics
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from app import metrics
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        return {"p50": samples[0], "p95": samples[0], "p99": samples[0], "max": samples[0]}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "max": max(samples)}
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_json(path: str, benchmark: str, args, results: dict):
+    doc = {
+        "benchmark": benchmark,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "args": vars(args) if args is not None else {},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2, default=str)
+    print(f"results written to {path}")
+
+@contextmanager
+def count_queries():
+    #statements and database time of the block, counted by app.metrics' listeners as they are for a request
+    #(Starlette's threadpool and asyncio tasks copy the context, so statements land where they were issued)
+    metrics.listen()
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        yield stats
+    finally:
+        metrics.current_request.reset(token)
@@ -0,0 +1,122 @@
+#Time to first request of freshly started API workers: --workers uvicorn processes are started at
+#once (each on its own port, as gunicorn would boot them, and all against the same database) and
+#polled until GET / answers ("ready"); each then serves its first real request, an editor opening
+#the most recently edited floor plan (GET /floorplans/{id} then its full overlay list), timed on its
+#own ("first_request") and from process start ("time_to_first_request"). Repeated --runs times.
+#--preload imports the app once and forks the workers from it instead, as gunicorn --preload does.
+#usage: python -m benchmarks.startup --workers 4 --runs 5 --json results/startup.json
+#       python -m benchmarks.startup --workers 4 --runs 5 --preload
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+import httpx
+from sqlalchemy import func, select
+
+from app import oAuth2, tablesmodel
+from app.database import sessionLocal
+from benchmarks import campus
+from benchmarks.results import percentiles, write_json
+
+def hot_floor_and_token():
+    with sessionLocal() as db:
+        floor_id = db.scalar(select(tablesmodel.FloorPlanVersion.floor_plan_id).order_by(tablesmodel.FloorPlanVersion.created_at.desc()).limit(1))
+        if floor_id is None:
+            floor_id = db.scalar(select(func.max(tablesmodel.FloorPlan.id)))
+        user = db.scalar(select(tablesmodel.User).where(tablesmodel.User.email == campus.USER_EMAIL.format(0)))
+        if floor_id is None or user is None:
+            raise SystemExit("no campus in the database, run python -m benchmarks.campus first")
+        return floor_id, oAuth2.create_access_token(data={"user_id": user.id, "role": user.role})
+
+def serve_preloaded(port: int, workers: int):
+    #the --preload parent: import once, fork a uvicorn server per port, stop them all on SIGTERM
+    import uvicorn
+    from app.main import app
+
+    children = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            uvicorn.run(app, port=port + i, log_level="warning")
+            os._exit(0)
+        children.append(pid)
+    signal.signal(signal.SIGTERM, lambda *_: [os.kill(pid, signal.SIGTERM) for pid in children])
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except InterruptedError:
+                pass
+
+async def spawn(cmd):
+    return await asyncio.create_subprocess_exec(sys.executable, *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+
+async def first_request(proc, started: float, port: int, floor_id: int, headers: dict, timeout: float):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+        while True:
+            if proc.returncode is not None or time.perf_counter() - started > timeout:
+                raise RuntimeError(f"worker on port {port} did not start")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.02)
+        ready = time.perf_counter()
+        for url in (f"/floorplans/{floor_id}", f"/overlays/floorplan/{floor_id}"):
+            (await client.get(url, headers=headers)).raise_for_status()
+        done = time.perf_counter()
+    return {"ready": (ready - started) * 1000, "first_request": (done - ready) * 1000, "time_to_first_request": (done - started) * 1000}
+
+async def boot_all(args, floor_id: int, headers: dict):
+    ports = [args.port + i for i in range(args.workers)]
+    started = time.perf_counter()
+    if args.preload:
+        procs = [await spawn(["-m", "benchmarks.startup", "--serve-preloaded", "--port", str(args.port), "--workers", str(args.workers)])] * len(ports)
+    else:
+        procs = await asyncio.gather(*(spawn(["-m", "uvicorn", "app.main:app", "--port", str(p), "--log-level", "warning"]) for p in ports))
+    try:
+        return await asyncio.gather(*(first_request(proc, started, p, floor_id, headers, args.timeout) for proc, p in zip(procs, ports)))
+    finally:
+        for proc in set(procs):
+            proc.terminate()
+            await proc.wait()
+
+async def run(args):
+    floor_id, token = hot_floor_and_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    samples = {"ready": [], "first_request": [], "time_to_first_request": []}
+    for n in range(args.runs):
+        results = await boot_all(args, floor_id, headers)
+        for r in results:
+            for k, v in r.items():
+                samples[k].append(v)
+        print(f"run {n + 1}: " + "  ".join(f"{k}={max(r[k] for r in results):.0f}ms" for k in samples) + "  (slowest worker)")
+
+    operations = {k: {"requests": len(v), "latency_ms": percentiles(v)} for k, v in samples.items()}
+    for k, r in operations.items():
+        p = r["latency_ms"]
+        print(f"{k:<22} p50={p['p50']:.0f}ms p95={p['p95']:.0f}ms max={p['max']:.0f}ms")
+    if args.json:
+        write_json(args.json, "startup", args, {"floor_plan_id": floor_id, "operations": operations})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4, help="processes started at the same time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=18000, help="first port, worker i listens on port + i")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--preload", action="store_true", help="fork the workers from one process that imported the app")
+    parser.add_argument("--serve-preloaded", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    if not os.path.exists("app/main.py"):
+        raise SystemExit("run from the repository root")
+    if args.serve_preloaded:
+        serve_preloaded(args.port, args.workers)
+    else:
+        asyncio.run(run(args))
@@ -0,0 +1,89 @@
+#Fan-out latency of the live edit channel: N editors subscribe to one floor plan over
+#/ws/floorplans/{id}, one client updates an overlay M times, and every subscriber records how long
+#after the server enqueued the event (its "ts") the message arrived. Run the server with several
+#workers (uvicorn --workers 4) to include the LISTEN/NOTIFY hop between workers.
+#usage: python -m benchmarks.ws_fanout --url http://127.0.0.1:8000 --email admin@example.com \
+#           --password secret --floorplan 1 --subscribers 300 --edits 50
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+import websockets
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "max": max(samples)}
+
+def report(label, samples):
+    p = percentiles(samples)
+    print(f"{label:<22} n={len(samples):<6} " + " ".join(f"{k}={v:.1f}ms" for k, v in p.items()))
+
+async def subscriber(ws_url, edits, connected, received, stats):
+    async with websockets.connect(ws_url, max_queue=None, open_timeout=30) as ws:
+        hello = json.loads(await ws.recv())
+        assert hello["type"] == "hello", hello
+        connected.release()
+        got = 0
+        while got < edits:
+            msg = json.loads(await ws.recv())
+            now = time.time()
+            if msg["type"] in ("patch", "version"):
+                received.append((msg["version"], (now - msg["ts"]) * 1000))
+                got += 1
+            elif msg["type"] == "resync":
+                stats["resync"] += 1
+                return
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        r = await client.post("/auth/login", json={"email": args.email, "password": args.password})
+        r.raise_for_status()
+        token = r.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        ov = (await client.post("/overlays", headers=headers, json={"floor_plan_id": args.floorplan, "type": "seat", "label": "fanout-bench",
+                                                                      "capacity": 1, "x": 0, "y": 0, "width": 10, "height": 10})).json()
+
+        ws_url = args.url.replace("http", "ws", 1) + f"/ws/floorplans/{args.floorplan}?token={token}"
+        connected, received, stats = asyncio.Semaphore(0), [], {"resync": 0}
+        t0 = time.perf_counter()
+        subs = [asyncio.create_task(subscriber(ws_url, args.edits, connected, received, stats)) for _ in range(args.subscribers)]
+        for _ in range(args.subscribers):
+            await connected.acquire()
+        print(f"{args.subscribers} subscribers connected in {time.perf_counter() - t0:.2f}s")
+
+        put_ms = []
+        for i in range(args.edits):
+            t = time.perf_counter()
+            await client.put(f"/overlays/{ov['id']}", headers=headers, json={"type": "seat", "label": f"fanout-bench {i}", "capacity": 1,
+                                                                              "x": i, "y": 0, "width": 10, "height": 10})
+            put_ms.append((time.perf_counter() - t) * 1000)
+            await asyncio.sleep(args.interval)
+
+        done, pending = await asyncio.wait(subs, timeout=30)
+        for task in pending:
+            task.cancel()
+        await client.delete(f"/overlays/{ov['id']}", headers=headers)
+
+    per_edit = {}
+    for version, ms in received:
+        per_edit[version] = max(ms, per_edit.get(version, 0.0))
+    expected = args.subscribers * args.edits
+    print(f"delivered {len(received)}/{expected} messages, resyncs={stats['resync']}, unfinished subscribers={len(pending)}")
+    report("PUT /overlays", put_ms)
+    report("per message", [ms for _, ms in received])
+    report("last subscriber/edit", list(per_edit.values()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--floorplan", type=int, required=True)
+    parser.add_argument("--subscribers", type=int, default=300)
+    parser.add_argument("--edits", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between edits")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,38 @@
+import os
+import pytest
+
+#app.config needs these to import; values from the environment or .env win. Tests that need the
+#database use the `db` fixture and are skipped when it cannot be reached.
+for name, value in {
+    "DATABASE_HOSTNAME": "127.0.0.1",
+    "DATABASE_PORT": "5432",
+    "DATABASE_PASSWORD": "postgres",
+    "DATABASE_NAME": "floorplans_test",
+    "DATABASE_USERNAME": "postgres",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "EMAIL": "noreply@example.com",
+    "SMTP_PASSWORD": "unused",
+}.items():
+    os.environ.setdefault(name, value)
+
+@pytest.fixture
+def db():
+    #a session inside a transaction that is rolled back afterwards, commits in the code under test become savepoints
+    from sqlalchemy import exc
+    from sqlalchemy.orm import Session
+    from app.database import engine
+
+    try:
+        conn = engine.connect()
+    except exc.OperationalError as e:
+        pytest.skip(f"database not reachable: {e.orig}")
+    outer = conn.begin()
+    session = Session(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        outer.rollback()
+        conn.close()
@@ -0,0 +1,61 @@
+from datetime import datetime
+from sqlalchemy import select
+
+from app import tablesmodel
+from app.services import analytics
+
+def add_room(db, capacity):
+    fp = tablesmodel.FloorPlan(name="analytics test", image_path="test.png", version=1)
+    db.add(fp)
+    db.flush()
+    room = tablesmodel.Overlay(floor_plan_id=fp.id, type="room", label="R", capacity=capacity, x=0, y=0, width=10, height=10, props={})
+    db.add(room)
+    db.flush()
+    return fp, room
+
+def book(db, room, start, end, participants):
+    b = tablesmodel.Booking(overlay_id=room.id, start_ts=start, end_ts=end, participants=participants, status="confirmed",
+                            **analytics.capacity_flags(participants, room.capacity))
+    db.add(b)
+    db.flush()
+    analytics.record_booking(db, b)
+    return b
+
+def rollups(db, room):
+    rows = db.execute(select(tablesmodel.OccupancyHourly).where(tablesmodel.OccupancyHourly.overlay_id == room.id)
+                      .order_by(tablesmodel.OccupancyHourly.hour)).scalars()
+    return [(r.hour, *(getattr(r, f) for f in analytics.ROLLUP_FIELDS)) for r in rows]
+
+def test_capacity_flags():
+    assert analytics.capacity_flags(6, 4) == {"over_capacity": True, "under_half": False}
+    assert analytics.capacity_flags(2, 4) == {"over_capacity": False, "under_half": True}
+    assert analytics.capacity_flags(3, 4) == {"over_capacity": False, "under_half": False}
+    assert analytics.capacity_flags(None, 4) == analytics.capacity_flags(0, 4) == analytics.capacity_flags(3, None) == {"over_capacity": False, "under_half": False}
+
+def test_cancel_after_capacity_change(db):
+    fp, room = add_room(db, capacity=4)
+    b = book(db, room, datetime(2030, 1, 7, 9, 30), datetime(2030, 1, 7, 11), participants=6)
+    assert rollups(db, room)[0][1:] == (1800, 10800, 1, 1, 0)
+
+    room.capacity = 20
+    b.status = "cancelled"
+    analytics.record_booking(db, b, sign=-1)
+    assert all(r[1:] == (0, 0, 0, 0, 0) for r in rollups(db, room))
+
+def test_rebuild_matches_the_booking_writes(db):
+    fp, room = add_room(db, capacity=4)
+    book(db, room, datetime(2030, 1, 7, 9, 30), datetime(2030, 1, 7, 11), participants=6)
+    book(db, room, datetime(2030, 1, 7, 10, 15), datetime(2030, 1, 7, 10, 45), participants=2)
+    b = book(db, room, datetime(2030, 1, 7, 12), datetime(2030, 1, 7, 13), participants=1)
+    b.status = "cancelled"
+    analytics.record_booking(db, b, sign=-1)
+    incremental = [r for r in rollups(db, room) if any(r[1:])]
+
+    analytics.rebuild(db, fp.id)
+    assert rollups(db, room) == incremental
+
+    #a rebuild flags the bookings again against the current capacity, a cancel then subtracts those
+    room.capacity = 12
+    db.flush()
+    analytics.rebuild(db, fp.id)
+    assert [r[4:] for r in rollups(db, room)] == [(0, 1), (0, 1)]
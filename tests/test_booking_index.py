@@ -0,0 +1,61 @@
+import random
+from datetime import datetime, timedelta
+
+from app.services.booking_index import RoomIntervals
+
+T0 = datetime(2030, 1, 7)
+
+def at(minutes: int) -> datetime:
+    return T0 + timedelta(minutes=minutes)
+
+def room(*spans):
+    #(start, end) in minutes after T0, ids 1..n
+    rows = sorted((at(s), at(e), i, None) for i, (s, e) in enumerate(spans, 1))
+    return RoomIntervals(0, T0, rows)
+
+def ids(rows):
+    return sorted(r[2] for r in rows)
+
+def test_half_open_edges():
+    r = room((60, 120), (120, 180))
+    assert r.disjoint
+    assert ids(r.overlapping(at(0), at(60))) == []
+    assert ids(r.overlapping(at(180), at(240))) == []
+    assert ids(r.overlapping(at(119), at(121))) == [1, 2]
+    assert ids(r.overlapping(at(120), at(121))) == [2]
+    assert ids(r.overlapping(at(60), at(61))) == [1]
+
+def test_insert_and_remove():
+    r = room((60, 120), (240, 300))
+    r.insert((at(120), at(240), 3, None))
+    assert r.disjoint and ids(r.overlapping(at(100), at(250))) == [1, 2, 3]
+    assert r.starts == sorted(r.starts) and r.ends == sorted(r.ends)
+    assert r.remove(3) and not r.remove(3)
+    assert ids(r.overlapping(at(130), at(230))) == []
+
+def test_double_booking_falls_back_to_a_scan():
+    r = room((60, 300), (120, 180))
+    assert not r.disjoint
+    assert ids(r.overlapping(at(200), at(210))) == [1]
+    r = room((60, 120))
+    r.insert((at(90), at(150), 2, None))
+    assert not r.disjoint and ids(r.overlapping(at(130), at(140))) == [2]
+
+def test_against_brute_force():
+    rng = random.Random(7)
+    for trial in range(200):
+        spans = []
+        for _ in range(rng.randrange(30)):
+            s = rng.randrange(0, 1000, 15)
+            spans.append((s, s + rng.randrange(15, 120, 15)))
+        r = room(*spans)
+        if trial % 2:
+            #some rooms are grown booking by booking
+            r = room()
+            for i, (s, e) in enumerate(spans, 1):
+                r.insert((at(s), at(e), i, None))
+        for _ in range(20):
+            s = rng.randrange(-60, 1100, 5)
+            e = s + rng.randrange(1, 200)
+            expected = [i for i, (bs, be) in enumerate(spans, 1) if bs < e and be > s]
+            assert ids(r.overlapping(at(s), at(e))) == expected
@@ -0,0 +1,25 @@
+from app.services import heatmap
+
+def test_cache_is_bounded_by_bytes():
+    cache = heatmap.HeatmapCache(max_bytes=1000)
+    for i in range(5):
+        cache.put(i, (b"x" * 300, 1))
+    #the oldest go first, the total stays within the bound
+    assert [cache.get(i) is not None for i in range(5)] == [False, False, True, True, True]
+    assert cache.stats()["bytes"] == 900
+
+    cache.put(4, (b"x" * 100, 2))
+    assert cache.stats()["bytes"] == 700
+    assert cache.get(4) == (b"x" * 100, 2)
+
+def test_oversized_entry_is_kept_alone():
+    cache = heatmap.HeatmapCache(max_bytes=100)
+    cache.put("a", (b"x" * 50, 1))
+    cache.put("b", (b"x" * 500, 1))
+    assert cache.get("a") is None and cache.get("b") is not None
+    assert cache.stats()["entries"] == 1
+
+def test_scale_for():
+    assert heatmap.scale_for(2000, 1000, 2048) == 1
+    assert heatmap.scale_for(5000, 1000, 2048) == 4
+    assert heatmap.scale_for(4096, 4096, 2048) == 2
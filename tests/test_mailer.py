@@ -0,0 +1,43 @@
+import smtplib
+import uuid
+
+from app import tablesmodel
+from app.config import settings
+from app.services import mailer
+
+class FakeConnection:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.recipients = []
+
+    def send(self, sender, recipient, message):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected("gone")
+        self.recipients.append(recipient)
+
+    def close(self):
+        pass
+
+def outbox(db, recipient):
+    return db.query(tablesmodel.EmailOutbox).filter(tablesmodel.EmailOutbox.recipient == recipient).one()
+
+def test_failed_message_loses_its_body(db, monkeypatch):
+    monkeypatch.setattr(settings, "email_max_attempts", 1)
+    monkeypatch.setattr(settings, "email_batch_size", 100_000)
+    recipient = f"{uuid.uuid4().hex}@example.com"
+    mailer.enqueue(db, recipient, "Reset", "<h1>12345678</h1>", expires_after=600)
+    db.commit()
+    mailer.drain_once(db, FakeConnection(fail=True))
+    msg = outbox(db, recipient)
+    assert msg.status == "failed" and msg.html is None
+
+def test_expired_message_is_not_sent(db, monkeypatch):
+    monkeypatch.setattr(settings, "email_batch_size", 100_000)
+    expired, live = f"{uuid.uuid4().hex}@example.com", f"{uuid.uuid4().hex}@example.com"
+    mailer.enqueue(db, expired, "Reset", "<h1>12345678</h1>", expires_after=-1)
+    mailer.enqueue(db, live, "Reset", "<h1>87654321</h1>", expires_after=600)
+    db.commit()
+    conn = FakeConnection(fail=False)
+    mailer.drain_once(db, conn)
+    assert live in conn.recipients and expired not in conn.recipients
+    assert outbox(db, live).html is None and outbox(db, expired).status == "pending"
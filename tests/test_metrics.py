@@ -0,0 +1,36 @@
+import logging
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.config import settings
+
+def client():
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    app.add_middleware(metrics.MetricsMiddleware)
+    return TestClient(app)
+
+def test_server_timing_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(settings, "server_timing_enabled", False)
+    r = client().get("/ping")
+    assert r.status_code == 200 and "server-timing" not in r.headers
+
+def test_server_timing_header(monkeypatch):
+    monkeypatch.setattr(settings, "server_timing_enabled", True)
+    r = client().get("/ping")
+    assert r.headers["server-timing"].startswith("app;dur=") and 'desc="0 queries"' in r.headers["server-timing"]
+
+def test_slow_statement_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "slow_query_ms", 100)
+    stats = metrics.RequestStats()
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        metrics.registry.observe_statement(0.05, stats, "SELECT 1")
+        metrics.registry.observe_statement(0.2, stats, "SELECT\n  pg_sleep(0.2)")
+    assert [r.getMessage() for r in caplog.records] == ["slow query 200.0ms in background: SELECT pg_sleep(0.2)"]
+    assert stats.queries == 2 and stats.db_seconds == pytest.approx(0.25)
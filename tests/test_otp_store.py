@@ -0,0 +1,110 @@
+import uuid
+import pytest
+
+from app import tablesmodel
+from app.config import settings
+from app.services import otp_store
+
+EMAIL = "user@example.com"
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(otp_store.time, "monotonic", clock)
+    monkeypatch.setattr(settings, "otp_ttl_seconds", 600)
+    monkeypatch.setattr(settings, "otp_max_attempts", 3)
+    return clock
+
+def wrong(code: str) -> str:
+    return str((int(code) + 1) % 10 ** len(code)).zfill(len(code))
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        otp_store.OTPStore()
+
+def test_code_length(monkeypatch):
+    monkeypatch.setattr(settings, "otp_digits", 8)
+    codes = [otp_store.utils.generate_otp() for _ in range(200)]
+    assert all(len(c) == 8 and c.isdigit() for c in codes) and len(set(codes)) > 190
+
+def test_issue_and_verify(clock):
+    store = otp_store.MemoryOTPStore()
+    code = store.issue(None, EMAIL)
+    assert store.verify(None, EMAIL, wrong(code)) == otp_store.INVALID
+    assert store.verify(None, EMAIL, code) == otp_store.VALID
+    #used up
+    assert store.verify(None, EMAIL, code) == otp_store.MISSING
+
+def test_new_code_replaces_the_old_one(clock):
+    store = otp_store.MemoryOTPStore()
+    first = store.issue(None, EMAIL)
+    second = store.issue(None, EMAIL)
+    if first != second:
+        assert store.verify(None, EMAIL, first) == otp_store.INVALID
+    assert store.verify(None, EMAIL, second) == otp_store.VALID
+
+def test_expired_code_is_missing(clock):
+    store = otp_store.MemoryOTPStore()
+    code = store.issue(None, EMAIL)
+    clock.now += 600
+    assert store.verify(None, EMAIL, code) == otp_store.MISSING
+
+def test_locked_after_max_attempts(clock):
+    store = otp_store.MemoryOTPStore()
+    code = store.issue(None, EMAIL)
+    assert [store.verify(None, EMAIL, wrong(code)) for _ in range(3)] == [otp_store.INVALID, otp_store.INVALID, otp_store.LOCKED]
+    #the right code does not help once locked
+    assert store.verify(None, EMAIL, code) == otp_store.LOCKED
+
+def test_resend_keeps_the_attempt_budget(clock):
+    store = otp_store.MemoryOTPStore()
+    code = store.issue(None, EMAIL)
+    assert store.verify(None, EMAIL, wrong(code)) == otp_store.INVALID
+    assert store.verify(None, EMAIL, wrong(code)) == otp_store.INVALID
+    clock.now += 300
+    code = store.issue(None, EMAIL)
+    assert store.verify(None, EMAIL, wrong(code)) == otp_store.LOCKED
+    #no new code while locked, and the lock is not extended
+    clock.now += 300
+    assert store.issue(None, EMAIL) is None
+    assert store.verify(None, EMAIL, code) == otp_store.LOCKED
+    clock.now += 300
+    assert store.verify(None, EMAIL, code) == otp_store.MISSING
+    code = store.issue(None, EMAIL)
+    assert store.verify(None, EMAIL, code) == otp_store.VALID
+
+def test_sweep(clock):
+    store = otp_store.MemoryOTPStore()
+    for i in range(5):
+        store.issue(None, f"old{i}@example.com")
+    clock.now += 300
+    store.issue(None, EMAIL)
+    clock.now += 300
+    assert store.sweep(batch_size=2) == 5
+    assert list(store._codes) == [EMAIL]
+    assert store.sweep(batch_size=2) == 0
+
+def test_database_resend_keeps_the_attempt_budget(db, monkeypatch):
+    monkeypatch.setattr(settings, "otp_max_attempts", 3)
+    email = f"otp-{uuid.uuid4().hex}@example.com"
+    db.add(tablesmodel.User(email=email, password="x", role="user"))
+    db.flush()
+    store = otp_store.DatabaseOTPStore()
+    code = store.issue(db, email)
+    assert store.verify(db, email, wrong(code)) == otp_store.INVALID
+    assert store.verify(db, email, wrong(code)) == otp_store.INVALID
+    code = store.issue(db, email)
+    assert store.verify(db, email, wrong(code)) == otp_store.LOCKED
+    assert store.issue(db, email) is None
+    assert store.verify(db, email, code) == otp_store.LOCKED
+    #once expired the email starts over
+    db.execute(otp_store.update(tablesmodel.OTP).where(tablesmodel.OTP.email == email).values(expires_at=otp_store.func.now()))
+    code = store.issue(db, email)
+    assert store.verify(db, email, code) == otp_store.VALID
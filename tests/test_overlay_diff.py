@@ -0,0 +1,37 @@
+import pytest
+
+from app.services.overlay_diff import OVERLAY_FIELDS, UnknownOverlays, compute_diff
+
+def fields(label, **changes):
+    return {**{f: None for f in OVERLAY_FIELDS}, "type": "room", "label": label, "capacity": 4, "x": 0, "y": 0, "width": 10, "height": 10,
+            "props": {}, **changes}
+
+EXISTING = {1: fields("A"), 2: fields("B"), 3: fields("C")}
+
+def test_add_update_delete_and_unchanged():
+    incoming = [
+        {"id": 1, **fields("A")},                       #unchanged
+        {"id": 2, **fields("B", capacity=8)},           #updated
+        {**fields("D"), "created_by": 7},               #new; non-editable keys are dropped
+    ]
+    diff = compute_diff(EXISTING, incoming)
+    assert diff.inserts == [fields("D")]
+    assert diff.updates == [{"id": 2, **fields("B", capacity=8)}]
+    assert diff.deletes == [3]
+
+def test_same_payload_is_empty():
+    diff = compute_diff(EXISTING, [{"id": oid, **f} for oid, f in EXISTING.items()])
+    assert diff.is_empty()
+
+def test_missing_fields_count_as_changes():
+    diff = compute_diff(EXISTING, [{"id": 1, "label": "A"}, {"id": 2, **fields("B")}, {"id": 3, **fields("C")}])
+    assert [u["id"] for u in diff.updates] == [1] and diff.updates[0]["capacity"] is None
+
+def test_empty_payload_deletes_everything():
+    diff = compute_diff(EXISTING, [])
+    assert diff.deletes == [1, 2, 3] and not diff.inserts and not diff.updates
+
+def test_unknown_and_repeated_ids():
+    with pytest.raises(UnknownOverlays) as e:
+        compute_diff(EXISTING, [{"id": 9, **fields("X")}, {"id": 1, **fields("A")}, {"id": 1, **fields("A")}])
+    assert e.value.ids == [1, 9]
@@ -0,0 +1,36 @@
+import base64
+from datetime import datetime, timezone
+import pytest
+from fastapi import HTTPException
+
+from app import pagination
+
+def test_round_trip():
+    created = datetime(2030, 1, 7, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = pagination.encode_cursor(created, 42)
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor, datetime, int) == (created, 42)
+    assert pagination.decode_cursor(pagination.encode_cursor("Room 1", 7), str, int) == ("Room 1", 7)
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64 !",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    pagination.encode_cursor(42),                       #wrong arity
+    pagination.encode_cursor("yesterday", 42),          #not a datetime
+    pagination.encode_cursor("2030-01-07T09:30:00", "x"),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),     #not a list
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),     #not utf-8
+    pagination.encode_cursor(None, 42),
+])
+def test_malformed_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        pagination.decode_cursor(cursor, datetime, int)
+    assert e.value.status_code == 400
+
+def test_page():
+    rows = [(i, f"r{i}") for i in range(5)]
+    assert pagination.page(rows[:3], 3, lambda r: r) == {"items": rows[:3], "next_cursor": None}
+    result = pagination.page(rows[:4], 3, lambda r: (r[0],))
+    assert result["items"] == rows[:3] and pagination.decode_cursor(result["next_cursor"], int) == (2,)
+    assert pagination.page(rows, None, lambda r: r)["next_cursor"] is None
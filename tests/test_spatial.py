@@ -0,0 +1,59 @@
+import random
+
+from app.services.spatial import GridIndex
+
+def overlay(i, x, y, w, h):
+    return {"id": i, "x": x, "y": y, "width": w, "height": h}
+
+def box(o):
+    x0, x1 = sorted((o["x"], o["x"] + o["width"]))
+    y0, y1 = sorted((o["y"], o["y"] + o["height"]))
+    return x0, y0, x1, y1
+
+def brute_at(overlays, x, y):
+    hits = [o for o in overlays if box(o)[0] <= x <= box(o)[2] and box(o)[1] <= y <= box(o)[3]]
+    return sorted(hits, key=lambda o: (box(o)[2] - box(o)[0]) * (box(o)[3] - box(o)[1]))
+
+def brute_within(overlays, x0, y0, x1, y1, contained):
+    if contained:
+        return [o for o in overlays if box(o)[0] >= x0 and box(o)[2] <= x1 and box(o)[1] >= y0 and box(o)[3] <= y1]
+    return [o for o in overlays if box(o)[0] <= x1 and box(o)[2] >= x0 and box(o)[1] <= y1 and box(o)[3] >= y0]
+
+def ids(overlays):
+    return [o["id"] for o in overlays]
+
+def test_seat_in_room_comes_first():
+    room, seat = overlay(1, 0, 0, 100, 100), overlay(2, 40, 40, 10, 10)
+    grid = GridIndex([room, seat])
+    assert ids(grid.at(45, 45)) == [2, 1]
+    assert ids(grid.at(100, 100)) == [1]        #edges are inside
+    assert grid.at(101, 50) == [] and grid.at(-500, 50) == []
+
+def test_empty_floor():
+    grid = GridIndex([])
+    assert grid.at(0, 0) == [] and grid.within(0, 0, 100, 100) == []
+
+def test_against_brute_force():
+    rng = random.Random(15)
+    for trial in range(30):
+        overlays = []
+        for i in range(rng.randrange(1, 300)):
+            if i % 50 == 0:
+                #a zone over a large part of the floor: skips the grid
+                overlays.append(overlay(i, rng.randrange(0, 500), rng.randrange(0, 500), rng.randrange(500, 2000), rng.randrange(500, 2000)))
+            else:
+                #rooms and seats, some drawn right-to-left / bottom-to-top
+                w, h = rng.randrange(5, 80) * rng.choice((1, -1)), rng.randrange(5, 80) * rng.choice((1, -1))
+                overlays.append(overlay(i, rng.randrange(0, 2000), rng.randrange(0, 2000), w, h))
+        grid = GridIndex(overlays)
+        #edges are inside: every corner finds its overlay, wherever the cell borders fall
+        for o in overlays:
+            x0, y0, x1, y1 = box(o)
+            for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1)):
+                assert o["id"] in ids(grid.at(x, y))
+        for _ in range(50):
+            x, y = rng.randrange(-100, 2200), rng.randrange(-100, 2200)
+            assert ids(grid.at(x, y)) == ids(brute_at(overlays, x, y))
+            x1, y1 = x + rng.randrange(0, rng.choice((50, 500, 3000))), y + rng.randrange(0, rng.choice((50, 500, 3000)))
+            for contained in (False, True):
+                assert ids(grid.within(x, y, x1, y1, contained)) == ids(brute_within(overlays, x, y, x1, y1, contained))
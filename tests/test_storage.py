@@ -0,0 +1,67 @@
+import io
+import os
+import hashlib
+import boto3
+import pytest
+import requests
+from moto import mock_aws
+
+from app.services import storage
+
+BUCKET = "floorplans-test"
+MiB = 1024 * 1024
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield storage.S3Storage(BUCKET, region="us-east-1", access_key_id="test", secret_access_key="test", part_size=5 * MiB)
+
+def keys(backend):
+    return sorted(o["Key"] for o in backend.client.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+def test_multipart_upload_lands_on_content_key(s3):
+    data = os.urandom(11 * MiB)     #three parts: 5 + 5 + 1 MiB
+    stored = s3.save_stream(io.BytesIO(data), ".png", limit=20 * MiB)
+
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert stored.path == f"uploads/{sha256}.png"
+    assert stored.sha256 == sha256 and stored.size == len(data)
+    assert s3.get_bytes(stored.path) == data
+    #the temp key is gone, only the content key is left
+    assert keys(s3) == [stored.path]
+
+def test_same_content_shares_one_object(s3):
+    first = s3.save_stream(io.BytesIO(b"drawing"), ".pdf", limit=MiB)
+    second = s3.save_stream(io.BytesIO(b"drawing"), ".pdf", limit=MiB)
+    assert first.path == second.path
+    assert keys(s3) == [first.path]
+
+def test_upload_over_limit_is_aborted(s3):
+    with pytest.raises(storage.UploadTooLarge):
+        s3.save_stream(io.BytesIO(os.urandom(7 * MiB)), ".png", limit=6 * MiB)
+    assert keys(s3) == []
+    assert s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+def test_empty_upload(s3):
+    stored = s3.save_stream(io.BytesIO(b""), ".png", limit=MiB)
+    assert stored.size == 0 and s3.get_bytes(stored.path) == b""
+
+def test_put_get_exists(s3):
+    assert not s3.exists("tiles/1/0/0_0.png")
+    s3.put_bytes("tiles/1/0/0_0.png", b"png", content_type="image/png")
+    assert s3.exists("tiles/1/0/0_0.png")
+    assert s3.get_bytes("tiles/1/0/0_0.png") == b"png"
+    assert s3.client.head_object(Bucket=BUCKET, Key="tiles/1/0/0_0.png")["ContentType"] == "image/png"
+
+def test_presigned_download(s3):
+    stored = s3.save_stream(io.BytesIO(b"floor plan bytes"), ".png", limit=MiB)
+    url = s3.download_url(stored.path)
+    assert stored.path in url and "Signature=" in url
+    r = requests.get(url)
+    assert r.status_code == 200 and r.content == b"floor plan bytes"
+
+def test_backends_implement_the_interface():
+    with pytest.raises(TypeError):
+        storage.StorageBackend()
+    assert storage.LocalStorage("/tmp").local_path("uploads/x.png") == os.path.join("/tmp", "uploads/x.png")
@@ -0,0 +1,56 @@
+from app import tablesmodel
+from app.services import versioning
+from app.services.overlay_diff import OVERLAY_FIELDS
+
+def add_floor(db, labels):
+    fp = tablesmodel.FloorPlan(name="versioning test", image_path="test.png", version=1)
+    db.add(fp)
+    db.flush()
+    overlays = [tablesmodel.Overlay(floor_plan_id=fp.id, type="room", label=label, capacity=4, x=10 * i, y=0, width=10, height=10, props={})
+                for i, label in enumerate(labels)]
+    db.add_all(overlays)
+    db.flush()
+    return fp, overlays
+
+def test_patch_after_legacy_checkpoint(db):
+    fp, (a, b, c) = add_floor(db, ["A", "B", "C"])
+    #written before overlays kept their ids: checkpoint overlays without "id"
+    legacy = [{f: getattr(o, f) for f in OVERLAY_FIELDS} for o in (a, b, c)]
+    db.add(tablesmodel.FloorPlanVersion(floor_plan_id=fp.id, version=1, is_checkpoint=True, changes={"overlays": legacy}))
+    db.flush()
+
+    #the first save after the upgrade: B renamed, C removed, D added
+    b.label = "B2"
+    db.delete(c)
+    d = tablesmodel.Overlay(floor_plan_id=fp.id, type="seat", label="D", x=50, y=50, width=5, height=5, props={})
+    db.add(d)
+    db.flush()
+    fp.version = 2
+    entry = versioning.record_version(db, fp.id, 2, [versioning.overlay_to_version_dict(d)], [versioning.overlay_to_version_dict(b)], [c.id],
+                                      lambda: versioning.load_snapshot(db, fp.id))
+    db.flush()
+
+    assert entry.is_checkpoint
+    assert versioning.rebuild(db, fp.id, 2) == versioning.load_snapshot(db, fp.id)
+    assert [o["label"] for o in versioning.rebuild(db, fp.id, 1)] == ["A", "B", "C"]
+
+    #and the version after that is a patch again, on the new checkpoint
+    a.label = "A2"
+    db.flush()
+    fp.version = 3
+    entry = versioning.record_version(db, fp.id, 3, [], [versioning.overlay_to_version_dict(a)], [], lambda: versioning.load_snapshot(db, fp.id))
+    db.flush()
+    assert not entry.is_checkpoint
+    assert [o["label"] for o in versioning.rebuild(db, fp.id, 3)] == ["A2", "B2", "D"]
+
+def test_patches_between_checkpoints(db):
+    fp, (a, b) = add_floor(db, ["A", "B"])
+    versioning.record_version(db, fp.id, 1, [], [], [], lambda: versioning.load_snapshot(db, fp.id))
+    db.flush()
+    db.delete(a)
+    db.flush()
+    fp.version = 2
+    entry = versioning.record_version(db, fp.id, 2, [], [], [a.id], lambda: versioning.load_snapshot(db, fp.id))
+    db.flush()
+    assert not entry.is_checkpoint
+    assert versioning.rebuild(db, fp.id, 2) == versioning.load_snapshot(db, fp.id)